@@ -1,83 +1,115 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from typing import Dict, Any, Optional, List
+import re
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, List, Iterator, Callable, ContextManager
 import logging
 
-class LMStudioClient:
-    """Client để kết nối với LM Studio local server"""
+from llm_cache import CompletionCache
+from llm_scheduler import LLMScheduler, PRIORITY_SCRIPT, current_context
+
+# Đánh dấu event kết thúc stream SSE
+SSE_DONE = object()
+
+# Text client trả về thay cho kết quả khi request lỗi ("Error: 503", "Connection error: ...")
+ERROR_RESPONSE_PATTERN = re.compile(r'^(Error: \d+|Connection error: .*)$', re.DOTALL)
+
+# Số giây dùng lại model đang load đã hỏi từ /models trước khi hỏi lại
+ACTIVE_MODEL_TTL = 30
+
+def is_error_response(text: str) -> bool:
+    """Text là thông báo lỗi của client chứ không phải nội dung model sinh ra"""
+    return bool(ERROR_RESPONSE_PATTERN.match(text.strip()))
+
+class BaseLMStudioClient:
+    """Phần dùng chung của client đồng bộ và bất đồng bộ: payload, prompt, cache"""
     
-    def __init__(self, base_url: str = "http://localhost:1234/v1"):
+    def __init__(self, base_url: str = "http://localhost:1234/v1",
+                 cache: Optional[CompletionCache] = None, model: Optional[str] = None):
         self.base_url = base_url
-        self.session = requests.Session()
+        self.model = model
+        
+        # Model LM Studio đang load (khi không chỉ định model), hỏi lại sau ACTIVE_MODEL_TTL giây
+        self._active_model: Optional[str] = None
+        self._active_model_checked_at = 0.0
+        
+        # Cache kết quả trên đĩa, dùng chung cho mọi lời gọi (None = tắt cache)
+        self.cache = cache
         self.logger = logging.getLogger(__name__)
+    
+    def _build_completion_payload(self, prompt: str, stream: bool, **kwargs) -> Dict[str, Any]:
+        """Tạo payload cho endpoint /completions"""
+        return {
+            "prompt": prompt,
+            "max_tokens": kwargs.get("max_tokens", 1000),
+            "temperature": kwargs.get("temperature", 0.7),
+            "top_p": kwargs.get("top_p", 0.9),
+            "stop": kwargs.get("stop", []),
+            "stream": stream,
+            **self._model_field()
+        }
+    
+    def _build_chat_payload(self, messages: List[Dict[str, str]], stream: bool, **kwargs) -> Dict[str, Any]:
+        """Tạo payload cho endpoint /chat/completions"""
+        return {
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1000),
+            "temperature": kwargs.get("temperature", 0.7),
+            "stream": stream,
+            **self._model_field()
+        }
+    
+    def _model_field(self) -> Dict[str, str]:
+        """Trường model cho payload, bỏ trống để LM Studio dùng model đang load"""
+        return {"model": self.model} if self.model else {}
+    
+    def _active_model_stale(self) -> bool:
+        """Cần hỏi lại /models để biết model đang load"""
+        return not self.model and time.time() - self._active_model_checked_at > ACTIVE_MODEL_TTL
+    
+    def _update_active_model(self, models: Optional[Dict[str, Any]]):
+        """Ghi nhận model đang load từ response /models (None nếu không hỏi được)"""
+        data = (models or {}).get("data") or []
+        self._active_model = data[0].get("id") if data and isinstance(data[0], dict) else None
+        self._active_model_checked_at = time.time()
+    
+    def _cache_key(self, endpoint: str, payload: Dict[str, Any], **kwargs) -> Optional[str]:
+        """Key cache cho request, None nếu cache tắt, caller truyền use_cache=False
+        hoặc không biết model nào sẽ trả lời (kết quả của model khác không được dùng lại)
+        """
+        if self.cache is None or not kwargs.get("use_cache", True):
+            return None
         
-    def check_connection(self) -> bool:
-        """Kiểm tra kết nối đến LM Studio"""
-        try:
-            response = self.session.get(f"{self.base_url}/models", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+        model = self.model or self._active_model
+        if not model:
+            return None
+        return self.cache.make_key(f"{self.base_url}{endpoint}", payload, model=model)
     
-    def generate_text(self, prompt: str, **kwargs) -> str:
-        """Generate text từ prompt"""
-        try:
-            payload = {
-                "prompt": prompt,
-                "max_tokens": kwargs.get("max_tokens", 1000),
-                "temperature": kwargs.get("temperature", 0.7),
-                "top_p": kwargs.get("top_p", 0.9),
-                "stop": kwargs.get("stop", []),
-                "stream": False
-            }
-            
-            response = self.session.post(
-                f"{self.base_url}/completions",
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("choices", [{}])[0].get("text", "").strip()
-            else:
-                self.logger.error(f"LM Studio error: {response.text}")
-                return f"Error: {response.status_code}"
-                
-        except Exception as e:
-            self.logger.error(f"Connection error: {str(e)}")
-            return f"Connection error: {str(e)}"
+    def _cache_store(self, cache_key: Optional[str], text: str):
+        """Lưu kết quả thành công vào cache"""
+        if cache_key and text:
+            self.cache.set(cache_key, text)
     
-    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        """Chat completion với LM Studio"""
+    def _parse_sse_line(self, line: str) -> Optional[Any]:
+        """Đọc một dòng SSE: trả về event (dict), SSE_DONE, hoặc None nếu bỏ qua"""
+        if not line or not line.startswith("data:"):
+            return None
+        
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return SSE_DONE
+        
         try:
-            payload = {
-                "messages": messages,
-                "max_tokens": kwargs.get("max_tokens", 1000),
-                "temperature": kwargs.get("temperature", 0.7),
-                "stream": False
-            }
-            
-            response = self.session.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            else:
-                self.logger.error(f"LM Studio error: {response.text}")
-                return f"Error: {response.status_code}"
-                
-        except Exception as e:
-            self.logger.error(f"Connection error: {str(e)}")
-            return f"Connection error: {str(e)}"
+            return json.loads(data)
+        except ValueError:
+            self.logger.warning(f"Invalid stream event: {data[:100]}")
+            return None
     
-    def edit_story_text(self, text: str, instruction: str) -> str:
-        """Chỉnh sửa văn bản theo instruction"""
-        prompt = f"""Hãy chỉnh sửa văn bản sau theo yêu cầu:
+    def _build_edit_text_prompt(self, text: str, instruction: str) -> str:
+        """Tạo prompt chỉnh sửa văn bản theo instruction"""
+        return f"""Hãy chỉnh sửa văn bản sau theo yêu cầu:
 
 VĂN BẢN GỐC:
 {text}
@@ -86,11 +118,10 @@ YÊU CẦU CHỈNH SỬA:
 {instruction}
 
 VĂN BẢN ĐÃ CHỈNH SỬA:"""
-        
-        return self.generate_text(prompt, max_tokens=2000)
     
-    def translate_text(self, text: str, source_lang: str, target_lang: str, style: str = "modern") -> str:
-        """Dịch văn bản với văn phong chỉ định"""
+    def _build_translate_prompt(self, text: str, source_lang: str, target_lang: str,
+                                style: str, numbered: bool) -> str:
+        """Tạo prompt dịch văn bản"""
         style_map = {
             "hiện đại": "văn phong hiện đại, tự nhiên",
             "cổ đại": "văn phong cổ điển, trang trọng",
@@ -101,16 +132,19 @@ VĂN BẢN ĐÃ CHỈNH SỬA:"""
         
         style_desc = style_map.get(style, "văn phong tự nhiên")
         
-        prompt = f"""Hãy dịch văn bản sau từ {source_lang} sang {target_lang} với {style_desc}:
-
+        rules = ""
+        if numbered:
+            rules = ("\nGiữ nguyên số thứ tự ở đầu mỗi dòng. Mỗi dòng dịch thành đúng một dòng, "
+                     "không gộp hay tách dòng, không thêm giải thích.\n")
+        
+        return f"""Hãy dịch văn bản sau từ {source_lang} sang {target_lang} với {style_desc}:
+{rules}
 {text}
 
 Bản dịch:"""
-        
-        return self.generate_text(prompt)
     
-    def generate_image_script(self, story: str, num_scenes: int, style: str, detail_level: str) -> str:
-        """Tạo kịch bản ảnh từ truyện"""
+    def _build_image_script_prompt(self, story: str, num_scenes: int, style: str, detail_level: str) -> str:
+        """Tạo prompt cho kịch bản ảnh"""
         detail_map = {
             "cơ bản": "mô tả ngắn gọn",
             "chi tiết": "mô tả chi tiết",
@@ -119,7 +153,7 @@ Bản dịch:"""
         
         detail_desc = detail_map.get(detail_level, "mô tả chi tiết")
         
-        prompt = f"""Hãy tạo kịch bản ảnh từ câu chuyện sau:
+        return f"""Hãy tạo kịch bản ảnh từ câu chuyện sau:
 
 CÂU CHUYỆN:
 {story}
@@ -128,13 +162,231 @@ YÊU CẦU:
 - Tạo {num_scenes} cảnh quan trọng
 - Phong cách: {style}
 - Mức độ: {detail_desc}
-- Mỗi cảnh bao gồm:
-  1. Tên cảnh
-  2. Mô tả cảnh
-  3. Các nhân vật
-  4. Bối cảnh
-  5. Prompt cho AI tạo ảnh
+- Viết đúng định dạng sau cho từng cảnh, mỗi trường một dòng, không thêm nội dung khác:
+
+Cảnh <số thứ tự>
+Tên cảnh: <tên cảnh>
+Mô tả: <mô tả cảnh>
+Nhân vật: <tên các nhân vật, cách nhau bởi dấu phẩy>
+Bối cảnh: <bối cảnh>
+Prompt: <prompt tiếng Anh cho AI tạo ảnh, phong cách {style}>
 
 KỊCH BẢN ẢNH:"""
+
+class LMStudioClient(BaseLMStudioClient):
+    """Client để kết nối với LM Studio local server"""
+    
+    def __init__(self, base_url: str = "http://localhost:1234/v1", pool_size: int = 10,
+                 cache: Optional[CompletionCache] = None, model: Optional[str] = None,
+                 scheduler: Optional[LLMScheduler] = None):
+        super().__init__(base_url, cache=cache, model=model)
+        self.session = requests.Session()
+        
+        # Mọi request (trừ cache hit) phải chờ slot của scheduler, None = không giới hạn
+        self.scheduler = scheduler
+        
+        # Connection pool đủ lớn cho các request song song (dịch SRT nhiều luồng)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+    def check_connection(self) -> bool:
+        """Kiểm tra kết nối đến LM Studio"""
+        try:
+            response = self.session.get(f"{self.base_url}/models", timeout=5)
+            return response.status_code == 200
+        except:
+            return False
+    
+    def _cache_key(self, endpoint: str, payload: Dict[str, Any], **kwargs) -> Optional[str]:
+        """Key cache cho request, hỏi /models để biết model đang load khi không chỉ định model"""
+        if self.cache is not None and kwargs.get("use_cache", True) and self._active_model_stale():
+            self._refresh_active_model()
+        return super()._cache_key(endpoint, payload, **kwargs)
+    
+    def _refresh_active_model(self):
+        """Hỏi LM Studio model đang load"""
+        try:
+            response = self.session.get(f"{self.base_url}/models", timeout=5)
+            self._update_active_model(response.json() if response.status_code == 200 else None)
+        except Exception as e:
+            self.logger.warning(f"Could not query active model: {str(e)}")
+            self._update_active_model(None)
+    
+    def _slot(self, **kwargs) -> ContextManager:
+        """Slot của scheduler cho một request
+        
+        Loại ưu tiên/job lấy từ tham số priority/job, nếu không có thì từ request_context
+        của thread gọi hàm.
+        """
+        if self.scheduler is None:
+            return nullcontext()
+        
+        priority, job = current_context()
+        return self.scheduler.slot(kwargs.get("priority") or priority, kwargs.get("job") or job)
+    
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        """Generate text từ prompt"""
+        try:
+            payload = self._build_completion_payload(prompt, stream=False, **kwargs)
+            
+            cache_key = self._cache_key("/completions", payload, **kwargs)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            with self._slot(**kwargs):
+                response = self.session.post(
+                    f"{self.base_url}/completions",
+                    json=payload,
+                    timeout=60
+                )
+            
+            if response.status_code == 200:
+                result = response.json()
+                text = result.get("choices", [{}])[0].get("text", "").strip()
+                self._cache_store(cache_key, text)
+                return text
+            else:
+                self.logger.error(f"LM Studio error: {response.text}")
+                return f"Error: {response.status_code}"
+                
+        except Exception as e:
+            self.logger.error(f"Connection error: {str(e)}")
+            return f"Connection error: {str(e)}"
+    
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Chat completion với LM Studio"""
+        try:
+            payload = self._build_chat_payload(messages, stream=False, **kwargs)
+            
+            cache_key = self._cache_key("/chat/completions", payload, **kwargs)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            with self._slot(**kwargs):
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions",
+                    json=payload,
+                    timeout=60
+                )
+            
+            if response.status_code == 200:
+                result = response.json()
+                content = result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+                self._cache_store(cache_key, content)
+                return content
+            else:
+                self.logger.error(f"LM Studio error: {response.text}")
+                return f"Error: {response.status_code}"
+                
+        except Exception as e:
+            self.logger.error(f"Connection error: {str(e)}")
+            return f"Connection error: {str(e)}"
+    
+    def stream_text(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Generate text dạng stream, trả về từng đoạn text ngay khi server sinh ra"""
+        payload = self._build_completion_payload(prompt, stream=True, **kwargs)
+        
+        return self._stream_deltas(
+            "/completions",
+            payload,
+            lambda choice: choice.get("text"),
+            self._cache_key("/completions", payload, **kwargs),
+            self._slot(**kwargs)
+        )
+    
+    def stream_chat(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """Chat completion dạng stream, trả về từng delta của message"""
+        payload = self._build_chat_payload(messages, stream=True, **kwargs)
+        
+        return self._stream_deltas(
+            "/chat/completions",
+            payload,
+            lambda choice: choice.get("delta", {}).get("content"),
+            self._cache_key("/chat/completions", payload, **kwargs),
+            self._slot(**kwargs)
+        )
+    
+    def _stream_deltas(self, endpoint: str, payload: Dict[str, Any],
+                       extract: Callable[[Dict[str, Any]], Optional[str]],
+                       cache_key: Optional[str] = None,
+                       slot: Optional[ContextManager] = None) -> Iterator[str]:
+        """Đọc response SSE và trả về phần text mới của mỗi event
+        
+        slot được giữ suốt thời gian stream vì server vẫn bận sinh text.
+        Lỗi HTTP/kết nối được raise (RuntimeError, nội dung như chuỗi lỗi của
+        generate_text) thay vì trả về như một đoạn text. Chỉ kết quả nhận đủ tới
+        event [DONE] mới được lưu cache.
+        """
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
         
-        return self.generate_text(prompt, max_tokens=3000)
+        parts = []
+        completed = False
+        
+        try:
+            # Timeout (connect, read): read timeout áp dụng cho từng chunk, không phải toàn bộ response
+            with slot or nullcontext(), \
+                    self.session.post(f"{self.base_url}{endpoint}", json=payload,
+                                      stream=True, timeout=(10, 60)) as response:
+                if response.status_code != 200:
+                    self.logger.error(f"LM Studio error: {response.text}")
+                    raise RuntimeError(f"Error: {response.status_code}")
+                
+                # SSE luôn là UTF-8, requests mặc định ISO-8859-1 cho text/event-stream
+                response.encoding = "utf-8"
+                
+                for line in response.iter_lines(decode_unicode=True):
+                    event = self._parse_sse_line(line)
+                    if event is None:
+                        continue
+                    if event is SSE_DONE:
+                        completed = True
+                        break
+                    
+                    choices = event.get("choices") or [{}]
+                    delta = extract(choices[0])
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        
+        except requests.RequestException as e:
+            self.logger.error(f"Connection error: {str(e)}")
+            raise RuntimeError(f"Connection error: {str(e)}") from e
+        
+        # Kết nối đóng trước [DONE]: kết quả bị cắt, không lưu cache
+        if completed:
+            self._cache_store(cache_key, "".join(parts).strip())
+        else:
+            self.logger.warning(f"Stream from {endpoint} ended before [DONE], result not cached")
+    
+    def edit_story_text(self, text: str, instruction: str) -> str:
+        """Chỉnh sửa văn bản theo instruction"""
+        prompt = self._build_edit_text_prompt(text, instruction)
+        return self.generate_text(prompt, max_tokens=2000)
+    
+    def translate_text(self, text: str, source_lang: str, target_lang: str, style: str = "modern",
+                       max_tokens: int = 1000, numbered: bool = False, use_cache: bool = True) -> str:
+        """Dịch văn bản với văn phong chỉ định
+        
+        numbered: văn bản gồm các dòng đánh số, yêu cầu model giữ nguyên số và số dòng
+        """
+        prompt = self._build_translate_prompt(text, source_lang, target_lang, style, numbered)
+        return self.generate_text(prompt, max_tokens=max_tokens, use_cache=use_cache)
+    
+    def generate_image_script(self, story: str, num_scenes: int, style: str, detail_level: str) -> str:
+        """Tạo kịch bản ảnh từ truyện"""
+        prompt = self._build_image_script_prompt(story, num_scenes, style, detail_level)
+        return self.generate_text(prompt, max_tokens=3000, priority=PRIORITY_SCRIPT)
+    
+    def stream_image_script(self, story: str, num_scenes: int, style: str, detail_level: str) -> Iterator[str]:
+        """Tạo kịch bản ảnh dạng stream"""
+        prompt = self._build_image_script_prompt(story, num_scenes, style, detail_level)
+        return self.stream_text(prompt, max_tokens=3000, priority=PRIORITY_SCRIPT)
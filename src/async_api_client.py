@@ -0,0 +1,263 @@
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator, Callable
+
+from api_client import BaseLMStudioClient, SSE_DONE
+from llm_cache import CompletionCache
+from llm_scheduler import LLMScheduler, current_context
+
+class AsyncLMStudioClient(BaseLMStudioClient):
+    """Client bất đồng bộ (asyncio) cho LM Studio, dùng chung connection pool
+
+    Cùng bộ hàm với LMStudioClient nhưng là coroutine, để chạy hàng chục request
+    đồng thời trong một event loop thay vì mỗi request một thread.
+    Hủy task (task.cancel()) sẽ đóng request đang chạy. Request chờ slot của
+    scheduler (dùng chung với LMStudioClient) và đọc/ghi cache trên thread khác
+    để không chặn event loop.
+    """
+    
+    def __init__(self, base_url: str = "http://localhost:1234/v1",
+                 max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, timeout: float = 60.0, http2: bool = False,
+                 cache: Optional[CompletionCache] = None, model: Optional[str] = None,
+                 scheduler: Optional[LLMScheduler] = None):
+        super().__init__(base_url, cache=cache, model=model)
+        self.timeout = timeout
+        
+        # Mọi request (trừ cache hit) phải chờ slot của scheduler, None = không giới hạn
+        self.scheduler = scheduler
+        
+        # http2=True cần gói h2 (pip install "httpx[http2]")
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            http2=http2
+        )
+    
+    async def __aenter__(self) -> 'AsyncLMStudioClient':
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def aclose(self):
+        """Đóng connection pool"""
+        await self.client.aclose()
+    
+    def _request_timeout(self, **kwargs) -> httpx.Timeout:
+        """Timeout cho từng request, mặc định lấy theo client"""
+        return httpx.Timeout(kwargs.get("timeout", self.timeout), connect=10.0)
+    
+    @asynccontextmanager
+    async def _slot(self, **kwargs) -> AsyncIterator[None]:
+        """Slot của scheduler cho một request, chờ trên thread khác để không chặn event loop
+        
+        Loại ưu tiên/job lấy từ tham số priority/job, nếu không có thì từ request_context.
+        """
+        if self.scheduler is None:
+            yield
+            return
+        
+        priority, job = current_context()
+        acquiring = asyncio.ensure_future(asyncio.to_thread(
+            self.scheduler.acquire, kwargs.get("priority") or priority, kwargs.get("job") or job
+        ))
+        
+        try:
+            ticket = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # Task bị hủy khi đang chờ: trả slot ngay khi thread chờ nhận được
+            acquiring.add_done_callback(
+                lambda future: self.scheduler.release(future.result())
+                if not future.cancelled() and future.exception() is None else None
+            )
+            raise
+        
+        try:
+            yield
+        finally:
+            self.scheduler.release(ticket)
+    
+    async def _cache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        """Đọc cache (SQLite) trên thread khác"""
+        if not cache_key:
+            return None
+        return await asyncio.to_thread(self.cache.get, cache_key)
+    
+    async def _cache_store_async(self, cache_key: Optional[str], text: str):
+        """Lưu kết quả vào cache (SQLite) trên thread khác"""
+        if cache_key and text:
+            await asyncio.to_thread(self._cache_store, cache_key, text)
+    
+    async def check_connection(self) -> bool:
+        """Kiểm tra kết nối đến LM Studio"""
+        try:
+            response = await self.client.get(f"{self.base_url}/models", timeout=5)
+            return response.status_code == 200
+        except Exception:
+            return False
+    
+    async def _refresh_active_model(self):
+        """Hỏi LM Studio model đang load khi không chỉ định model (dùng cho key cache)"""
+        if self.cache is None or not self._active_model_stale():
+            return
+        
+        try:
+            response = await self.client.get(f"{self.base_url}/models", timeout=5)
+            self._update_active_model(response.json() if response.status_code == 200 else None)
+        except Exception as e:
+            self.logger.warning(f"Could not query active model: {str(e)}")
+            self._update_active_model(None)
+    
+    async def generate_text(self, prompt: str, **kwargs) -> str:
+        """Generate text từ prompt"""
+        payload = self._build_completion_payload(prompt, stream=False, **kwargs)
+        result = await self._post_json("/completions", payload, **kwargs)
+        
+        if isinstance(result, str):
+            return result
+        
+        text = result.get("choices", [{}])[0].get("text", "").strip()
+        await self._cache_store_async(self._cache_key("/completions", payload, **kwargs), text)
+        return text
+    
+    async def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Chat completion với LM Studio"""
+        payload = self._build_chat_payload(messages, stream=False, **kwargs)
+        result = await self._post_json("/chat/completions", payload, **kwargs)
+        
+        if isinstance(result, str):
+            return result
+        
+        content = result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        await self._cache_store_async(self._cache_key("/chat/completions", payload, **kwargs), content)
+        return content
+    
+    async def _post_json(self, endpoint: str, payload: Dict[str, Any], **kwargs):
+        """Gửi request không stream
+
+        Trả về text từ cache (str), response JSON (dict), hoặc chuỗi lỗi (str)
+        giống cách LMStudioClient báo lỗi.
+        """
+        await self._refresh_active_model()
+        cache_key = self._cache_key(endpoint, payload, **kwargs)
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            async with self._slot(**kwargs):
+                response = await self.client.post(
+                    f"{self.base_url}{endpoint}",
+                    json=payload,
+                    timeout=self._request_timeout(**kwargs)
+                )
+            
+            if response.status_code == 200:
+                return response.json()
+            
+            self.logger.error(f"LM Studio error: {response.text}")
+            return f"Error: {response.status_code}"
+        
+        except Exception as e:
+            self.logger.error(f"Connection error: {str(e)}")
+            return f"Connection error: {str(e)}"
+    
+    def stream_text(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Generate text dạng stream (async for)"""
+        payload = self._build_completion_payload(prompt, stream=True, **kwargs)
+        
+        return self._stream_deltas(
+            "/completions",
+            payload,
+            lambda choice: choice.get("text"),
+            **kwargs
+        )
+    
+    def stream_chat(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """Chat completion dạng stream (async for)"""
+        payload = self._build_chat_payload(messages, stream=True, **kwargs)
+        
+        return self._stream_deltas(
+            "/chat/completions",
+            payload,
+            lambda choice: choice.get("delta", {}).get("content"),
+            **kwargs
+        )
+    
+    async def _stream_deltas(self, endpoint: str, payload: Dict[str, Any],
+                             extract: Callable[[Dict[str, Any]], Optional[str]],
+                             **kwargs) -> AsyncIterator[str]:
+        """Đọc response SSE và trả về phần text mới của mỗi event
+        
+        Giống LMStudioClient: lỗi HTTP/kết nối được raise (RuntimeError), chỉ kết quả
+        nhận đủ tới event [DONE] mới được lưu cache.
+        """
+        await self._refresh_active_model()
+        cache_key = self._cache_key(endpoint, payload, **kwargs)
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        completed = False
+        
+        try:
+            async with self._slot(**kwargs), \
+                    self.client.stream("POST", f"{self.base_url}{endpoint}", json=payload,
+                                       timeout=self._request_timeout(**kwargs)) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    self.logger.error(f"LM Studio error: {body.decode('utf-8', 'replace')}")
+                    raise RuntimeError(f"Error: {response.status_code}")
+                
+                async for line in response.aiter_lines():
+                    event = self._parse_sse_line(line)
+                    if event is None:
+                        continue
+                    if event is SSE_DONE:
+                        completed = True
+                        break
+                    
+                    choices = event.get("choices") or [{}]
+                    delta = extract(choices[0])
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        
+        except httpx.HTTPError as e:
+            self.logger.error(f"Connection error: {str(e)}")
+            raise RuntimeError(f"Connection error: {str(e)}") from e
+        
+        # Kết nối đóng trước [DONE]: kết quả bị cắt, không lưu cache
+        if completed:
+            await self._cache_store_async(cache_key, "".join(parts).strip())
+        else:
+            self.logger.warning(f"Stream from {endpoint} ended before [DONE], result not cached")
+    
+    async def edit_story_text(self, text: str, instruction: str) -> str:
+        """Chỉnh sửa văn bản theo instruction"""
+        prompt = self._build_edit_text_prompt(text, instruction)
+        return await self.generate_text(prompt, max_tokens=2000)
+    
+    async def translate_text(self, text: str, source_lang: str, target_lang: str, style: str = "modern",
+                             max_tokens: int = 1000, numbered: bool = False, use_cache: bool = True) -> str:
+        """Dịch văn bản với văn phong chỉ định"""
+        prompt = self._build_translate_prompt(text, source_lang, target_lang, style, numbered)
+        return await self.generate_text(prompt, max_tokens=max_tokens, use_cache=use_cache)
+    
+    async def generate_image_script(self, story: str, num_scenes: int, style: str, detail_level: str) -> str:
+        """Tạo kịch bản ảnh từ truyện"""
+        prompt = self._build_image_script_prompt(story, num_scenes, style, detail_level)
+        return await self.generate_text(prompt, max_tokens=3000)
+    
+    def stream_image_script(self, story: str, num_scenes: int, style: str, detail_level: str) -> AsyncIterator[str]:
+        """Tạo kịch bản ảnh dạng stream"""
+        prompt = self._build_image_script_prompt(story, num_scenes, style, detail_level)
+        return self.stream_text(prompt, max_tokens=3000)
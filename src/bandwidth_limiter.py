@@ -0,0 +1,53 @@
+import threading
+import time
+from typing import Dict, Any, Callable
+
+# Số giây băng thông chưa dùng được cộng dồn (cho phép tải nhanh một đoạn ngắn sau khi nghỉ)
+DEFAULT_BURST_SECONDS = 1.0
+
+class BandwidthLimiter:
+    """Giới hạn băng thông chung cho mọi video đang tải
+
+    Mỗi video gắn một progress hook (hook()) báo số byte vừa tải; hook chờ khi
+    tổng tốc độ vượt rate. Một video đang tải thì được dùng cả giới hạn, nhiều
+    video thì tự chia nhau theo tốc độ thực tế.
+    """
+    
+    def __init__(self, rate: int, burst_seconds: float = DEFAULT_BURST_SECONDS):
+        self.rate = max(1, int(rate))
+        self.burst_seconds = burst_seconds
+        
+        # Thời điểm lượng byte đã tải được "trả hết" theo rate
+        self._available_at = 0.0
+        self._lock = threading.Lock()
+    
+    def consume(self, num_bytes: int):
+        """Ghi nhận num_bytes vừa tải, chờ nếu đang vượt giới hạn (gọi từ thread tải)"""
+        if num_bytes <= 0:
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._available_at, now - self.burst_seconds)
+            self._available_at = start + num_bytes / self.rate
+            wait = self._available_at - now
+        
+        if wait > 0:
+            time.sleep(wait)
+    
+    def hook(self) -> Callable[[Dict[str, Any]], None]:
+        """Progress hook cho một lần tải (ydl_opts['progress_hooks'])"""
+        downloaded: Dict[str, int] = {}
+        
+        def progress_hook(d: Dict[str, Any]):
+            if d.get('status') != 'downloading':
+                return
+            
+            # downloaded_bytes là số byte cộng dồn của từng file
+            filename = d.get('filename') or ''
+            current = d.get('downloaded_bytes') or 0
+            delta = current - downloaded.get(filename, 0)
+            downloaded[filename] = current
+            self.consume(delta)
+        
+        return progress_hook
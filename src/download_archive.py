@@ -0,0 +1,214 @@
+import sqlite3
+import hashlib
+import glob
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+import logging
+
+from subtitle_formats import SUBTITLE_EXTENSIONS
+
+# Kích thước mỗi lần đọc khi tính checksum file video
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+def file_sha256(file_path: str) -> str:
+    """Checksum SHA-256 của file, đọc theo từng phần"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_into(file_path: str, output_dir: str) -> str:
+    """Đặt file (và phụ đề đi kèm "<tên>.<ngôn ngữ>.<đuôi>") vào output_dir
+    
+    Dùng hard link nếu cùng ổ đĩa, ngược lại copy. Trả về đường dẫn trong output_dir.
+    """
+    source = Path(file_path)
+    target_dir = Path(output_dir)
+    if source.parent.resolve() == target_dir.resolve():
+        return str(source)
+    
+    target_dir.mkdir(parents=True, exist_ok=True)
+    sidecars = [
+        Path(path) for path in glob.glob(glob.escape(str(source.with_suffix(''))) + '.*.*')
+        if os.path.splitext(path)[1].lower() in SUBTITLE_EXTENSIONS
+    ]
+    
+    for path in [source, *sidecars]:
+        target = target_dir / path.name
+        if target.exists() and target.stat().st_size == path.stat().st_size:
+            continue
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+    
+    return str(target_dir / source.name)
+
+class DownloadArchive:
+    """Lưu các video đã tải (theo extractor + video ID + kiểu tải) để không tải lại
+
+    Kiểu tải (variant) phân biệt các bản khác nhau của cùng video: chỉ audio,
+    chất lượng và định dạng. Mỗi bản ghi gồm đường dẫn file, dung lượng và
+    checksum. Bản ghi có file đã bị xóa/di chuyển được coi như chưa tải. Bật
+    dedup để xóa file mới tải trùng nội dung với file đã có.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, enabled: bool = True, dedup: bool = True):
+        self.logger = logging.getLogger(__name__)
+        
+        if db_path is None:
+            db_path = str(Path(__file__).parent.parent / 'cache' / 'download_archive.sqlite')
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.db_path = db_path
+        self.enabled = enabled
+        self.dedup = dedup
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        
+        # Archive cũ không có cột variant nên không biết bản ghi là kiểu tải nào
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(downloads)")]
+        if columns and 'variant' not in columns:
+            self.logger.info("Download archive has no variant column, starting a new archive")
+            self._conn.execute("DROP TABLE downloads")
+        
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                extractor TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                url TEXT,
+                file_path TEXT NOT NULL,
+                size INTEGER,
+                sha256 TEXT,
+                downloaded_at REAL NOT NULL,
+                PRIMARY KEY (extractor, video_id, variant)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sha256 ON downloads (sha256)")
+        self._conn.commit()
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'DownloadArchive':
+        """Tạo archive từ mục "download_archive" trong config.json"""
+        archive_config = config.get('download_archive', {})
+        
+        return cls(
+            db_path=archive_config.get('path'),
+            enabled=archive_config.get('enabled', True),
+            dedup=archive_config.get('dedup', True)
+        )
+    
+    def _row_to_record(self, row) -> Dict[str, Any]:
+        """Chuyển một dòng SQLite thành dict"""
+        keys = ('extractor', 'video_id', 'variant', 'url', 'file_path', 'size', 'sha256', 'downloaded_at')
+        return dict(zip(keys, row))
+    
+    def _existing(self, row) -> Optional[Dict[str, Any]]:
+        """Bản ghi nếu file vẫn còn đúng dung lượng, ngược lại xóa bản ghi (gọi khi đang giữ lock)"""
+        if row is None:
+            return None
+        
+        record = self._row_to_record(row)
+        path = Path(record['file_path'])
+        
+        if path.is_file() and (record['size'] is None or path.stat().st_size == record['size']):
+            return record
+        
+        self._conn.execute(
+            "DELETE FROM downloads WHERE extractor = ? AND video_id = ? AND variant = ?",
+            (record['extractor'], record['video_id'], record['variant'])
+        )
+        self._conn.commit()
+        return None
+    
+    def find(self, extractor: str, video_id: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Tìm video đã tải theo extractor + ID + kiểu tải"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM downloads WHERE extractor = ? AND video_id = ? AND variant = ?",
+                (extractor.lower(), str(video_id), variant)
+            ).fetchone()
+            return self._existing(row)
+    
+    def find_by_hash(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Tìm file đã tải có cùng nội dung"""
+        if not self.enabled or not sha256:
+            return None
+        
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM downloads WHERE sha256 = ?", (sha256,)).fetchall()
+            for row in rows:
+                record = self._existing(row)
+                if record is not None:
+                    return record
+        return None
+    
+    def add(self, extractor: str, video_id: str, variant: str, url: str, file_path: str,
+            force: bool = False) -> Dict[str, Any]:
+        """Ghi nhận video vừa tải xong (video_id là ID yt-dlp extract được)
+        
+        Nếu bật dedup và đã có file cùng nội dung ở chỗ khác, file mới bị xóa và
+        bản ghi trỏ tới file cũ. force=True (người dùng yêu cầu tải lại) giữ file mới.
+        """
+        path = Path(file_path)
+        size = path.stat().st_size if path.is_file() else None
+        sha256 = file_sha256(file_path) if size is not None else None
+        
+        if self.dedup and not force:
+            duplicate = self.find_by_hash(sha256)
+            if duplicate is not None and Path(duplicate['file_path']) != path:
+                self.logger.info(f"Removed duplicate {path.name}, same content as {duplicate['file_path']}")
+                path.unlink()
+                path = Path(duplicate['file_path'])
+        
+        record = {
+            'extractor': extractor.lower(),
+            'video_id': str(video_id),
+            'variant': variant,
+            'url': url,
+            'file_path': str(path),
+            'size': size,
+            'sha256': sha256,
+            'downloaded_at': time.time()
+        }
+        
+        if not self.enabled:
+            return record
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads "
+                "(extractor, video_id, variant, url, file_path, size, sha256, downloaded_at) "
+                "VALUES (:extractor, :video_id, :variant, :url, :file_path, :size, :sha256, :downloaded_at)",
+                record
+            )
+            self._conn.commit()
+        
+        return record
+    
+    def remove(self, extractor: str, video_id: str, variant: Optional[str] = None):
+        """Xóa một video (mọi kiểu tải nếu variant là None) khỏi archive để có thể tải lại"""
+        with self._lock:
+            if variant is None:
+                self._conn.execute(
+                    "DELETE FROM downloads WHERE extractor = ? AND video_id = ?",
+                    (extractor.lower(), str(video_id))
+                )
+            else:
+                self._conn.execute(
+                    "DELETE FROM downloads WHERE extractor = ? AND video_id = ? AND variant = ?",
+                    (extractor.lower(), str(video_id), variant)
+                )
+            self._conn.commit()
@@ -0,0 +1,329 @@
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import logging
+
+from video_downloader import VideoDownloader, parse_rate
+from download_progress import ProgressEvent
+from bandwidth_limiter import BandwidthLimiter
+
+# Số video tải cùng lúc trên tất cả nền tảng
+DEFAULT_WORKERS = 3
+# Số video tải cùng lúc trên một nền tảng, tránh bị chặn/giới hạn tốc độ
+DEFAULT_HOST_LIMIT = 2
+
+class DownloadItem:
+    """Một video trong hàng đợi tải"""
+    
+    def __init__(self, url: str, options: Dict[str, Any], host: str):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.options = options
+        self.host = host
+        self.status = "queued"
+        self.progress = 0.0
+        self.last_event: Optional[ProgressEvent] = None
+        self.timings: Dict[str, Any] = {}
+        self.output_file: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dữ liệu lưu vào file trạng thái hàng đợi"""
+        return {
+            'id': self.id,
+            'url': self.url,
+            'options': self.options,
+            'host': self.host,
+            'status': self.status,
+            'output_file': self.output_file,
+            'error': self.error
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DownloadItem':
+        """Khôi phục từ file trạng thái"""
+        item = cls(data['url'], data.get('options', {}), data.get('host', ''))
+        item.id = data.get('id', item.id)
+        item.status = data.get('status', "queued")
+        item.output_file = data.get('output_file')
+        item.error = data.get('error')
+        
+        # Video đang tải dở khi tắt ứng dụng được đưa lại vào hàng đợi
+        if item.status == "downloading":
+            item.status = "queued"
+        item.progress = 1.0 if item.status == "done" else 0.0
+        
+        return item
+
+class DownloadManager:
+    """Hàng đợi tải nhiều video song song, giới hạn số luồng theo từng nền tảng
+
+    Trạng thái hàng đợi được lưu ra file JSON sau mỗi thay đổi, nên khi mở lại
+    ứng dụng các video chưa tải xong sẽ được tải tiếp.
+    """
+    
+    def __init__(self, downloader: VideoDownloader, max_workers: int = DEFAULT_WORKERS,
+                 host_limit: int = DEFAULT_HOST_LIMIT, host_limits: Optional[Dict[str, int]] = None,
+                 global_rate_limit=None, state_path: Optional[str] = None,
+                 progress_callback: Optional[Callable[[DownloadItem, float], None]] = None,
+                 item_callback: Optional[Callable[[DownloadItem], None]] = None,
+                 status_callback: Optional[Callable[[DownloadItem, str], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.downloader = downloader
+        self.max_workers = max(1, max_workers)
+        self.host_limit = max(1, host_limit)
+        self.host_limits = host_limits or {}
+        # Giới hạn băng thông chung cho mọi video đang tải (không chia cố định theo worker)
+        global_rate = parse_rate(global_rate_limit)
+        self.bandwidth_limiter = BandwidthLimiter(global_rate) if global_rate else None
+        self.progress_callback = progress_callback
+        self.item_callback = item_callback
+        self.status_callback = status_callback
+        
+        if state_path is None:
+            state_path = str(Path(__file__).parent.parent / 'temp' / 'download_queue.json')
+        self.state_path = Path(state_path)
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.items: List[DownloadItem] = []
+        self._active: Dict[str, int] = {}
+        self._workers: List[threading.Thread] = []
+        self._stopping = False
+        self._cond = threading.Condition()
+        
+        self._load_state()
+    
+    @classmethod
+    def from_config(cls, downloader: VideoDownloader, config: Dict[str, Any], **kwargs) -> 'DownloadManager':
+        """Tạo hàng đợi từ các mục "download_*" trong config.json"""
+        return cls(
+            downloader,
+            max_workers=config.get('download_workers', DEFAULT_WORKERS),
+            host_limit=config.get('download_host_limit', DEFAULT_HOST_LIMIT),
+            host_limits=config.get('download_host_limits'),
+            global_rate_limit=config.get('download_global_rate_limit'),
+            **kwargs
+        )
+    
+    def host_key(self, url: str) -> str:
+        """Nền tảng của URL (khóa trong downloader.platforms), hoặc tên miền nếu không khớp"""
+        return self.downloader.platform_for(url) or urlparse(url).netloc.lower().split(':')[0]
+    
+    def add(self, urls: List[str], **options) -> List[DownloadItem]:
+        """Thêm URL vào hàng đợi, bỏ qua URL đã có và chưa bị lỗi
+
+        options là tham số của VideoDownloader.download (quality, output_format,
+        output_path, subtitles, audio_only) và phải lưu được dạng JSON.
+        """
+        added = []
+        
+        with self._cond:
+            existing = {item.url for item in self.items if item.status != "failed"}
+            
+            for url in urls:
+                url = url.strip()
+                if not url or url in existing:
+                    continue
+                
+                # URL tải lỗi trước đó được thay bằng mục mới
+                self.items = [item for item in self.items if item.url != url]
+                
+                item = DownloadItem(url, options, self.host_key(url))
+                self.items.append(item)
+                existing.add(url)
+                added.append(item)
+            
+            self._save_state()
+            self._cond.notify_all()
+        
+        return added
+    
+    def add_from_file(self, file_path: str, **options) -> List[DownloadItem]:
+        """Thêm URL từ file text (mỗi dòng một URL, dòng bắt đầu bằng # là ghi chú)"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            urls = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+        
+        return self.add(urls, **options)
+    
+    def start(self):
+        """Chạy các worker nếu chưa chạy"""
+        with self._cond:
+            self._stopping = False
+            self._workers = [w for w in self._workers if w.is_alive()]
+            
+            for _ in range(self.max_workers - len(self._workers)):
+                worker = threading.Thread(target=self._worker, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+    
+    def stop(self):
+        """Dừng nhận video mới; video đang tải sẽ tải nốt"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Chờ tới khi hàng đợi trống, trả về False nếu hết thời gian chờ"""
+        deadline = None if timeout is None else time.time() + timeout
+        
+        with self._cond:
+            while not self.is_idle():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        
+        return True
+    
+    def is_idle(self) -> bool:
+        """Không còn video nào chờ hoặc đang tải"""
+        return all(item.status in ("done", "failed") for item in self.items)
+    
+    def clear_finished(self):
+        """Xóa các video đã tải xong hoặc bị lỗi khỏi hàng đợi"""
+        with self._cond:
+            self.items = [item for item in self.items if item.status not in ("done", "failed")]
+            self._save_state()
+    
+    def overall_progress(self) -> float:
+        """Tiến trình chung của cả hàng đợi (0-1)"""
+        with self._cond:
+            if not self.items:
+                return 0.0
+            # Video bị lỗi cũng tính là đã xử lý xong
+            finished = sum(1.0 if item.status in ("done", "failed") else item.progress for item in self.items)
+            return finished / len(self.items)
+    
+    def total_speed(self) -> float:
+        """Tổng tốc độ tải hiện tại (byte/s) của các video đang tải"""
+        with self._cond:
+            return sum(
+                item.last_event.speed or 0
+                for item in self.items
+                if item.status == "downloading" and item.last_event is not None
+            )
+    
+    def summary(self) -> Dict[str, int]:
+        """Số video theo từng trạng thái"""
+        counts = {'queued': 0, 'downloading': 0, 'done': 0, 'failed': 0}
+        
+        with self._cond:
+            for item in self.items:
+                counts[item.status] = counts.get(item.status, 0) + 1
+        
+        return counts
+    
+    def _limit_for(self, host: str) -> int:
+        """Số luồng tối đa cho một nền tảng"""
+        return self.host_limits.get(host, self.host_limit)
+    
+    def _next_item(self) -> Optional[DownloadItem]:
+        """Video đầu tiên đang chờ mà nền tảng của nó còn slot (gọi khi đang giữ lock)"""
+        for item in self.items:
+            if item.status == "queued" and self._active.get(item.host, 0) < self._limit_for(item.host):
+                return item
+        return None
+    
+    def _worker(self):
+        """Vòng lặp worker: lấy video theo thứ tự, bỏ qua nền tảng đã đủ luồng"""
+        while True:
+            with self._cond:
+                item = self._next_item()
+                while item is None:
+                    if self._stopping or not any(i.status == "queued" for i in self.items):
+                        return
+                    self._cond.wait()
+                    item = self._next_item()
+                
+                item.status = "downloading"
+                item.started_at = time.time()
+                self._active[item.host] = self._active.get(item.host, 0) + 1
+                self._save_state()
+            
+            self._notify_item(item)
+            output_file, error = self._download(item)
+            
+            with self._cond:
+                if error is None:
+                    item.status = "done"
+                    item.output_file = output_file
+                    item.progress = 1.0
+                else:
+                    item.status = "failed"
+                    item.error = error
+                item.finished_at = time.time()
+                
+                self._active[item.host] -= 1
+                self._save_state()
+                self._cond.notify_all()
+            
+            self._notify_progress(item)
+            self._notify_item(item)
+    
+    def _download(self, item: DownloadItem) -> Tuple[Optional[str], Optional[str]]:
+        """Tải một video, trả về (file kết quả, lỗi)"""
+        def on_progress(event: ProgressEvent):
+            item.last_event = event
+            if event.fraction is not None:
+                item.progress = min(event.fraction, 0.99)
+            self._notify_progress(item)
+        
+        def on_status(message):
+            if self.status_callback:
+                self.status_callback(item, message)
+        
+        def on_timing(timings):
+            item.timings = timings
+        
+        try:
+            output_file = self.downloader.download(
+                url=item.url,
+                progress_callback=on_progress,
+                status_callback=on_status,
+                timing_callback=on_timing,
+                bandwidth_limiter=self.bandwidth_limiter,
+                **item.options
+            )
+            return output_file, None
+        
+        except Exception as e:
+            self.logger.error(f"Download failed for {item.url}: {str(e)}")
+            return None, str(e)
+    
+    def _notify_progress(self, item: DownloadItem):
+        """Báo tiến trình của một video và của cả hàng đợi"""
+        if self.progress_callback:
+            self.progress_callback(item, self.overall_progress())
+    
+    def _notify_item(self, item: DownloadItem):
+        """Báo video đổi trạng thái"""
+        if self.item_callback:
+            self.item_callback(item)
+    
+    def _load_state(self):
+        """Đọc hàng đợi đã lưu"""
+        if not self.state_path.exists():
+            return
+        
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.items = [DownloadItem.from_dict(data) for data in json.load(f)]
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Ignored invalid download queue state: {str(e)}")
+            self.items = []
+    
+    def _save_state(self):
+        """Ghi hàng đợi ra file (gọi khi đang giữ lock)"""
+        tmp_path = self.state_path.with_suffix('.tmp')
+        
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([item.to_dict() for item in self.items], f, ensure_ascii=False, indent=2)
+        
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Callable
+
+# Khoảng thời gian tối thiểu (giây) giữa hai sự kiện "downloading" gửi ra ngoài
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+# File phụ đề yt-dlp tải kèm video, không tính vào số byte vì dung lượng dự kiến không có chúng
+SUBTITLE_FILE_EXTENSIONS = {'.vtt', '.srt', '.ass', '.ssa', '.ttml', '.srv1', '.srv2', '.srv3', '.json3', '.lrc'}
+
+class ProgressEvent:
+    """Tiến trình tải đã chuẩn hóa từ progress hook của yt-dlp
+
+    phase: "downloading", "finished" (xong một file), "postprocessing",
+    "postprocessed" (xong một bước xử lý sau tải) hoặc "error".
+    Số byte tính cho cả video (gồm mọi file thành phần như video + audio).
+    """
+    
+    def __init__(self, phase: str, downloaded_bytes: int = 0, total_bytes: Optional[int] = None,
+                 speed: Optional[float] = None, eta: Optional[float] = None,
+                 fragment_index: Optional[int] = None, fragment_count: Optional[int] = None,
+                 filename: Optional[str] = None, postprocessor: Optional[str] = None,
+                 fraction: Optional[float] = None, elapsed: float = 0.0):
+        self.phase = phase
+        self.downloaded_bytes = downloaded_bytes
+        self.total_bytes = total_bytes
+        self.speed = speed
+        self.eta = eta
+        self.fragment_index = fragment_index
+        self.fragment_count = fragment_count
+        self.filename = filename
+        self.postprocessor = postprocessor
+        # Tỉ lệ đã tải (0-1), None nếu chưa biết dung lượng
+        self.fraction = fraction
+        self.elapsed = elapsed
+    
+    @property
+    def average_speed(self) -> Optional[float]:
+        """Tốc độ trung bình (byte/s) từ lúc bắt đầu tải"""
+        if self.elapsed <= 0:
+            return None
+        return self.downloaded_bytes / self.elapsed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dạng dict để gửi qua API/ghi log"""
+        return {
+            'phase': self.phase,
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'fraction': self.fraction,
+            'speed': self.speed,
+            'average_speed': self.average_speed,
+            'eta': self.eta,
+            'fragment_index': self.fragment_index,
+            'fragment_count': self.fragment_count,
+            'filename': self.filename,
+            'postprocessor': self.postprocessor,
+            'elapsed': self.elapsed
+        }
+    
+    def describe(self) -> str:
+        """Mô tả ngắn để hiển thị"""
+        if self.phase in ("postprocessing", "postprocessed"):
+            return f"Đang xử lý: {self.postprocessor}"
+        
+        text = format_bytes(self.downloaded_bytes)
+        if self.total_bytes:
+            text += f" / {format_bytes(self.total_bytes)}"
+        if self.fraction is not None:
+            text += f" ({self.fraction * 100:.1f}%)"
+        if self.speed:
+            text += f" - {format_bytes(self.speed)}/s"
+        if self.eta is not None:
+            text += f" - còn {int(self.eta)}s"
+        if self.fragment_index and self.fragment_count:
+            text += f" - đoạn {self.fragment_index}/{self.fragment_count}"
+        return text
+
+def format_bytes(size: float) -> str:
+    """Đổi số byte sang KB/MB/GB"""
+    if size < 1024:
+        return f"{int(size)} B"
+    
+    for unit in ("KB", "MB"):
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    
+    return f"{size / 1024:.1f} GB"
+
+class ProgressAdapter:
+    """Chuyển dict của progress_hooks/postprocessor_hooks thành ProgressEvent
+
+    Sự kiện "downloading" được giới hạn tối đa một lần mỗi min_interval giây,
+    các sự kiện đổi trạng thái luôn được gửi. Tỉ lệ tải không bao giờ giảm,
+    kể cả khi yt-dlp chuyển từ file video sang file audio. File phụ đề bị bỏ qua.
+    """
+    
+    def __init__(self, callback: Callable[[ProgressEvent], None],
+                 min_interval: float = DEFAULT_PROGRESS_INTERVAL):
+        self.callback = callback
+        self.min_interval = min_interval
+        
+        self.started_at: Optional[float] = None
+        self._finished_files: Dict[str, int] = {}
+        self._last_emit = 0.0
+        self._last_fraction = 0.0
+        self._last_event: Optional[ProgressEvent] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def last_event(self) -> Optional[ProgressEvent]:
+        """Sự kiện gần nhất (kể cả sự kiện bị bỏ qua do giới hạn tần suất)"""
+        return self._last_event
+    
+    def progress_hook(self, d: Dict[str, Any]):
+        """Dùng trong ydl_opts['progress_hooks']"""
+        now = time.time()
+        
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = now
+            
+            status = d.get('status')
+            filename = d.get('filename')
+            if filename and os.path.splitext(filename)[1].lower() in SUBTITLE_FILE_EXTENSIONS:
+                return
+            current = d.get('downloaded_bytes') or 0
+            current_total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            
+            if status == 'finished' and filename:
+                self._finished_files[filename] = current_total or current
+            
+            done_bytes = sum(size for name, size in self._finished_files.items() if name != filename)
+            downloaded = done_bytes + (current if status != 'finished' else self._finished_files.get(filename, 0))
+            
+            total = self._expected_total(d.get('info_dict') or {})
+            if total is None and current_total:
+                total = done_bytes + current_total
+            
+            # Không để tỉ lệ giảm khi dung lượng ước lượng thay đổi
+            fraction = None
+            if total:
+                fraction = max(min(downloaded / total, 1.0), self._last_fraction)
+                self._last_fraction = fraction
+            
+            event = ProgressEvent(
+                phase="downloading" if status == 'downloading' else "finished" if status == 'finished' else "error",
+                downloaded_bytes=downloaded,
+                total_bytes=total,
+                speed=d.get('speed'),
+                eta=d.get('eta'),
+                fragment_index=d.get('fragment_index'),
+                fragment_count=d.get('fragment_count'),
+                filename=filename,
+                fraction=fraction,
+                elapsed=now - self.started_at
+            )
+            self._last_event = event
+            
+            if event.phase == "downloading" and now - self._last_emit < self.min_interval:
+                return
+            self._last_emit = now
+        
+        self.callback(event)
+    
+    def postprocessor_hook(self, d: Dict[str, Any]):
+        """Dùng trong ydl_opts['postprocessor_hooks']"""
+        if d.get('status') not in ('started', 'finished'):
+            return
+        
+        with self._lock:
+            last = self._last_event
+            event = ProgressEvent(
+                phase="postprocessing" if d.get('status') == 'started' else "postprocessed",
+                downloaded_bytes=last.downloaded_bytes if last else 0,
+                total_bytes=last.total_bytes if last else None,
+                fraction=last.fraction if last else None,
+                filename=(d.get('info_dict') or {}).get('filepath'),
+                postprocessor=d.get('postprocessor'),
+                elapsed=time.time() - self.started_at if self.started_at else 0.0
+            )
+            self._last_event = event
+        
+        self.callback(event)
+    
+    def _expected_total(self, info: Dict[str, Any]) -> Optional[int]:
+        """Tổng dung lượng các file thành phần (video + audio) nếu yt-dlp biết trước"""
+        formats = info.get('requested_formats')
+        if not formats:
+            return None
+        
+        sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+        if not all(sizes):
+            return None
+        return int(sum(sizes))
@@ -3,16 +3,31 @@ from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import os
-import json
+import re
 import threading
 from datetime import datetime
 
 # Import các module chức năng
-from api_client import LMStudioClient
-from video_downloader import VideoDownloader
+from api_client import LMStudioClient, is_error_response
+from llm_cache import CompletionCache
+from video_downloader import VideoDownloader, DOWNLOAD_PROFILES
+from download_manager import DownloadManager
+from download_progress import format_bytes
 from image_generator import ImageGenerator
+from image_gallery import ImageGallery
+from thumbnail_cache import ThumbnailCache
+from scene_script import parse_scene_script, format_scene_script, scenes_to_json
+from storyboard_pipeline import StoryboardPipeline
+from subtitle_pipeline import SubtitlePipeline
+from llm_scheduler import LLMScheduler
 from srt_translator import SRTTranslator
-from story_editor import StoryEditor
+from story_editor import StoryEditor, CHUNK_TOKENS
+from utils.tokens import estimate_tokens
+
+# Khoảng thời gian (ms) giữa các lần ghi text stream lên widget
+STREAM_FLUSH_MS = 50
+# Lựa chọn "chế độ tải theo nền tảng" trong tab tải video
+PROFILE_BY_PLATFORM = "theo nền tảng"
 
 class MainApp(ctk.CTk):
     def __init__(self, config):
@@ -22,6 +37,7 @@ class MainApp(ctk.CTk):
         self.setup_app()
         self.create_widgets()
         self.setup_clients()
+        self.resume_download_queue()
         
     def setup_app(self):
         """Cấu hình cửa sổ ứng dụng"""
@@ -44,11 +60,35 @@ class MainApp(ctk.CTk):
         
     def setup_clients(self):
         """Khởi tạo các client API"""
-        self.lm_client = LMStudioClient(self.config['lm_studio_url'])
-        self.video_dl = VideoDownloader()
-        self.image_gen = ImageGenerator(self.config['sd_api_url'])
+        self.llm_cache = CompletionCache.from_config(self.config)
+        # Điều phối request của cả ba tab (chỉnh sửa, dịch SRT, kịch bản) tới LM Studio
+        self.llm_scheduler = LLMScheduler.from_config(self.config)
+        self.lm_client = LMStudioClient(
+            self.config['lm_studio_url'],
+            cache=self.llm_cache,
+            scheduler=self.llm_scheduler
+        )
+        self.video_dl = VideoDownloader.from_config(self.config)
+        self.download_manager = DownloadManager.from_config(
+            self.video_dl,
+            self.config,
+            progress_callback=self.on_download_progress,
+            item_callback=self.on_download_item,
+            status_callback=lambda item, message: self.update_download_status(f"[{item.host}] {message}")
+        )
+        self.image_gen = ImageGenerator.from_config(self.config)
+        # Ảnh xem trước trên canvas và thumbnail cho thư viện ảnh, tạo trên worker thread
+        self.preview_cache = ThumbnailCache(size=(400, 400), memory_items=32)
+        self.gallery_thumbnails = ThumbnailCache()
+        self.image_gallery = None
         self.translator = SRTTranslator(self.lm_client)
         self.editor = StoryEditor(self.lm_client)
+        self.storyboard = StoryboardPipeline(self.editor, self.image_gen)
+        self.subtitle_pipeline = SubtitlePipeline.from_config(
+            self.translator,
+            self.config,
+            task_callback=self.on_subtitle_task
+        )
         
     def create_widgets(self):
         """Tạo tất cả widget giao diện"""
@@ -312,6 +352,18 @@ class MainApp(ctk.CTk):
         self.batch_size.insert(0, "10")
         self.batch_size.grid(row=1, column=3, padx=5, pady=5, sticky="w")
         
+        # Chia batch theo token (0 = theo số câu)
+        ctk.CTkLabel(options_frame, text="Token/batch (0 = theo số câu):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.token_budget = ctk.CTkEntry(options_frame, width=80)
+        self.token_budget.insert(0, str(self.config.get('translation_token_budget', 0)))
+        self.token_budget.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        
+        # Số luồng dịch song song
+        ctk.CTkLabel(options_frame, text="Số luồng song song:").grid(row=2, column=2, padx=(20, 5), pady=5, sticky="w")
+        self.translation_workers = ctk.CTkEntry(options_frame, width=80)
+        self.translation_workers.insert(0, str(self.config.get('translation_workers', 1)))
+        self.translation_workers.grid(row=2, column=3, padx=5, pady=5, sticky="w")
+        
         options_frame.grid_columnconfigure(1, weight=1)
         options_frame.grid_columnconfigure(3, weight=0)
         
@@ -451,6 +503,25 @@ class MainApp(ctk.CTk):
             variable=self.audio_only_var
         ).grid(row=1, column=2, columnspan=2, padx=5, pady=5, sticky="w")
         
+        # Download profile
+        ctk.CTkLabel(options_frame, text="Chế độ tải:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.download_profile = ctk.CTkComboBox(
+            options_frame,
+            values=[PROFILE_BY_PLATFORM] + list(DOWNLOAD_PROFILES.keys())
+        )
+        self.download_profile.set(PROFILE_BY_PLATFORM)
+        self.download_profile.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+        
+        # Dịch phụ đề ngay khi từng video tải xong
+        self.translate_subtitles_var = tk.BooleanVar(
+            value=self.config.get('subtitle_pipeline', {}).get('enabled', False)
+        )
+        ctk.CTkCheckBox(
+            options_frame,
+            text=f"Dịch phụ đề sang {self.subtitle_pipeline.tgt_lang} sau khi tải",
+            variable=self.translate_subtitles_var
+        ).grid(row=2, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+        
         options_frame.grid_columnconfigure(1, weight=1)
         options_frame.grid_columnconfigure(3, weight=1)
         
@@ -495,6 +566,13 @@ class MainApp(ctk.CTk):
             hover_color="darkgray"
         ).pack(side="left", padx=5)
         
+        ctk.CTkButton(
+            control_frame,
+            text="📋 Tải Danh Sách URL",
+            command=self.download_video_list,
+            width=150
+        ).pack(side="right", padx=5)
+        
         ctk.CTkButton(
             control_frame,
             text="⬇️ Tải Video Ngay",
@@ -593,6 +671,15 @@ class MainApp(ctk.CTk):
             hover_color="#7B1FA2"
         ).pack(side="right", padx=5)
         
+        ctk.CTkButton(
+            button_frame,
+            text="🎞️ Truyện → Storyboard",
+            command=self.run_storyboard,
+            width=170,
+            fg_color="#FF9800",
+            hover_color="#F57C00"
+        ).pack(side="right", padx=5)
+        
         # Script output
         output_frame = ctk.CTkFrame(tab)
         output_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
@@ -624,6 +711,13 @@ class MainApp(ctk.CTk):
             command=self.copy_script_to_clipboard,
             width=120
         ).pack(side="right", padx=5)
+        
+        ctk.CTkButton(
+            export_frame,
+            text="🖼️ Chuyển Sang Tạo Ảnh",
+            command=self.send_script_to_image_tab,
+            width=160
+        ).pack(side="left", padx=5)
     
     def create_tab5_content(self):
         """Tab 5: Tạo ảnh từ kịch bản"""
@@ -700,6 +794,20 @@ class MainApp(ctk.CTk):
         self.sampler.set("Euler a")
         self.sampler.grid(row=2, column=3, padx=5, pady=5, sticky="ew")
         
+        # Seed (-1 = ngẫu nhiên)
+        ctk.CTkLabel(options_frame, text="Seed:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        self.image_seed = ctk.CTkEntry(options_frame, width=120)
+        self.image_seed.insert(0, "-1")
+        self.image_seed.grid(row=3, column=1, padx=5, pady=5, sticky="w")
+        
+        # Dùng lại ảnh đã tạo với cùng tham số
+        self.image_use_cache = tk.BooleanVar(value=True)
+        ctk.CTkCheckBox(
+            options_frame,
+            text="Dùng lại ảnh đã tạo (cùng tham số)",
+            variable=self.image_use_cache
+        ).grid(row=3, column=2, columnspan=2, padx=(20, 5), pady=5, sticky="w")
+        
         options_frame.grid_columnconfigure(1, weight=1)
         options_frame.grid_columnconfigure(3, weight=1)
         
@@ -723,6 +831,22 @@ class MainApp(ctk.CTk):
             width=120
         ).pack(side="right", padx=5)
         
+        ctk.CTkButton(
+            button_frame,
+            text="🎬 Tạo Theo Cảnh",
+            command=self.generate_scene_images,
+            width=130
+        ).pack(side="right", padx=5)
+        
+        ctk.CTkButton(
+            button_frame,
+            text="⏹️ Dừng Tạo Ảnh",
+            command=self.cancel_image_generation,
+            width=120,
+            fg_color="gray",
+            hover_color="darkgray"
+        ).pack(side="right", padx=5)
+        
         # Image preview area
         preview_frame = ctk.CTkFrame(tab)
         preview_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
@@ -748,6 +872,13 @@ class MainApp(ctk.CTk):
             width=140
         ).pack(side="left", padx=5)
         
+        ctk.CTkButton(
+            control_frame,
+            text="🖼️ Thư Viện Ảnh",
+            command=self.open_image_gallery,
+            width=140
+        ).pack(side="left", padx=5)
+        
         ctk.CTkButton(
             control_frame,
             text="⬇️ Tải Ảnh Xuống",
@@ -878,14 +1009,21 @@ class MainApp(ctk.CTk):
         status_window.geometry("500x300")
         status_window.transient(self)
         
-        # Add status information
-        # TODO: Thêm thông tin trạng thái chi tiết
+        status_label = ctk.CTkLabel(status_window, text="", font=("Consolas", 11), justify="left")
+        status_label.pack(expand=True, fill="both", padx=10, pady=10)
+        
+        # Hàng đợi request LM Studio, cập nhật mỗi giây khi cửa sổ còn mở
+        def refresh():
+            if not status_window.winfo_exists():
+                return
+            if self.llm_scheduler is None:
+                text = "Không giới hạn request tới LM Studio (llm_scheduler đã tắt)"
+            else:
+                text = self.llm_scheduler.describe()
+            status_label.configure(text=text)
+            status_window.after(1000, refresh)
         
-        ctk.CTkLabel(
-            status_window,
-            text="Thông tin hệ thống sẽ được hiển thị ở đây",
-            font=("Arial", 12)
-        ).pack(expand=True)
+        refresh()
         
     def load_story_file(self):
         """Tải file truyện từ hệ thống"""
@@ -922,16 +1060,42 @@ class MainApp(ctk.CTk):
         # Hiển thị trạng thái xử lý
         self.update_status(f"Đang xử lý với AI ({edit_type})...")
         
+        # Truyện dài: chia phần và chỉnh sửa song song
+        if estimate_tokens(story) > CHUNK_TOKENS:
+            self.process_long_story_edit(story, edit_type, length_pref)
+            return
+        
+        # Stream kết quả vào ô output ngay khi AI sinh ra
+        self.stream_to_text_widget(
+            self.result_text,
+            lambda: self.editor.stream_edit_story(
+                story=story,
+                edit_type=edit_type,
+                length_preference=length_pref
+            ),
+            on_done=self.show_edit_result,
+            error_message="Không thể xử lý truyện"
+        )
+    
+    def process_long_story_edit(self, story, edit_type, length_pref):
+        """Chỉnh sửa truyện dài theo từng phần, báo tiến trình theo phần"""
+        self.result_text.delete(1.0, tk.END)
+        
+        def on_progress(current, total):
+            self.after(0, lambda: self.update_status(
+                f"Đang xử lý với AI ({edit_type})... {current}/{total} phần"
+            ))
+        
         def process():
             try:
-                # Gọi API LM Studio
-                result = self.editor.edit_story(
+                result = self.editor.edit_story_chunked(
                     story=story,
                     edit_type=edit_type,
-                    length_preference=length_pref
+                    length_preference=length_pref,
+                    max_workers=self.config.get('translation_workers', 1),
+                    progress_callback=on_progress
                 )
                 
-                # Cập nhật UI trong main thread
                 self.after(0, lambda: self.show_edit_result(result))
                 
             except Exception as e:
@@ -940,13 +1104,61 @@ class MainApp(ctk.CTk):
                     f"Không thể xử lý truyện: {str(e)}"
                 ))
         
-        # Chạy trong thread riêng
         threading.Thread(target=process, daemon=True).start()
     
+    def stream_to_text_widget(self, widget, produce_chunks, on_done, error_message):
+        """Chạy generator trong thread riêng và đổ dần từng đoạn text vào widget
+        
+        Các đoạn được gom vào buffer và chỉ ghi lên widget mỗi STREAM_FLUSH_MS
+        để không làm nghẽn main loop của Tk.
+        """
+        buffer = []
+        lock = threading.Lock()
+        state = {"done": False, "error": None}
+        
+        widget.delete(1.0, tk.END)
+        
+        def consume():
+            try:
+                for chunk in produce_chunks():
+                    with lock:
+                        buffer.append(chunk)
+            except Exception as e:
+                state["error"] = e
+            finally:
+                state["done"] = True
+        
+        def flush():
+            # Đọc cờ done trước khi lấy buffer để không bỏ sót đoạn cuối
+            done = state["done"]
+            
+            with lock:
+                text = "".join(buffer)
+                buffer.clear()
+            
+            if text:
+                widget.insert(tk.END, text)
+                widget.see(tk.END)
+            
+            if not done:
+                self.after(STREAM_FLUSH_MS, flush)
+            elif state["error"] is not None:
+                messagebox.showerror("Lỗi", f"{error_message}: {str(state['error'])}")
+            elif is_error_response(widget.get(1.0, tk.END)):
+                # Không báo thành công khi nội dung là chuỗi lỗi của client
+                messagebox.showerror("Lỗi", f"{error_message}: {widget.get(1.0, tk.END).strip()}")
+            else:
+                on_done(widget.get(1.0, tk.END).strip())
+        
+        threading.Thread(target=consume, daemon=True).start()
+        self.after(STREAM_FLUSH_MS, flush)
+    
     def show_edit_result(self, result):
         """Hiển thị kết quả chỉnh sửa"""
-        self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(1.0, result)
+        # Khi stream, nội dung đã được đổ dần vào widget
+        if self.result_text.get(1.0, tk.END).strip() != result:
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(1.0, result)
         self.update_status("Đã hoàn thành chỉnh sửa!")
     
     def save_edited_story(self):
@@ -1015,10 +1227,21 @@ class MainApp(ctk.CTk):
         except:
             batch_size = 10
         
+        try:
+            max_workers = int(self.translation_workers.get())
+        except:
+            max_workers = 1
+        
+        try:
+            token_budget = int(self.token_budget.get()) or None
+        except:
+            token_budget = None
+        
         self.update_status("Đang bắt đầu dịch...")
         self.progress_bar.set(0)
         
         def translate():
+            untranslated = []
             try:
                 # Dịch file SRT
                 result = self.translator.translate_file(
@@ -1027,11 +1250,14 @@ class MainApp(ctk.CTk):
                     tgt_lang=tgt_lang,
                     style=style,
                     batch_size=batch_size,
-                    progress_callback=self.update_translation_progress
+                    progress_callback=self.update_translation_progress,
+                    max_workers=max_workers,
+                    token_budget=token_budget,
+                    untranslated_callback=untranslated.extend
                 )
                 
                 # Hiển thị kết quả
-                self.after(0, lambda: self.show_translation_result(result, file_path))
+                self.after(0, lambda: self.show_translation_result(result, file_path, untranslated))
                 
             except Exception as e:
                 self.after(0, lambda: messagebox.showerror(
@@ -1053,16 +1279,23 @@ class MainApp(ctk.CTk):
         
         self.after(0, update)
     
-    def show_translation_result(self, result, original_path):
+    def show_translation_result(self, result, original_path, untranslated=None):
         """Hiển thị kết quả dịch"""
         # Hiển thị preview
         self.trans_text.delete(1.0, tk.END)
         self.trans_text.insert(1.0, result[:5000])  # Giới hạn preview
         
+        # Câu không dịch được vẫn giữ nguyên câu gốc trong file kết quả
+        message = "Đã dịch xong!"
+        if untranslated:
+            numbers = ", ".join(str(n) for n in untranslated[:20])
+            more = "..." if len(untranslated) > 20 else ""
+            message += f"\n⚠️ {len(untranslated)} câu không dịch được, giữ nguyên câu gốc: {numbers}{more}"
+        
         # Hỏi người dùng có muốn lưu không
         save = messagebox.askyesno(
             "Thành công", 
-            f"Đã dịch xong! Bạn có muốn lưu file không?"
+            f"{message}\nBạn có muốn lưu file không?"
         )
         
         if save:
@@ -1105,6 +1338,19 @@ class MainApp(ctk.CTk):
             try:
                 info = self.video_dl.get_video_info(url)
                 
+                # Playlist/trang cá nhân: lấy thông tin các video song song
+                if 'entries' in info:
+                    videos = self.video_dl.probe_urls([url])
+                    info_text = f"Tìm thấy danh sách: {info.get('title', 'Không rõ')} ({len(videos)} video)\n"
+                    for i, video in enumerate(videos, 1):
+                        if 'error' in video:
+                            info_text += f"{i}. ❌ {video['url']}: {video['error']}\n"
+                        else:
+                            info_text += f"{i}. {video.get('title', 'Không rõ')} ({video.get('duration', 0)} giây)\n"
+                    
+                    self.after(0, lambda: self.show_video_info(info_text))
+                    return
+                
                 # Hiển thị thông tin video
                 info_text = f"Tìm thấy video:\n"
                 info_text += f"Tiêu đề: {info.get('title', 'Không rõ')}\n"
@@ -1133,6 +1379,19 @@ class MainApp(ctk.CTk):
         self.video_url.delete(0, tk.END)
         self.download_status.delete(1.0, tk.END)
     
+    def get_download_options(self):
+        """Tùy chọn tải đang chọn trên giao diện"""
+        profile = self.download_profile.get()
+        
+        return {
+            'quality': self.quality.get(),
+            'output_format': self.format_var.get(),
+            'output_path': self.download_path.get(),
+            'subtitles': self.subtitle_var.get(),
+            'audio_only': self.audio_only_var.get(),
+            'profile': None if profile == PROFILE_BY_PLATFORM else profile
+        }
+    
     def download_video(self):
         """Tải video"""
         url = self.video_url.get().strip()
@@ -1140,38 +1399,95 @@ class MainApp(ctk.CTk):
             messagebox.showwarning("Cảnh báo", "Vui lòng nhập URL video!")
             return
         
-        quality = self.quality.get()
-        fmt = self.format_var.get()
-        download_path = self.download_path.get()
-        subtitle = self.subtitle_var.get()
-        audio_only = self.audio_only_var.get()
+        # Playlist đã kiểm tra được tải thành từng video riêng
+        urls = [url]
+        info = self.video_dl.info_cache.get(url) if self.video_dl.info_cache else None
+        if info is not None and info.get('_type') == 'playlist':
+            urls = [entry['url'] for entry in self.video_dl.get_video_info(url)['entries'] if entry['url']]
         
-        self.update_status(f"Đang bắt đầu tải video...")
-        self.download_progress.set(0)
+        self.enqueue_downloads(self.download_manager.add(urls, **self.get_download_options()))
+    
+    def download_video_list(self):
+        """Tải tất cả URL trong một file text"""
+        file_path = filedialog.askopenfilename(
+            title="Chọn file danh sách URL",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
         
-        def download():
-            try:
-                # Tải video với progress callback
-                result = self.video_dl.download(
-                    url=url,
-                    quality=quality,
-                    output_format=fmt,
-                    output_path=download_path,
-                    subtitles=subtitle,
-                    audio_only=audio_only,
-                    progress_callback=self.update_download_progress,
-                    status_callback=self.update_download_status
-                )
-                
-                self.after(0, lambda: self.download_complete(result))
-                
-            except Exception as e:
-                self.after(0, lambda: messagebox.showerror(
-                    "Lỗi", 
-                    f"Lỗi khi tải video: {str(e)}"
-                ))
+        if not file_path:
+            return
+        
+        try:
+            items = self.download_manager.add_from_file(file_path, **self.get_download_options())
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Không thể đọc file: {str(e)}")
+            return
         
-        threading.Thread(target=download, daemon=True).start()
+        self.enqueue_downloads(items)
+    
+    def enqueue_downloads(self, items):
+        """Chạy hàng đợi tải sau khi thêm video"""
+        if not items:
+            messagebox.showinfo("Thông báo", "Các URL này đã có trong hàng đợi!")
+            return
+        
+        self.update_status(f"Đã thêm {len(items)} video vào hàng đợi tải...")
+        self.download_progress.set(self.download_manager.overall_progress())
+        self.download_manager.start()
+    
+    def resume_download_queue(self):
+        """Tải tiếp các video còn trong hàng đợi từ lần chạy trước"""
+        pending = self.download_manager.summary()['queued']
+        if pending:
+            self.update_download_status(f"Tải tiếp {pending} video còn trong hàng đợi...")
+            self.download_manager.start()
+    
+    def on_download_item(self, item):
+        """Ghi log khi một video đổi trạng thái"""
+        if item.status == "downloading":
+            self.update_download_status(f"⬇️ Bắt đầu tải: {item.url}")
+        elif item.status == "done":
+            message = f"✅ Đã tải: {item.output_file}"
+            if item.timings:
+                message += (f" (lấy thông tin {item.timings['extract']:.1f}s, tải {item.timings['download']:.1f}s, "
+                            f"xử lý {item.timings['postprocess']:.1f}s)")
+            self.update_download_status(message)
+            
+            if self.translate_subtitles_var.get() and item.options.get('subtitles') and item.output_file:
+                self.subtitle_pipeline.submit(item.output_file)
+        elif item.status == "failed":
+            self.update_download_status(f"❌ Lỗi {item.url}: {item.error}")
+        
+        if self.download_manager.is_idle():
+            self.after(0, self.download_complete)
+    
+    def on_download_progress(self, item, overall):
+        """Cập nhật thanh tiến trình chung và tốc độ tải"""
+        self.update_download_progress(overall * 100)
+        
+        if item.status == "downloading" and item.last_event is not None:
+            summary = self.download_manager.summary()
+            speed = format_bytes(self.download_manager.total_speed())
+            message = (f"Đang tải {summary['downloading']} video ({speed}/s), "
+                       f"chờ {summary['queued']} - {item.host}: {item.last_event.describe()}")
+            self.after(0, lambda: self.update_status(message))
+    
+    def on_subtitle_task(self, task):
+        """Ghi log khi phụ đề của một video đổi trạng thái"""
+        name = os.path.basename(task.video_file)
+        
+        if task.status == "queued":
+            self.update_download_status(f"📝 Chờ dịch phụ đề: {name}")
+        elif task.status == "translating":
+            self.after(0, lambda: self.update_status(f"{name}: {task.message}"))
+            if task.progress == 0:
+                self.update_download_status(f"📝 {name}: {task.message}")
+        elif task.status == "done":
+            self.update_download_status(f"✅ {name}: {task.message}")
+        elif task.status == "skipped":
+            self.update_download_status(f"⏭️ {name}: {task.message}")
+        elif task.status == "failed":
+            self.update_download_status(f"❌ {name}: {task.message}")
     
     def update_download_progress(self, percent):
         """Cập nhật tiến trình download"""
@@ -1188,11 +1504,28 @@ class MainApp(ctk.CTk):
         
         self.after(0, update)
     
-    def download_complete(self, result):
-        """Xử lý khi download hoàn thành"""
+    def download_complete(self):
+        """Xử lý khi hàng đợi download hoàn thành"""
+        done = [item for item in self.download_manager.items if item.status == "done"]
+        failed = [item for item in self.download_manager.items if item.status == "failed"]
+        self.download_manager.clear_finished()
+        self.subtitle_pipeline.clear_finished()
+        
+        if not done and not failed:
+            return
+        
         self.download_progress.set(1)
-        self.update_status(f"Đã tải video: {os.path.basename(result)}")
-        messagebox.showinfo("Thành công", f"Đã tải video thành công!\nLưu tại: {result}")
+        self.update_status(f"Đã tải {len(done)}/{len(done) + len(failed)} video")
+        
+        if len(done) == 1 and not failed:
+            messagebox.showinfo("Thành công", f"Đã tải video thành công!\nLưu tại: {done[0].output_file}")
+        elif failed:
+            messagebox.showwarning(
+                "Hoàn thành",
+                f"Đã tải {len(done)} video, {len(failed)} video bị lỗi (xem trạng thái tải)"
+            )
+        else:
+            messagebox.showinfo("Thành công", f"Đã tải {len(done)} video thành công!")
     
     def generate_image_script(self):
         """Tạo kịch bản ảnh từ truyện"""
@@ -1213,32 +1546,101 @@ class MainApp(ctk.CTk):
         
         self.update_status("Đang tạo kịch bản ảnh với AI...")
         
-        def generate():
+        # Stream kịch bản vào ô output ngay khi AI sinh ra
+        self.stream_to_text_widget(
+            self.script_output,
+            lambda: self.editor.stream_image_script(
+                story=story,
+                num_scenes=num_scenes,
+                style=style,
+                detail_level=detail,
+                include_prompts=include_prompts
+            ),
+            on_done=self.show_generated_script,
+            error_message="Không thể tạo kịch bản"
+        )
+    
+    def run_storyboard(self):
+        """Viết kịch bản và tạo ảnh từng cảnh ngay khi cảnh đó được viết xong"""
+        story = self.script_story_text.get(1.0, tk.END).strip()
+        if not story:
+            messagebox.showwarning("Cảnh báo", "Vui lòng nhập nội dung truyện!")
+            return
+        
+        try:
+            num_scenes = int(self.num_scenes.get())
+        except:
+            num_scenes = 5
+        
+        style = self.image_style.get()
+        detail = self.detail_level.get()
+        image_options = self.get_image_options()
+        self.image_cancel = threading.Event()
+        cancel_event = self.image_cancel
+        
+        self.script_output.delete(1.0, tk.END)
+        self.update_status("Đang chạy storyboard...")
+        
+        def on_script(delta):
+            self.after(0, lambda: (self.script_output.insert(tk.END, delta), self.script_output.see(tk.END)))
+        
+        def on_scene(scene, paths):
+            if paths:
+                self.show_image_file(paths[0])
+            self.gallery_thumbnails.prefetch(paths)
+        
+        def on_status(stage, message):
+            self.after(0, lambda: self.update_status(message))
+        
+        def run():
             try:
-                # Gọi API để tạo kịch bản
-                script = self.editor.generate_image_script(
-                    story=story,
+                state = self.storyboard.run(
+                    story,
                     num_scenes=num_scenes,
                     style=style,
                     detail_level=detail,
-                    include_prompts=include_prompts
+                    image_options=image_options,
+                    script_callback=on_script,
+                    scene_callback=on_scene,
+                    status_callback=on_status,
+                    cancel_event=cancel_event
                 )
                 
-                self.after(0, lambda: self.show_generated_script(script))
-                
+                timings = ", ".join(f"{stage} {timing.get('seconds', 0):.1f}s"
+                                    for stage, timing in state.timings.items())
+                self.after(0, lambda: self.update_status(
+                    f"Storyboard xong {len(state.images)}/{len(state.scenes)} cảnh ({timings})"
+                ))
+            
             except Exception as e:
                 self.after(0, lambda: messagebox.showerror(
-                    "Lỗi", 
-                    f"Không thể tạo kịch bản: {str(e)}"
+                    "Lỗi",
+                    f"Không thể tạo storyboard: {str(e)}"
                 ))
         
-        threading.Thread(target=generate, daemon=True).start()
+        threading.Thread(target=run, daemon=True).start()
     
     def show_generated_script(self, script):
         """Hiển thị kịch bản đã tạo"""
-        self.script_output.delete(1.0, tk.END)
-        self.script_output.insert(1.0, script)
-        self.update_status("Đã tạo kịch bản ảnh!")
+        # Khi stream, nội dung đã được đổ dần vào widget
+        if self.script_output.get(1.0, tk.END).strip() != script:
+            self.script_output.delete(1.0, tk.END)
+            self.script_output.insert(1.0, script)
+        
+        scenes = parse_scene_script(script)
+        self.update_status(f"Đã tạo kịch bản ảnh! ({len(scenes)} cảnh)")
+    
+    def send_script_to_image_tab(self):
+        """Đọc kịch bản thành các cảnh và chuyển sang tab tạo ảnh"""
+        scenes = parse_scene_script(self.script_output.get(1.0, tk.END))
+        if not scenes:
+            messagebox.showwarning("Cảnh báo", "Không đọc được cảnh nào từ kịch bản!")
+            return
+        
+        self.image_prompt_text.delete(1.0, tk.END)
+        self.image_prompt_text.insert(1.0, format_scene_script(scenes))
+        self.show_tab5()
+        self.update_status(f"Đã chuyển {len(scenes)} cảnh sang tab tạo ảnh")
     
     def save_image_script(self):
         """Lưu kịch bản ảnh"""
@@ -1250,10 +1652,14 @@ class MainApp(ctk.CTk):
         file_path = filedialog.asksaveasfilename(
             title="Lưu kịch bản ảnh",
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Text files", "*.txt"), ("JSON files", "*.json"), ("All files", "*.*")]
         )
         
         if file_path:
+            # File .json lưu kịch bản đã đọc thành các cảnh
+            if file_path.lower().endswith('.json'):
+                content = scenes_to_json(parse_scene_script(content))
+            
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(content)
@@ -1277,7 +1683,7 @@ class MainApp(ctk.CTk):
         """Tải kịch bản ảnh từ file"""
         file_path = filedialog.askopenfilename(
             title="Chọn file kịch bản",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Text files", "*.txt"), ("JSON files", "*.json"), ("All files", "*.*")]
         )
         
         if file_path:
@@ -1285,20 +1691,17 @@ class MainApp(ctk.CTk):
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
                 
+                if file_path.lower().endswith('.json'):
+                    content = format_scene_script(parse_scene_script(content))
+                
                 self.image_prompt_text.delete(1.0, tk.END)
                 self.image_prompt_text.insert(1.0, content)
                 self.update_status(f"Đã tải kịch bản: {os.path.basename(file_path)}")
             except Exception as e:
                 messagebox.showerror("Lỗi", f"Không thể đọc file: {str(e)}")
     
-    def generate_images(self):
-        """Tạo ảnh từ prompt"""
-        prompt = self.image_prompt_text.get(1.0, tk.END).strip()
-        if not prompt:
-            messagebox.showwarning("Cảnh báo", "Vui lòng nhập prompt hoặc kịch bản!")
-            return
-        
-        model = self.image_model.get()
+    def get_image_options(self):
+        """Tham số tạo ảnh đang chọn trên giao diện"""
         size = self.image_size.get()
         
         try:
@@ -1310,7 +1713,33 @@ class MainApp(ctk.CTk):
             steps = 30
             cfg_scale = 7.5
         
-        sampler = self.sampler.get()
+        try:
+            seed = int(self.image_seed.get())
+        except ValueError:
+            seed = -1
+        
+        return {
+            'model': self.image_model.get(),
+            'width': int(size.split('x')[0]),
+            'height': int(size.split('x')[1]),
+            'num_images': num_images,
+            'steps': steps,
+            'cfg_scale': cfg_scale,
+            'sampler': self.sampler.get(),
+            'seed': seed,
+            'use_cache': self.image_use_cache.get()
+        }
+    
+    def generate_images(self):
+        """Tạo ảnh từ prompt"""
+        prompt = self.image_prompt_text.get(1.0, tk.END).strip()
+        if not prompt:
+            messagebox.showwarning("Cảnh báo", "Vui lòng nhập prompt hoặc kịch bản!")
+            return
+        
+        options = self.get_image_options()
+        self.image_cancel = threading.Event()
+        cancel_event = self.image_cancel
         
         self.update_status("Đang tạo ảnh với AI...")
         
@@ -1319,13 +1748,9 @@ class MainApp(ctk.CTk):
                 # Tạo ảnh
                 images = self.image_gen.generate(
                     prompt=prompt,
-                    model=model,
-                    width=int(size.split('x')[0]),
-                    height=int(size.split('x')[1]),
-                    num_images=num_images,
-                    steps=steps,
-                    cfg_scale=cfg_scale,
-                    sampler=sampler
+                    step_callback=self.on_image_step,
+                    cancel_event=cancel_event,
+                    **options
                 )
                 
                 self.after(0, lambda: self.show_generated_images(images))
@@ -1339,9 +1764,111 @@ class MainApp(ctk.CTk):
         threading.Thread(target=generate, daemon=True).start()
     
     def generate_batch_images(self):
-        """Tạo batch ảnh từ nhiều prompt"""
-        # TODO: Implement batch generation
-        messagebox.showinfo("Thông tin", "Tính năng đang phát triển!")
+        """Tạo batch ảnh từ nhiều prompt (mỗi đoạn cách nhau bởi dòng trống là một prompt)"""
+        text = self.image_prompt_text.get(1.0, tk.END).strip()
+        prompts = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+        if not prompts:
+            messagebox.showwarning("Cảnh báo", "Vui lòng nhập prompt hoặc kịch bản!")
+            return
+        
+        options = self.get_image_options()
+        self.image_cancel = threading.Event()
+        cancel_event = self.image_cancel
+        
+        self.update_status(f"Đang tạo ảnh cho {len(prompts)} prompt...")
+        
+        def on_progress(done, total):
+            self.after(0, lambda: self.update_status(f"Đang tạo ảnh... {done}/{total} ảnh"))
+        
+        def generate():
+            try:
+                results = self.image_gen.generate_batch(
+                    prompts,
+                    progress_callback=on_progress,
+                    cancel_event=cancel_event,
+                    step_callback=self.on_image_step,
+                    **options
+                )
+                
+                images = [path for paths in results for path in paths]
+                self.after(0, lambda: self.show_generated_images(images))
+                
+            except Exception as e:
+                self.after(0, lambda: messagebox.showerror(
+                    "Lỗi", 
+                    f"Không thể tạo ảnh: {str(e)}"
+                ))
+        
+        threading.Thread(target=generate, daemon=True).start()
+    
+    def generate_scene_images(self):
+        """Tạo một ảnh cho mỗi cảnh của kịch bản trong ô prompt"""
+        scenes = parse_scene_script(self.image_prompt_text.get(1.0, tk.END))
+        if not scenes:
+            messagebox.showwarning("Cảnh báo", "Không đọc được cảnh nào từ kịch bản!")
+            return
+        
+        options = self.get_image_options()
+        self.image_cancel = threading.Event()
+        cancel_event = self.image_cancel
+        
+        self.update_status(f"Đang tạo ảnh cho {len(scenes)} cảnh...")
+        
+        def on_progress(done, total):
+            self.after(0, lambda: self.update_status(f"Đang tạo ảnh theo cảnh... {done}/{total} ảnh"))
+        
+        def generate():
+            try:
+                results = self.image_gen.generate_scenes(
+                    scenes,
+                    progress_callback=on_progress,
+                    cancel_event=cancel_event,
+                    step_callback=self.on_image_step,
+                    **options
+                )
+                
+                images = [path for paths in results for path in paths]
+                self.after(0, lambda: self.show_generated_images(images))
+            
+            except Exception as e:
+                self.after(0, lambda: messagebox.showerror(
+                    "Lỗi", 
+                    f"Không thể tạo ảnh: {str(e)}"
+                ))
+        
+        threading.Thread(target=generate, daemon=True).start()
+    
+    def cancel_image_generation(self):
+        """Dừng ảnh đang tạo trên server và bỏ các request còn lại của batch"""
+        cancel_event = getattr(self, 'image_cancel', None)
+        if cancel_event is not None and not cancel_event.is_set():
+            cancel_event.set()
+            self.update_status("Đang dừng tạo ảnh...")
+    
+    def on_image_step(self, progress):
+        """Nhận tiến trình từ Stable Diffusion (gọi từ thread poller)"""
+        preview = progress.preview
+        if preview is not None:
+            preview = preview.copy()
+            preview.thumbnail((400, 400))
+        
+        def update():
+            self.update_status(f"Đang tạo ảnh... {progress.describe()}")
+            if preview is not None:
+                self.show_preview_image(preview)
+        
+        self.after(0, update)
+    
+    def show_preview_image(self, img):
+        """Hiển thị ảnh (PIL Image đã thu nhỏ) lên canvas"""
+        photo = ImageTk.PhotoImage(img)
+        
+        self.image_canvas.delete("all")
+        self.image_canvas.create_image(
+            200, 200,
+            image=photo
+        )
+        self.image_canvas.image = photo  # Giữ reference
     
     def show_generated_images(self, image_paths):
         """Hiển thị ảnh đã tạo"""
@@ -1349,29 +1876,39 @@ class MainApp(ctk.CTk):
             messagebox.showwarning("Cảnh báo", "Không tạo được ảnh nào!")
             return
         
-        # Hiển thị ảnh đầu tiên
-        first_image = image_paths[0]
+        # Hiển thị ảnh đầu tiên, tạo sẵn thumbnail cho thư viện ảnh
+        self.show_image_file(image_paths[0])
+        self.gallery_thumbnails.prefetch(image_paths)
         
-        try:
-            img = Image.open(first_image)
-            img.thumbnail((400, 400))
-            
-            # Convert to PhotoImage
-            photo = ImageTk.PhotoImage(img)
-            
-            # Clear canvas và hiển thị ảnh mới
-            self.image_canvas.delete("all")
-            self.image_canvas.create_image(
-                200, 200,
-                image=photo
-            )
-            self.image_canvas.image = photo  # Giữ reference
-            
-            self.update_status(f"Đã tạo {len(image_paths)} ảnh!")
-            messagebox.showinfo("Thành công", f"Đã tạo {len(image_paths)} ảnh!")
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Không thể hiển thị ảnh: {str(e)}")
+        if self.image_gallery is not None and self.image_gallery.winfo_exists():
+            self.image_gallery.refresh()
+        
+        self.update_status(f"Đã tạo {len(image_paths)} ảnh!")
+        messagebox.showinfo("Thành công", f"Đã tạo {len(image_paths)} ảnh!")
+    
+    def show_image_file(self, image_path):
+        """Hiển thị một file ảnh lên canvas (thu nhỏ trên worker thread)"""
+        def on_preview(path, img):
+            if img is None:
+                self.after(0, lambda: self.update_status(f"Không thể hiển thị ảnh: {os.path.basename(path)}"))
+            else:
+                self.after(0, lambda: self.show_preview_image(img))
+        
+        self.preview_cache.request(image_path, on_preview)
+    
+    def open_image_gallery(self):
+        """Mở thư viện ảnh đã tạo"""
+        if self.image_gallery is not None and self.image_gallery.winfo_exists():
+            self.image_gallery.refresh()
+            self.image_gallery.focus()
+            return
+        
+        self.image_gallery = ImageGallery(
+            self,
+            str(self.image_gen.output_dir),
+            self.gallery_thumbnails,
+            on_select=self.show_image_file
+        )
     
     def open_image_folder(self):
         """Mở thư mục chứa ảnh"""
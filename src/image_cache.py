@@ -0,0 +1,245 @@
+import sqlite3
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+import logging
+
+class ImageResultStore:
+    """Lưu ảnh đã tạo kèm đầy đủ tham số và seed thực tế, key là hash tham số
+
+    Ảnh được giữ một bản trong thư mục cache (hard link nếu được) để request
+    lặp lại đúng tham số dùng lại ngay. Tổng dung lượng bị giới hạn, mục lâu
+    không dùng nhất (LRU) bị xóa trước.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, image_dir: Optional[str] = None,
+                 max_size_mb: float = 1000, enabled: bool = True):
+        self.logger = logging.getLogger(__name__)
+        
+        cache_root = Path(__file__).parent.parent / 'cache'
+        if db_path is None:
+            db_path = str(cache_root / 'image_results.sqlite')
+        if image_dir is None:
+            image_dir = str(cache_root / 'images')
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.db_path = db_path
+        self.image_dir = Path(image_dir)
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.enabled = enabled
+        
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                seeds TEXT NOT NULL,
+                info TEXT,
+                file_paths TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)")
+        self._conn.commit()
+        
+        self._total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'ImageResultStore':
+        """Tạo store từ mục "image_cache" trong config.json"""
+        cache_config = config.get('image_cache', {})
+        
+        return cls(
+            db_path=cache_config.get('path'),
+            image_dir=cache_config.get('image_dir'),
+            max_size_mb=cache_config.get('max_size_mb', 1000),
+            enabled=cache_config.get('enabled', True)
+        )
+    
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """Hash của toàn bộ tham số tạo ảnh"""
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def parse_seeds(info: Any, count: int) -> List[int]:
+        """Seed thực tế của từng ảnh từ trường "info" trong response txt2img"""
+        if isinstance(info, str):
+            try:
+                info = json.loads(info)
+            except ValueError:
+                return []
+        if not isinstance(info, dict):
+            return []
+        
+        seeds = info.get('all_seeds') or []
+        if not seeds and info.get('seed') is not None:
+            seeds = [info['seed'] + i for i in range(count)]
+        return [int(seed) for seed in seeds[:count]]
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Kết quả đã lưu ({params, seeds, info, file_paths}), None nếu không có hoặc thiếu file"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT params, seeds, info, file_paths, size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            params, seeds, info, file_paths, size = row
+            file_paths = json.loads(file_paths)
+            
+            if not all(Path(path).is_file() for path in file_paths):
+                self._delete(key, file_paths, size)
+                self._conn.commit()
+                self.misses += 1
+                return None
+            
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        
+        return {
+            'params': json.loads(params),
+            'seeds': json.loads(seeds),
+            'info': json.loads(info) if info else None,
+            'file_paths': file_paths
+        }
+    
+    def add(self, key: str, params: Dict[str, Any], seeds: List[int], info: Optional[Dict[str, Any]],
+            image_paths: List[str]) -> List[str]:
+        """Lưu bản sao các ảnh vừa tạo, trả về đường dẫn ảnh trong cache"""
+        if not self.enabled:
+            return []
+        
+        file_paths = []
+        for i, path in enumerate(image_paths):
+            target = self.image_dir / f"{key[:16]}_{i+1}{Path(path).suffix}"
+            self._link(path, target)
+            file_paths.append(str(target))
+        
+        size = sum(Path(path).stat().st_size for path in file_paths)
+        if size > self.max_size_bytes:
+            for path in file_paths:
+                Path(path).unlink()
+            return []
+        
+        now = time.time()
+        
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._total_size -= row[0]
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, params, seeds, info, file_paths, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(params, ensure_ascii=False), json.dumps(seeds),
+                 json.dumps(info, ensure_ascii=False) if info is not None else None,
+                 json.dumps(file_paths), size, now, now)
+            )
+            self._total_size += size
+            
+            self._evict()
+            self._conn.commit()
+        
+        return file_paths
+    
+    def find_by_path(self, image_path: str) -> Optional[Dict[str, Any]]:
+        """Tham số và seed đã dùng để tạo một ảnh trong cache (để tạo lại đúng ảnh đó)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT params, seeds, file_paths FROM results WHERE file_paths LIKE ?",
+                (f"%{Path(image_path).name}%",)
+            ).fetchall()
+        
+        for params, seeds, file_paths in rows:
+            file_paths = json.loads(file_paths)
+            seeds = json.loads(seeds)
+            if image_path in file_paths:
+                index = file_paths.index(image_path)
+                return {
+                    'params': json.loads(params),
+                    'seed': seeds[index] if index < len(seeds) else None
+                }
+        return None
+    
+    def _link(self, source: str, target: Path):
+        """Hard link ảnh vào cache, copy nếu không link được (khác ổ đĩa...)"""
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+    
+    def _delete(self, key: str, file_paths: List[str], size: int):
+        """Xóa một mục và file của nó (gọi khi đang giữ lock)"""
+        self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+        self._total_size -= size
+        for path in file_paths:
+            if Path(path).is_file():
+                Path(path).unlink()
+    
+    def _evict(self):
+        """Xóa các mục lâu không dùng nhất (LRU) cho tới khi dưới giới hạn dung lượng"""
+        while self._total_size > self.max_size_bytes:
+            rows = self._conn.execute(
+                "SELECT key, file_paths, size FROM results ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            
+            if not rows:
+                self._total_size = 0
+                break
+            
+            for key, file_paths, size in rows:
+                if self._total_size <= self.max_size_bytes:
+                    break
+                self._delete(key, json.loads(file_paths), size)
+                self.logger.debug(f"Evicted image result {key[:12]}")
+    
+    def clear(self):
+        """Xóa toàn bộ kết quả đã lưu"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, file_paths, size FROM results").fetchall()
+            for key, file_paths, size in rows:
+                self._delete(key, json.loads(file_paths), size)
+            self._conn.commit()
+            self._total_size = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss và dung lượng"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        
+        total = self.hits + self.misses
+        
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'size_bytes': self._total_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
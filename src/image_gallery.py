@@ -0,0 +1,217 @@
+import os
+import threading
+import tkinter as tk
+from typing import Dict, List, Optional, Callable, Tuple
+
+import customtkinter as ctk
+from PIL import Image, ImageTk
+
+from thumbnail_cache import ThumbnailCache
+
+# Định dạng ảnh hiển thị trong thư viện
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp'}
+# Kích thước một ô (thumbnail + tên file)
+CELL_WIDTH = 180
+CELL_HEIGHT = 200
+# Số hàng ngoài vùng nhìn thấy vẫn giữ/tải trước khi cuộn
+PRELOAD_ROWS = 1
+
+class ImageGallery(ctk.CTkToplevel):
+    """Cửa sổ thư viện ảnh: chỉ tải thumbnail của các ô đang nhìn thấy"""
+    
+    def __init__(self, master, image_dir: str, thumbnails: ThumbnailCache,
+                 on_select: Optional[Callable[[str], None]] = None):
+        super().__init__(master)
+        
+        self.image_dir = image_dir
+        self.thumbnails = thumbnails
+        self.on_select = on_select
+        
+        self.paths: List[str] = []
+        # Ô đang vẽ: {vị trí: [id item trên canvas]}, ảnh Tk phải giữ reference
+        self._drawn: Dict[int, List[int]] = {}
+        self._photos: Dict[int, ImageTk.PhotoImage] = {}
+        # Yêu cầu thumbnail chưa có kết quả: {vị trí: (đường dẫn, callback)}, hủy khi ô bị xóa
+        self._requests: Dict[int, Tuple[str, Callable]] = {}
+        self._render_scheduled = False
+        self._layout_columns = 0
+        
+        self.title("Thư Viện Ảnh")
+        self.geometry("900x650")
+        
+        top_frame = ctk.CTkFrame(self)
+        top_frame.pack(fill="x", padx=10, pady=(10, 5))
+        
+        self.count_label = ctk.CTkLabel(top_frame, text="Đang đọc thư mục...")
+        self.count_label.pack(side="left", padx=10)
+        
+        ctk.CTkButton(
+            top_frame,
+            text="🔄 Làm Mới",
+            command=self.refresh,
+            width=100
+        ).pack(side="right", padx=5)
+        
+        canvas_frame = ctk.CTkFrame(self)
+        canvas_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        
+        self.canvas = tk.Canvas(canvas_frame, bg="#2B2B2B", highlightthickness=0)
+        self.scrollbar = ctk.CTkScrollbar(canvas_frame, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        
+        self.canvas.bind("<Configure>", lambda e: self._layout())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1))
+        self.canvas.bind("<Button-4>", lambda e: self._scroll(-1))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll(1))
+        
+        self.refresh()
+    
+    def refresh(self):
+        """Đọc lại danh sách ảnh (trên thread riêng), mới nhất trước"""
+        def scan():
+            entries = []
+            try:
+                with os.scandir(self.image_dir) as it:
+                    for entry in it:
+                        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+            
+            entries.sort(reverse=True)
+            paths = [path for _, path in entries]
+            self.after(0, lambda: self.set_paths(paths))
+        
+        threading.Thread(target=scan, daemon=True).start()
+    
+    def set_paths(self, paths: List[str]):
+        """Hiển thị danh sách ảnh mới"""
+        self.paths = paths
+        self.count_label.configure(text=f"{len(paths)} ảnh")
+        
+        self.canvas.delete("all")
+        for index in list(self._requests):
+            self._cancel_request(index)
+        self._drawn.clear()
+        self._photos.clear()
+        self.canvas.yview_moveto(0)
+        self._layout()
+    
+    def _columns(self) -> int:
+        """Số cột theo chiều rộng hiện tại"""
+        return max(1, self.canvas.winfo_width() // CELL_WIDTH)
+    
+    def _layout(self):
+        """Cập nhật vùng cuộn rồi vẽ lại các ô đang nhìn thấy"""
+        rows = (len(self.paths) + self._columns() - 1) // self._columns()
+        self.canvas.configure(scrollregion=(0, 0, self._columns() * CELL_WIDTH, rows * CELL_HEIGHT))
+        
+        # Số cột đổi thì vị trí các ô đổi theo
+        if self._columns() != self._layout_columns:
+            self._layout_columns = self._columns()
+            for index in list(self._drawn):
+                self._forget(index)
+        self._render_visible()
+    
+    def _on_scroll(self, first, last):
+        """yscrollcommand: cập nhật thanh cuộn và gộp các lần vẽ lại"""
+        self.scrollbar.set(first, last)
+        
+        if not self._render_scheduled:
+            self._render_scheduled = True
+            self.after_idle(self._render_visible)
+    
+    def _scroll(self, direction: int):
+        """Cuộn bằng con lăn chuột"""
+        self.canvas.yview_scroll(direction * 3, "units")
+    
+    def _visible_range(self) -> range:
+        """Vị trí các ảnh trong vùng nhìn thấy (cộng thêm PRELOAD_ROWS hàng)"""
+        columns = self._columns()
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        
+        first_row = max(0, int(top // CELL_HEIGHT) - PRELOAD_ROWS)
+        last_row = int(bottom // CELL_HEIGHT) + PRELOAD_ROWS
+        
+        return range(first_row * columns, min(len(self.paths), (last_row + 1) * columns))
+    
+    def _render_visible(self):
+        """Vẽ các ô vừa hiện ra và bỏ ảnh của các ô đã cuộn khỏi tầm nhìn"""
+        self._render_scheduled = False
+        visible = self._visible_range()
+        
+        for index in list(self._drawn):
+            if index not in visible:
+                self._forget(index)
+        
+        for index in visible:
+            if index not in self._drawn:
+                self._draw_cell(index)
+    
+    def _cell_origin(self, index: int):
+        """Tọa độ góc trên trái của ô"""
+        row, column = divmod(index, self._columns())
+        return column * CELL_WIDTH, row * CELL_HEIGHT
+    
+    def _draw_cell(self, index: int):
+        """Vẽ khung ô và yêu cầu thumbnail"""
+        path = self.paths[index]
+        x, y = self._cell_origin(index)
+        name = os.path.basename(path)
+        if len(name) > 24:
+            name = name[:21] + "..."
+        
+        self._drawn[index] = [
+            self.canvas.create_rectangle(x + 8, y + 8, x + CELL_WIDTH - 8, y + CELL_HEIGHT - 32,
+                                         outline="#444444"),
+            self.canvas.create_text(x + CELL_WIDTH // 2, y + CELL_HEIGHT - 18, text=name,
+                                    fill="#DDDDDD", font=("Arial", 9))
+        ]
+        
+        def on_thumbnail(p, image, i=index):
+            self.after(0, lambda: self._show_thumbnail(i, p, image))
+        
+        self._requests[index] = (path, on_thumbnail)
+        self.thumbnails.request(path, on_thumbnail)
+    
+    def _show_thumbnail(self, index: int, path: str, image: Optional[Image.Image]):
+        """Đặt thumbnail vào ô nếu ô vẫn đang hiển thị đúng ảnh đó"""
+        if self._requests.get(index, (None,))[0] == path:
+            del self._requests[index]
+        if image is None or index not in self._drawn or index >= len(self.paths) \
+                or self.paths[index] != path or index in self._photos:
+            return
+        
+        x, y = self._cell_origin(index)
+        photo = ImageTk.PhotoImage(image)
+        self._photos[index] = photo
+        self._drawn[index].append(
+            self.canvas.create_image(x + CELL_WIDTH // 2, y + (CELL_HEIGHT - 24) // 2, image=photo)
+        )
+    
+    def _forget(self, index: int):
+        """Xóa ô khỏi canvas (thumbnail vẫn còn trong cache), bỏ yêu cầu thumbnail chưa xong"""
+        self._cancel_request(index)
+        for item in self._drawn.pop(index, []):
+            self.canvas.delete(item)
+        self._photos.pop(index, None)
+    
+    def _cancel_request(self, index: int):
+        """Hủy yêu cầu thumbnail của ô nếu chưa có kết quả"""
+        request = self._requests.pop(index, None)
+        if request is not None:
+            self.thumbnails.cancel(*request)
+    
+    def _on_click(self, event):
+        """Chọn ảnh được click"""
+        column = int(event.x // CELL_WIDTH)
+        row = int(self.canvas.canvasy(event.y) // CELL_HEIGHT)
+        index = row * self._columns() + column
+        
+        if column < self._columns() and 0 <= index < len(self.paths) and self.on_select:
+            self.on_select(self.paths[index])
@@ -1,24 +1,51 @@
 import requests
-import base64
 from PIL import Image
-from io import BytesIO
 import json
 from pathlib import Path
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Optional, Dict, Any, Union, Callable, Tuple
 import logging
 
+from image_stream import ImageResponseParser
+from sd_progress import GenerationProgress, ProgressPoller, interrupt
+from image_cache import ImageResultStore
+from scene_script import Scene
+
+# Số ảnh tối đa trong một request (batch_size) gửi tới Stable Diffusion
+MAX_SERVER_BATCH = 4
+# Số thread ghi ảnh ra đĩa
+IO_WORKERS = 2
+# Kích thước mỗi lần đọc response txt2img
+RESPONSE_CHUNK_SIZE = 256 * 1024
+
 class ImageGenerator:
     """Tạo ảnh AI từ text prompt"""
     
-    def __init__(self, api_url: str = "http://localhost:7860"):
+    def __init__(self, api_url: str = "http://localhost:7860",
+                 result_store: Optional[ImageResultStore] = None):
         self.api_url = api_url
         self.session = requests.Session()
         self.logger = logging.getLogger(__name__)
         
+        # Ảnh đã tạo theo hash tham số (None = luôn tạo mới)
+        self.result_store = result_store
+        
         # Tạo thư mục output
         self.output_dir = Path(__file__).parent.parent / 'output' / 'images'
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Ghi ảnh chạy nền để request tiếp theo được gửi ngay
+        self._io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS)
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'ImageGenerator':
+        """Tạo generator với cache kết quả từ config.json"""
+        return cls(
+            config.get('sd_api_url', "http://localhost:7860"),
+            result_store=ImageResultStore.from_config(config)
+        )
     
     def check_connection(self) -> bool:
         """Kiểm tra kết nối đến Stable Diffusion"""
@@ -30,9 +57,78 @@ class ImageGenerator:
     
     def generate(self, prompt: str, model: str = "stable-diffusion", 
                  width: int = 512, height: int = 512, num_images: int = 1,
-                 steps: int = 30, cfg_scale: float = 7.5, sampler: str = "Euler a") -> List[str]:
-        """Tạo ảnh từ prompt"""
+                 steps: int = 30, cfg_scale: float = 7.5, sampler: str = "Euler a",
+                 seed: int = -1, use_cache: bool = True,
+                 step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+                 cancel_event: Optional[threading.Event] = None) -> List[str]:
+        """Tạo ảnh từ prompt
+        
+        Request trùng hoàn toàn tham số (kể cả seed) với lần trước trả về ảnh đã lưu,
+        use_cache=False để luôn tạo mới.
+        step_callback(GenerationProgress) nhận bước, ETA và ảnh xem trước trong lúc tạo.
+        Đặt cancel_event để server dừng sớm, khi đó chỉ trả về những ảnh đã xong.
+        """
+        payload = self._build_payload(prompt, model, width, height, num_images, 1, steps, cfg_scale,
+                                      sampler, seed)
+        params = self._result_params(payload, model)
+        
+        cached = self._cached_images(params, use_cache)
+        if cached is not None:
+            self.logger.info(f"Reused {len(cached)} cached images")
+            return cached
+        
+        # Đã hủy trước khi gửi request thì không tạo ảnh nào
+        if cancel_event is not None and cancel_event.is_set():
+            self.logger.info("Generation cancelled before sending txt2img")
+            return []
+        
+        poller = self._start_poller(step_callback, cancel_event)
+        
+        try:
+            result, saved_paths, writes = self._txt2img(payload, num_images)
+            for future in writes:
+                future.result()
+            
+            # Request bị interrupt vẫn trả đủ ảnh nhưng chưa khử nhiễu xong, không lưu cache
+            if not self._cancelled(cancel_event, poller):
+                self._store_result(params, result, saved_paths, num_images)
+            self.logger.info(f"Generated {len(saved_paths)} images")
+            return saved_paths
+        
+        except Exception as e:
+            self.logger.error(f"Generation error: {str(e)}")
+            
+            # Fallback: Create placeholder image
+            return self._create_placeholder_images(num_images, prompt)
         
+        finally:
+            if poller is not None:
+                poller.stop()
+    
+    def get_progress(self, previews: bool = False) -> GenerationProgress:
+        """Tiến trình hiện tại của server"""
+        return ProgressPoller(self.api_url, previews=previews).poll()
+    
+    def interrupt(self) -> bool:
+        """Dừng request đang chạy trên server"""
+        return interrupt(self.session, self.api_url)
+    
+    def _cancelled(self, cancel_event: Optional[threading.Event], poller: Optional[ProgressPoller]) -> bool:
+        """Request đã bị yêu cầu dừng hoặc đã bị interrupt trên server"""
+        return (cancel_event is not None and cancel_event.is_set()) or \
+            (poller is not None and poller.interrupted)
+    
+    def _start_poller(self, step_callback: Optional[Callable[[GenerationProgress], None]],
+                      cancel_event: Optional[threading.Event]) -> Optional[ProgressPoller]:
+        """Chạy poller tiến trình nếu có người nhận tiến trình hoặc có thể bị dừng"""
+        if step_callback is None and cancel_event is None:
+            return None
+        return ProgressPoller(self.api_url, step_callback, cancel_event=cancel_event).start()
+    
+    def _build_payload(self, prompt: str, model: str, width: int, height: int, batch_size: int,
+                       n_iter: int, steps: int, cfg_scale: float, sampler: str,
+                       seed: int = -1) -> Dict[str, Any]:
+        """Tạo payload cho /sdapi/v1/txt2img"""
         # Map model names to actual model names
         model_map = {
             "stable-diffusion": "",
@@ -41,8 +137,7 @@ class ImageGenerator:
             "realistic-vision": "realistic-vision"
         }
         
-        # Prepare payload
-        payload = {
+        return {
             "prompt": prompt,
             "negative_prompt": "blurry, low quality, distorted, ugly, deformed",
             "width": width,
@@ -50,54 +145,90 @@ class ImageGenerator:
             "steps": steps,
             "cfg_scale": cfg_scale,
             "sampler_index": sampler,
-            "batch_size": num_images,
-            "n_iter": 1,
-            "seed": -1,  # Random seed
+            "batch_size": batch_size,
+            "n_iter": n_iter,
+            "seed": seed,  # -1 = random seed
+            # Không cần ảnh grid ghép từ các ảnh trong batch
+            "override_settings": {"return_grid": False},
         }
+    
+    def _result_params(self, payload: Dict[str, Any], model: str) -> Dict[str, Any]:
+        """Tham số dùng làm key cache kết quả"""
+        return {**payload, 'model': model}
+    
+    def _cached_images(self, params: Dict[str, Any], use_cache: bool) -> Optional[List[str]]:
+        """Ảnh đã tạo với đúng tham số này, None nếu chưa có"""
+        if self.result_store is None or not use_cache:
+            return None
+        
+        entry = self.result_store.get(self.result_store.make_key(params))
+        return entry['file_paths'] if entry is not None else None
+    
+    def _store_result(self, params: Dict[str, Any], result: Dict[str, Any], paths: List[str], count: int):
+        """Lưu ảnh vừa tạo cùng seed thực tế (bỏ qua nếu thiếu ảnh do bị dừng)"""
+        if self.result_store is None or len(paths) != count:
+            return
+        
+        info = result.get('info')
+        if isinstance(info, str):
+            try:
+                info = json.loads(info)
+            except ValueError:
+                info = None
+        
+        seeds = self.result_store.parse_seeds(info, count)
+        self.logger.info(f"Seeds used: {seeds}")
         
         try:
-            # Text2Image
-            response = self.session.post(
-                f"{self.api_url}/sdapi/v1/txt2img",
-                json=payload,
-                timeout=300
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                images = result.get("images", [])
-                
-                # Save images
-                saved_paths = []
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                for i, img_data in enumerate(images):
-                    # Decode base64 image
-                    img_bytes = base64.b64decode(img_data.split(",", 1)[0] if "," in img_data else img_data)
-                    
-                    # Create filename
-                    filename = f"ai_image_{timestamp}_{i+1}.png"
-                    filepath = self.output_dir / filename
-                    
-                    # Save image
-                    with open(filepath, "wb") as f:
-                        f.write(img_bytes)
-                    
-                    saved_paths.append(str(filepath))
-                
-                self.logger.info(f"Generated {len(saved_paths)} images")
-                return saved_paths
-                
-            else:
-                error_msg = f"API error: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                raise Exception(error_msg)
-                
+            self.result_store.add(self.result_store.make_key(params), params, seeds, info, paths)
         except Exception as e:
-            self.logger.error(f"Generation error: {str(e)}")
+            self.logger.warning(f"Could not cache generated images: {str(e)}")
+    
+    def _txt2img(self, payload: Dict[str, Any], count: int,
+                 prefix: str = "ai_image") -> Tuple[Dict[str, Any], List[str], List[Future]]:
+        """Gửi request Text2Image, đọc response theo từng phần và ghi ảnh trên I/O pool
+        
+        Trả về (response JSON không gồm ảnh, đường dẫn ảnh, future của các lần ghi).
+        Ảnh grid server ghép thêm ở đầu khi tạo nhiều ảnh sẽ bị bỏ qua.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        paths = []
+        writes = []
+        held = []
+        
+        def write(index: int, buffer: bytearray):
+            path = str(self.output_dir / f"{prefix}_{timestamp}_{index+1}.png")
+            paths.append(path)
+            writes.append(self._io_pool.submit(self._write_image, path, buffer))
+        
+        def on_image(index: int, buffer: bytearray):
+            # Ảnh đầu tiên có thể là grid, chỉ biết khi đọc hết response
+            if count > 1 and index == 0:
+                held.append(buffer)
+            else:
+                write(index, buffer)
+        
+        with self.session.post(f"{self.api_url}/sdapi/v1/txt2img", json=payload,
+                               timeout=300, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API error: {response.status_code} - {response.text}")
             
-            # Fallback: Create placeholder image
-            return self._create_placeholder_images(num_images, prompt)
+            parser = ImageResponseParser(on_image)
+            for chunk in response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE):
+                parser.feed(chunk)
+            result = parser.close()
+        
+        if held and parser.image_count <= count:
+            write(0, held[0])
+            paths.insert(0, paths.pop())
+            writes.insert(0, writes.pop())
+        
+        return result, paths, writes
+    
+    def _write_image(self, path: str, buffer: bytearray):
+        """Ghi ảnh đã decode ra file (chạy trên I/O pool)"""
+        with open(path, "wb") as f:
+            f.write(memoryview(buffer))
     
     def _create_placeholder_images(self, num_images: int, prompt: str) -> List[str]:
         """Tạo ảnh placeholder khi API không hoạt động"""
@@ -117,17 +248,159 @@ class ImageGenerator:
         self.logger.warning(f"Created {num_images} placeholder images")
         return saved_paths
     
-    def generate_batch(self, prompts: List[str], **kwargs) -> Dict[str, List[str]]:
-        """Tạo batch ảnh từ nhiều prompt"""
-        results = {}
+    def generate_batch(self, prompts: List[Union[str, Dict[str, Any]]],
+                       progress_callback: Optional[Callable[[int, int], None]] = None,
+                       cancel_event: Optional[threading.Event] = None,
+                       step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+                       max_batch_size: int = MAX_SERVER_BATCH, use_cache: bool = True,
+                       **kwargs) -> List[List[str]]:
+        """Tạo ảnh cho nhiều prompt, trả về danh sách ảnh theo đúng thứ tự prompt
         
-        for i, prompt in enumerate(prompts):
-            try:
-                images = self.generate(prompt, **kwargs)
-                results[prompt[:50]] = images
-                self.logger.info(f"Generated images for prompt {i+1}/{len(prompts)}")
-            except Exception as e:
-                self.logger.error(f"Error generating for prompt {i+1}: {str(e)}")
-                results[prompt[:50]] = []
+        Mỗi phần tử của prompts là chuỗi prompt hoặc dict gồm "prompt" và các tham số
+        riêng của generate; kwargs là tham số chung. Các prompt cùng tham số được xếp
+        liền nhau, prompt trùng nhau được gộp thành một request (batch_size/n_iter).
+        Request tiếp theo được gửi ngay khi có kết quả, việc decode và lưu ảnh chạy
+        trên thread riêng. Request đã có kết quả trong cache dùng lại ảnh cũ (trừ khi
+        use_cache=False). Đặt cancel_event để dừng request đang chạy và bỏ các request
+        còn lại. progress_callback(số ảnh đã xong, tổng số ảnh), step_callback như generate.
+        """
+        defaults = {
+            'model': "stable-diffusion", 'width': 512, 'height': 512, 'num_images': 1,
+            'steps': 30, 'cfg_scale': 7.5, 'sampler': "Euler a", 'seed': -1
+        }
+        
+        # Gom nhóm: {tham số: {prompt: [(vị trí prompt, số ảnh)]}}
+        groups: Dict[tuple, Dict[str, List[tuple]]] = {}
+        for index, item in enumerate(prompts):
+            params = {**defaults, **kwargs, **(item if isinstance(item, dict) else {'prompt': item})}
+            prompt = params.pop('prompt')
+            num_images = max(1, int(params.pop('num_images')))
+            key = tuple(sorted(params.items()))
+            groups.setdefault(key, {}).setdefault(prompt, []).append((index, num_images))
+        
+        # Mỗi request: (prompt, tham số, batch_size, n_iter, [(vị trí prompt, số ảnh)])
+        requests_plan = []
+        for key, by_prompt in groups.items():
+            for prompt, targets in by_prompt.items():
+                requests_plan.extend(self._plan_requests(prompt, dict(key), targets, max_batch_size))
+        
+        results: List[List[str]] = [[] for _ in prompts]
+        total = sum(batch_size * n_iter for _, _, batch_size, n_iter, _ in requests_plan)
+        done = [0]
+        lock = threading.Lock()
         
+        def distribute(paths: List[str], targets: List[tuple]):
+            with lock:
+                for index, n in targets:
+                    results[index].extend(paths[:n])
+                    paths = paths[n:]
+        
+        def image_written(_future):
+            with lock:
+                done[0] += 1
+                current = done[0]
+            
+            if progress_callback:
+                progress_callback(current, total)
+        
+        writes = []
+        # Kết quả chờ lưu cache khi ảnh đã ghi xong: (tham số, response, ảnh, số ảnh)
+        to_store = []
+        poller = self._start_poller(step_callback, cancel_event)
+        
+        try:
+            for i, (prompt, params, batch_size, n_iter, targets) in enumerate(requests_plan):
+                if cancel_event is not None and cancel_event.is_set():
+                    self.logger.info(f"Batch cancelled after {i}/{len(requests_plan)} requests")
+                    break
+                
+                count = batch_size * n_iter
+                payload = self._build_payload(prompt, batch_size=batch_size, n_iter=n_iter, **params)
+                result_params = self._result_params(payload, params['model'])
+                
+                cached = self._cached_images(result_params, use_cache)
+                if cached is not None:
+                    paths, request_writes = cached, []
+                else:
+                    # Ảnh được ghi trên I/O pool trong khi request tiếp theo được gửi đi
+                    try:
+                        result, paths, request_writes = self._txt2img(payload, count)
+                        if not self._cancelled(cancel_event, poller):
+                            to_store.append((result_params, result, paths, count))
+                    except Exception as e:
+                        self.logger.error(f"Error generating batch request {i+1}: {str(e)}")
+                        paths, request_writes = [], []
+                
+                if not paths and cached is None and not (cancel_event is not None and cancel_event.is_set()):
+                    paths = self._create_placeholder_images(count, prompt)
+                
+                # Ảnh có sẵn (cache hoặc placeholder) được tính là xong ngay
+                if paths and not request_writes:
+                    with lock:
+                        done[0] += len(paths)
+                        current = done[0]
+                    if progress_callback:
+                        progress_callback(current, total)
+                
+                distribute(paths, targets)
+                
+                for future in request_writes:
+                    future.add_done_callback(image_written)
+                writes.extend(request_writes)
+        finally:
+            if poller is not None:
+                poller.stop()
+        
+        for future in writes:
+            future.result()
+        
+        for result_params, result, paths, count in to_store:
+            self._store_result(result_params, result, paths, count)
+        
+        self.logger.info(f"Generated {done[0]}/{total} images for {len(prompts)} prompts")
         return results
+    
+    def generate_scenes(self, scenes: List[Scene], **kwargs) -> List[List[str]]:
+        """Tạo ảnh cho từng cảnh của kịch bản (một job mỗi cảnh) trong một batch
+        
+        kwargs giống generate_batch. Trả về danh sách ảnh theo thứ tự cảnh.
+        """
+        prompts = [scene.image_prompt() for scene in scenes]
+        empty = [scene.index for scene, prompt in zip(scenes, prompts) if not prompt]
+        if empty:
+            self.logger.warning(f"Scenes without prompt skipped: {empty}")
+        
+        results = self.generate_batch([p for p in prompts if p], **kwargs)
+        
+        # Trả về đúng vị trí cảnh, cảnh không có prompt nhận danh sách rỗng
+        iterator = iter(results)
+        return [next(iterator) if prompt else [] for prompt in prompts]
+    
+    def _plan_requests(self, prompt: str, params: Dict[str, Any], targets: List[tuple],
+                       max_batch_size: int) -> List[tuple]:
+        """Chia tổng số ảnh của một prompt thành các request batch_size x n_iter"""
+        total = sum(n for _, n in targets)
+        max_batch_size = max(1, max_batch_size)
+        plan = []
+        
+        full_iters, remainder = divmod(total, max_batch_size)
+        remaining_targets = list(targets)
+        
+        for batch_size, n_iter in ((max_batch_size, full_iters), (remainder, 1)):
+            if not batch_size or not n_iter:
+                continue
+            
+            # Tách danh sách prompt gốc theo số ảnh của request này
+            count = batch_size * n_iter
+            request_targets = []
+            while count and remaining_targets:
+                index, n = remaining_targets.pop(0)
+                take = min(n, count)
+                request_targets.append((index, take))
+                if n > take:
+                    remaining_targets.insert(0, (index, n - take))
+                count -= take
+            
+            plan.append((prompt, params, batch_size, n_iter, request_targets))
+        
+        return plan
@@ -0,0 +1,161 @@
+import binascii
+import codecs
+import json
+import re
+from typing import Dict, Any, Callable
+
+# Ký tự kết thúc/escape trong chuỗi base64 của JSON
+STRING_STOP_PATTERN = re.compile(r'["\\]')
+# Số ký tự đầu chuỗi cần có để nhận ra tiền tố data URI ("data:image/png;base64,")
+DATA_URI_PROBE = 64
+
+class ImageResponseParser:
+    """Đọc response JSON của txt2img theo từng phần mà không giữ toàn bộ chuỗi base64
+
+    Mỗi phần tử của mảng "images" được decode dần vào một bytearray riêng và
+    giao cho on_image(vị trí, bytearray) ngay khi chuỗi kết thúc. Phần JSON còn
+    lại (parameters, info) được giữ để parse khi gọi close(), với "images": [].
+    """
+    
+    def __init__(self, on_image: Callable[[int, bytearray], None]):
+        self.on_image = on_image
+        self.image_count = 0
+        
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._rest = []
+        self._state = "json"
+        self._carry = ""
+        
+        # Theo dõi key ở cấp 1 để nhận ra "images": [
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._last_key = None
+        self._expect_images = False
+        
+        self._buffer = bytearray()
+        self._b64_tail = ""
+        self._header_checked = False
+    
+    def feed(self, chunk: bytes):
+        """Đưa thêm một phần response (bytes)"""
+        text = self._carry + self._decoder.decode(chunk)
+        self._carry = ""
+        i = 0
+        
+        while i < len(text):
+            if self._state == "image":
+                match = STRING_STOP_PATTERN.search(text, i)
+                end = match.start() if match else len(text)
+                self._add_base64(text[i:end])
+                i = end
+                
+                if match is None:
+                    break
+                
+                if text[i] == '\\':
+                    # Escape bị cắt giữa hai chunk
+                    if i + 1 >= len(text):
+                        self._carry = '\\'
+                        break
+                    self._add_base64(text[i + 1] if text[i + 1] == '/' else '')
+                    i += 2
+                    continue
+                
+                self._finish_image()
+                self._state = "array"
+                i += 1
+                continue
+            
+            c = text[i]
+            i += 1
+            
+            if self._state == "array":
+                if c == '"':
+                    self._state = "image"
+                elif c == ']':
+                    self._state = "json"
+                    self._rest.append('[]')
+                continue
+            
+            self._scan_json(c)
+    
+    def _scan_json(self, c: str):
+        """Xử lý một ký tự ngoài mảng images"""
+        if self._in_string:
+            self._rest.append(c)
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._depth == 1:
+                    self._last_key = ''.join(self._string_chars)
+            elif self._depth == 1:
+                self._string_chars.append(c)
+            return
+        
+        if self._expect_images and not c.isspace():
+            self._expect_images = False
+            if c == '[':
+                self._state = "array"
+                return
+        
+        self._rest.append(c)
+        
+        if c == '"':
+            self._in_string = True
+            self._string_chars = []
+        elif c in '{[':
+            self._depth += 1
+        elif c in '}]':
+            self._depth -= 1
+        elif c == ':' and self._depth == 1 and self._last_key == "images":
+            self._expect_images = True
+        elif c == ',':
+            self._last_key = None
+    
+    def _add_base64(self, text: str):
+        """Decode phần base64 đã đủ bội số của 4 ký tự"""
+        self._b64_tail += text
+        
+        if not self._header_checked:
+            if len(self._b64_tail) < DATA_URI_PROBE:
+                return
+            self._strip_data_uri()
+        
+        usable = len(self._b64_tail) // 4 * 4
+        if usable:
+            self._buffer += binascii.a2b_base64(self._b64_tail[:usable])
+            self._b64_tail = self._b64_tail[usable:]
+    
+    def _strip_data_uri(self):
+        """Bỏ tiền tố "data:...;base64," nếu có"""
+        self._header_checked = True
+        if self._b64_tail.startswith('data:') and ',' in self._b64_tail:
+            self._b64_tail = self._b64_tail.split(',', 1)[1]
+    
+    def _finish_image(self):
+        """Kết thúc một ảnh và giao bytearray cho on_image"""
+        if not self._header_checked:
+            self._strip_data_uri()
+        
+        if self._b64_tail:
+            padding = '=' * (-len(self._b64_tail) % 4)
+            self._buffer += binascii.a2b_base64(self._b64_tail + padding)
+        
+        buffer = self._buffer
+        self._buffer = bytearray()
+        self._b64_tail = ""
+        self._header_checked = False
+        
+        self.on_image(self.image_count, buffer)
+        self.image_count += 1
+    
+    def close(self) -> Dict[str, Any]:
+        """Parse phần JSON còn lại (không gồm ảnh)"""
+        self.feed(b'')
+        self._rest.append(self._decoder.decode(b'', final=True))
+        return json.loads(''.join(self._rest))
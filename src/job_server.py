@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job server HTTP cục bộ: chia sẻ một backend (LM Studio, Stable Diffusion) cho nhiều người dùng/script
+
+Chạy:
+    python src/job_server.py --host 127.0.0.1 --port 8000
+"""
+
+import sys
+import json
+import uuid
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Callable
+
+# Thêm thư mục hiện tại vào PATH
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import aiofiles
+import uvicorn
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from api_client import LMStudioClient, is_error_response
+from llm_cache import CompletionCache
+from story_editor import StoryEditor
+from srt_translator import SRTTranslator
+from video_downloader import VideoDownloader
+from image_generator import ImageGenerator
+from scene_script import parse_scene_script, scenes_to_json
+from storyboard_pipeline import StoryboardPipeline
+from download_manager import DownloadManager
+from subtitle_pipeline import SubtitlePipeline
+from llm_scheduler import LLMScheduler, request_context
+
+# Kích thước mỗi lần ghi khi nhận file upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Loại job dừng được khi đang chạy (job đang chờ thì loại nào cũng hủy được)
+CANCELLABLE_KINDS = {"image_generate", "scene_images", "storyboard"}
+
+class Job:
+    """Một job trong hàng đợi"""
+    
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result_text: Optional[str] = None
+        self.result_files: List[str] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Job đang chờ bị bỏ, job tạo ảnh đang chạy dừng sớm khi event được đặt
+        self.cancel_event = threading.Event()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Thông tin job trả về cho client"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'message': self.message,
+            'error': self.error,
+            'result_text': self.result_text,
+            'result_files': [f"/jobs/{self.id}/files/{i}" for i in range(len(self.result_files))],
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class JobManager:
+    """Hàng đợi job chạy trên worker pool, dùng chung các client AI"""
+    
+    def __init__(self, config: Dict[str, Any], work_dir: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        
+        if work_dir is None:
+            work_dir = str(Path(__file__).parent.parent / 'output' / 'jobs')
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Job của nhiều người dùng được chia lượt công bằng trên các slot của LM Studio
+        self.llm_scheduler = LLMScheduler.from_config(config)
+        self.lm_client = LMStudioClient(
+            config.get('lm_studio_url', "http://localhost:1234/v1"),
+            cache=CompletionCache.from_config(config),
+            scheduler=self.llm_scheduler
+        )
+        self.editor = StoryEditor(self.lm_client)
+        self.translator = SRTTranslator(self.lm_client)
+        self.video_dl = VideoDownloader.from_config(config)
+        self.image_gen = ImageGenerator.from_config(config)
+        self.storyboard = StoryboardPipeline(self.editor, self.image_gen)
+        self.translation_workers = config.get('translation_workers', 1)
+        self.config = config
+        
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=config.get('job_workers', 2))
+    
+    def submit(self, job: Job, work: Callable[[Job], None]) -> Job:
+        """Đưa job vào hàng đợi"""
+        with self._lock:
+            self.jobs[job.id] = job
+        
+        self._executor.submit(self._run, job, work)
+        return job
+    
+    def get(self, job_id: str) -> Job:
+        """Lấy job theo id"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        
+        if job is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy job")
+        return job
+    
+    def list(self) -> List[Job]:
+        """Danh sách job, mới nhất trước"""
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)
+    
+    def queue_depth(self) -> int:
+        """Số job đang chờ"""
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job.status == "queued")
+    
+    def cancel(self, job: Job):
+        """Hủy job đang chờ, hoặc dừng job tạo ảnh đang chạy"""
+        with self._lock:
+            if job.status not in ("queued", "running"):
+                raise HTTPException(status_code=409, detail=f"Job đã kết thúc ({job.status})")
+            if job.status == "running" and job.kind not in CANCELLABLE_KINDS:
+                raise HTTPException(status_code=409, detail=f"Không thể dừng job {job.kind} đang chạy")
+            
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+    
+    def job_dir(self, job: Job) -> Path:
+        """Thư mục làm việc riêng của job"""
+        path = self.work_dir / job.id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+    
+    def _run(self, job: Job, work: Callable[[Job], None]):
+        """Chạy job trong worker thread"""
+        with self._lock:
+            # Job bị hủy khi còn trong hàng đợi
+            if job.cancel_event.is_set():
+                return
+            job.status = "running"
+            job.started_at = time.time()
+        
+        try:
+            # Request LLM của job được gắn với job để scheduler chia lượt giữa các job
+            with request_context(job=job.id):
+                work(job)
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+            else:
+                job.status = "done"
+                job.progress = 1.0
+        except Exception as e:
+            self.logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+    
+    def shutdown(self):
+        """Dừng worker pool"""
+        self._executor.shutdown(wait=False)
+
+class StoryEditRequest(BaseModel):
+    story: str
+    edit_type: str = "Chỉnh văn phong"
+    length_preference: str = "giữ nguyên"
+
+class VideoDownloadRequest(BaseModel):
+    url: str
+    quality: str = "best"
+    output_format: str = "mp4"
+    subtitles: bool = True
+    audio_only: bool = False
+    profile: Optional[str] = None
+
+class VideoTranslateRequest(BaseModel):
+    urls: List[str]
+    quality: str = "best"
+    output_format: str = "mp4"
+    audio_only: bool = False
+    profile: Optional[str] = None
+    tgt_lang: str = "vi"
+    style: str = "hiện đại"
+
+class ImageGenerateRequest(BaseModel):
+    prompt: str
+    model: str = "stable-diffusion"
+    width: int = 512
+    height: int = 512
+    num_images: int = 1
+    steps: int = 30
+    cfg_scale: float = 7.5
+    sampler: str = "Euler a"
+    seed: int = -1
+    use_cache: bool = True
+
+class SceneImagesRequest(BaseModel):
+    script: str
+    model: str = "stable-diffusion"
+    width: int = 512
+    height: int = 512
+    num_images: int = 1
+    steps: int = 30
+    cfg_scale: float = 7.5
+    sampler: str = "Euler a"
+    use_cache: bool = True
+
+class StoryboardRequest(BaseModel):
+    story: str
+    num_scenes: int = 5
+    style: str = "anime"
+    detail_level: str = "chi tiết"
+    edit_type: Optional[str] = None
+    length_preference: str = "giữ nguyên"
+    model: str = "stable-diffusion"
+    width: int = 512
+    height: int = 512
+    steps: int = 30
+    cfg_scale: float = 7.5
+    sampler: str = "Euler a"
+
+def create_app(config: Dict[str, Any], work_dir: Optional[str] = None) -> FastAPI:
+    """Tạo ứng dụng FastAPI"""
+    manager = JobManager(config, work_dir)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        manager.shutdown()
+    
+    app = FastAPI(title=config.get('app_name', "AI Story Creator Pro") + " Job Server", lifespan=lifespan)
+    app.state.manager = manager
+    
+    @app.get("/health")
+    def health():
+        return {
+            'lm_studio': manager.lm_client.check_connection(),
+            'queued_jobs': manager.queue_depth(),
+            'llm_queue': manager.llm_scheduler.stats() if manager.llm_scheduler else None
+        }
+    
+    @app.get("/jobs")
+    def list_jobs():
+        return [job.to_dict() for job in manager.list()]
+    
+    @app.get("/jobs/{job_id}")
+    def get_job(job_id: str):
+        return manager.get(job_id).to_dict()
+    
+    @app.post("/jobs/{job_id}/cancel")
+    def cancel_job(job_id: str):
+        job = manager.get(job_id)
+        manager.cancel(job)
+        return job.to_dict()
+    
+    @app.get("/jobs/{job_id}/files/{index}")
+    def download_result(job_id: str, index: int):
+        job = manager.get(job_id)
+        if job.status != "done":
+            raise HTTPException(status_code=409, detail=f"Job đang ở trạng thái {job.status}")
+        if not 0 <= index < len(job.result_files):
+            raise HTTPException(status_code=404, detail="Không có file kết quả")
+        
+        path = Path(job.result_files[index])
+        return FileResponse(str(path), filename=path.name)
+    
+    @app.post("/jobs/story/edit", status_code=202)
+    def edit_story(request: StoryEditRequest):
+        def work(job: Job):
+            result = manager.editor.edit_story(
+                story=request.story,
+                edit_type=request.edit_type,
+                length_preference=request.length_preference
+            )
+            # Lỗi LM Studio trả về dạng text, không được coi là truyện đã chỉnh sửa
+            if is_error_response(result):
+                raise RuntimeError(f"LM Studio lỗi khi chỉnh sửa truyện: {result.strip()}")
+            job.result_text = result
+        
+        return manager.submit(Job("story_edit", {'edit_type': request.edit_type}), work).to_dict()
+    
+    @app.post("/jobs/srt/translate", status_code=202)
+    async def translate_srt(file: UploadFile = File(...),
+                            src_lang: str = Form("auto"),
+                            tgt_lang: str = Form("vi"),
+                            style: str = Form("hiện đại"),
+                            batch_size: int = Form(10),
+                            token_budget: int = Form(0)):
+        job = Job("srt_translate", {'filename': file.filename, 'tgt_lang': tgt_lang})
+        input_path = manager.job_dir(job) / Path(file.filename or "input.srt").name
+        
+        # Ghi file upload theo từng phần, không đọc toàn bộ vào bộ nhớ
+        async with aiofiles.open(input_path, 'wb') as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await f.write(chunk)
+        
+        def work(job: Job):
+            def on_progress(current, total):
+                job.progress = current / total if total else 0
+                job.message = f"{current}/{total} batch"
+            
+            untranslated = []
+            result = manager.translator.translate_file(
+                file_path=str(input_path),
+                src_lang=src_lang,
+                tgt_lang=tgt_lang,
+                style=style,
+                batch_size=batch_size,
+                progress_callback=on_progress,
+                max_workers=manager.translation_workers,
+                token_budget=token_budget or None,
+                untranslated_callback=untranslated.extend
+            )
+            
+            if untranslated:
+                job.message = f"{len(untranslated)} câu không dịch được, giữ nguyên câu gốc: {untranslated}"
+            
+            output_path = input_path.with_name(f"{input_path.stem}_translated{input_path.suffix}")
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(result)
+            
+            job.result_files = [str(output_path)]
+        
+        return manager.submit(job, work).to_dict()
+    
+    @app.post("/jobs/video/download", status_code=202)
+    def download_video(request: VideoDownloadRequest):
+        def work(job: Job):
+            def on_progress(event):
+                if event.fraction is not None:
+                    job.progress = event.fraction
+                job.message = event.describe()
+            
+            output_file = manager.video_dl.download(
+                url=request.url,
+                quality=request.quality,
+                output_format=request.output_format,
+                output_path=str(manager.job_dir(job)),
+                subtitles=request.subtitles,
+                audio_only=request.audio_only,
+                profile=request.profile,
+                progress_callback=on_progress
+            )
+            
+            job.result_files = [output_file]
+        
+        return manager.submit(Job("video_download", {'url': request.url}), work).to_dict()
+    
+    @app.post("/jobs/video/translate", status_code=202)
+    def download_and_translate(request: VideoTranslateRequest):
+        def work(job: Job):
+            job_dir = manager.job_dir(job)
+            pipeline = SubtitlePipeline.from_config(
+                manager.translator,
+                manager.config,
+                tgt_lang=request.tgt_lang,
+                style=request.style
+            )
+            submitted = set()
+            submit_lock = threading.Lock()
+            
+            # Phụ đề của video vừa tải được dịch trong khi các video khác vẫn đang tải
+            def on_item(item):
+                if item.status != "done":
+                    return
+                with submit_lock:
+                    if item.id in submitted:
+                        return
+                    submitted.add(item.id)
+                pipeline.submit(item.output_file)
+            
+            downloads = DownloadManager.from_config(
+                manager.video_dl,
+                manager.config,
+                state_path=str(job_dir / 'download_queue.json'),
+                item_callback=on_item
+            )
+            
+            def update_progress():
+                summary = downloads.summary()
+                subtitles = pipeline.summary()
+                job.progress = downloads.overall_progress()
+                job.message = (f"{summary['done']}/{len(downloads.items)} video, "
+                               f"{subtitles['done']} phụ đề đã dịch, {subtitles['translating']} đang dịch")
+            
+            downloads.progress_callback = lambda item, overall: update_progress()
+            downloads.add(request.urls, quality=request.quality, output_format=request.output_format,
+                          output_path=str(job_dir), subtitles=True, audio_only=request.audio_only,
+                          profile=request.profile)
+            
+            try:
+                downloads.start()
+                downloads.wait()
+                # item_callback của video cuối có thể chưa chạy khi wait() trả về
+                for item in list(downloads.items):
+                    on_item(item)
+                pipeline.wait()
+            finally:
+                pipeline.shutdown()
+            
+            update_progress()
+            job.result_files = [item.output_file for item in downloads.items if item.status == "done"]
+            job.result_files += [task.output_file for task in pipeline.tasks if task.status == "done"]
+            job.result_text = json.dumps({
+                'videos': [item.to_dict() for item in downloads.items],
+                'subtitles': [task.to_dict() for task in pipeline.tasks]
+            }, ensure_ascii=False)
+        
+        return manager.submit(Job("video_translate", {'urls': request.urls}), work).to_dict()
+    
+    @app.post("/jobs/images/generate", status_code=202)
+    def generate_images(request: ImageGenerateRequest):
+        def work(job: Job):
+            def on_step(progress):
+                job.progress = progress.fraction
+                job.message = progress.describe()
+            
+            job.result_files = manager.image_gen.generate(
+                prompt=request.prompt,
+                model=request.model,
+                width=request.width,
+                height=request.height,
+                num_images=request.num_images,
+                steps=request.steps,
+                cfg_scale=request.cfg_scale,
+                sampler=request.sampler,
+                seed=request.seed,
+                use_cache=request.use_cache,
+                step_callback=on_step,
+                cancel_event=job.cancel_event
+            )
+        
+        return manager.submit(Job("image_generate", {'prompt': request.prompt[:100]}), work).to_dict()
+    
+    @app.post("/jobs/images/scenes", status_code=202)
+    def generate_scene_images(request: SceneImagesRequest):
+        try:
+            scenes = parse_scene_script(request.script)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Kịch bản không hợp lệ: {str(e)}")
+        if not scenes:
+            raise HTTPException(status_code=422, detail="Không đọc được cảnh nào từ kịch bản")
+        
+        def work(job: Job):
+            def on_progress(done, total):
+                job.progress = done / total if total else 0.0
+                job.message = f"{done}/{total} ảnh"
+            
+            results = manager.image_gen.generate_scenes(
+                scenes,
+                progress_callback=on_progress,
+                cancel_event=job.cancel_event,
+                model=request.model,
+                width=request.width,
+                height=request.height,
+                num_images=request.num_images,
+                steps=request.steps,
+                cfg_scale=request.cfg_scale,
+                sampler=request.sampler,
+                use_cache=request.use_cache
+            )
+            
+            # result_text: kịch bản JSON, file kết quả theo thứ tự cảnh
+            job.result_text = scenes_to_json(scenes)
+            job.result_files = [path for paths in results for path in paths]
+        
+        return manager.submit(Job("scene_images", {'scenes': len(scenes)}), work).to_dict()
+    
+    @app.post("/jobs/storyboard", status_code=202)
+    def run_storyboard(request: StoryboardRequest):
+        def work(job: Job):
+            def on_status(stage, message):
+                job.message = message
+            
+            def on_scene(scene, paths):
+                job.progress = min(scene.index / max(request.num_scenes, 1), 0.99)
+            
+            state = manager.storyboard.run(
+                request.story,
+                num_scenes=request.num_scenes,
+                style=request.style,
+                detail_level=request.detail_level,
+                edit_type=request.edit_type,
+                length_preference=request.length_preference,
+                image_options={
+                    'model': request.model,
+                    'width': request.width,
+                    'height': request.height,
+                    'steps': request.steps,
+                    'cfg_scale': request.cfg_scale,
+                    'sampler': request.sampler
+                },
+                scene_callback=on_scene,
+                status_callback=on_status,
+                cancel_event=job.cancel_event
+            )
+            
+            # result_text: trạng thái pipeline (kịch bản, cảnh, thời gian từng bước)
+            job.result_text = json.dumps(state.to_dict(), ensure_ascii=False)
+            job.result_files = [path for index in sorted(state.images) for path in state.images[index]]
+        
+        return manager.submit(Job("storyboard", {'num_scenes': request.num_scenes}), work).to_dict()
+    
+    return app
+
+def main():
+    """Khởi chạy job server"""
+    parser = argparse.ArgumentParser(description="Job server HTTP cho AI Story Creator Pro")
+    parser.add_argument('--host', default='127.0.0.1', help="Địa chỉ lắng nghe")
+    parser.add_argument('--port', type=int, default=8000, help="Cổng lắng nghe")
+    parser.add_argument('--config', default=str(current_dir.parent / 'config.json'), help="File cấu hình")
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    
+    config = {}
+    if Path(args.config).exists():
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
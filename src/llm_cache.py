@@ -0,0 +1,165 @@
+import sqlite3
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+import logging
+
+class CompletionCache:
+    """Cache kết quả LLM trên đĩa (SQLite), key là hash nội dung request"""
+    
+    def __init__(self, db_path: Optional[str] = None, max_size_mb: float = 500,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600, enabled: bool = True):
+        self.logger = logging.getLogger(__name__)
+        
+        if db_path is None:
+            db_path = str(Path(__file__).parent.parent / 'cache' / 'llm_cache.sqlite')
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.db_path = db_path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        
+        self.hits = 0
+        self.misses = 0
+        
+        # Một connection dùng chung cho mọi thread, được bảo vệ bởi lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON completions (accessed_at)")
+        self._conn.commit()
+        
+        self._total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()[0]
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'CompletionCache':
+        """Tạo cache từ mục "llm_cache" trong config.json"""
+        cache_config = config.get('llm_cache', {})
+        ttl_hours = cache_config.get('ttl_hours', 168)
+        
+        return cls(
+            db_path=cache_config.get('path'),
+            max_size_mb=cache_config.get('max_size_mb', 500),
+            ttl_seconds=ttl_hours * 3600 if ttl_hours else None,
+            enabled=cache_config.get('enabled', True)
+        )
+    
+    @staticmethod
+    def make_key(endpoint: str, payload: Dict[str, Any], model: Optional[str] = None) -> str:
+        """Tạo key từ endpoint, payload (đã bỏ cờ stream) và model sinh ra kết quả"""
+        data = {k: v for k, v in payload.items() if k != "stream"}
+        if model and "model" not in data:
+            data["model"] = model
+        raw = json.dumps({"endpoint": endpoint, "payload": data}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Lấy kết quả đã cache, None nếu không có hoặc đã hết hạn"""
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            value, size, created_at = row
+            
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_size -= size
+                self.misses += 1
+                return None
+            
+            self._conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+    
+    def set(self, key: str, value: str):
+        """Lưu kết quả vào cache rồi dọn bớt nếu vượt dung lượng"""
+        if not self.enabled:
+            return
+        
+        size = len(value.encode('utf-8'))
+        if size > self.max_size_bytes:
+            return
+        
+        now = time.time()
+        
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._total_size -= row[0]
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._total_size += size
+            
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """Xóa các mục lâu không dùng nhất (LRU) cho tới khi dưới giới hạn dung lượng"""
+        while self._total_size > self.max_size_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM completions ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            
+            if not rows:
+                self._total_size = 0
+                break
+            
+            for key, size in rows:
+                if self._total_size <= self.max_size_bytes:
+                    break
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._total_size -= size
+                self.logger.debug(f"Evicted cache entry {key[:12]}")
+    
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self._total_size = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss và dung lượng cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        
+        total = self.hits + self.misses
+        
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'size_bytes': self._total_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
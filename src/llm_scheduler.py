@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Tuple, Iterator
+import logging
+
+# Loại request theo thứ tự ưu tiên: chỉnh sửa trực tiếp (tab 1), viết kịch bản (tab 4), dịch SRT hàng loạt (tab 2)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_SCRIPT = "script"
+PRIORITY_BULK = "bulk"
+PRIORITY_CLASSES = [PRIORITY_INTERACTIVE, PRIORITY_SCRIPT, PRIORITY_BULK]
+
+# Số request LM Studio xử lý cùng lúc (nên bằng số slot/parallel của server)
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Số slot chỉ dành cho request interactive khi server có nhiều slot
+DEFAULT_RESERVED_INTERACTIVE = 1
+
+# Job mặc định của request không gắn job
+DEFAULT_JOB = "default"
+
+# Loại ưu tiên và job của các request gửi từ thread hiện tại
+_context = threading.local()
+
+def current_context() -> Tuple[Optional[str], Optional[str]]:
+    """(loại ưu tiên, job) đang gắn với thread hiện tại"""
+    return getattr(_context, 'priority', None), getattr(_context, 'job', None)
+
+@contextmanager
+def request_context(priority: Optional[str] = None, job: Optional[str] = None) -> Iterator[None]:
+    """Gắn loại ưu tiên/job cho các request LLM gửi từ thread hiện tại (None = giữ giá trị ngoài)"""
+    previous = current_context()
+    _context.priority = priority or previous[0]
+    _context.job = job or previous[1]
+    try:
+        yield
+    finally:
+        _context.priority, _context.job = previous
+
+def bind_context(func: Callable) -> Callable:
+    """Giữ loại ưu tiên/job hiện tại cho hàm sẽ chạy trên worker thread khác"""
+    priority, job = current_context()
+    
+    def wrapper(*args, **kwargs):
+        with request_context(priority, job):
+            return func(*args, **kwargs)
+    
+    return wrapper
+
+class _Ticket:
+    """Một request đang chờ slot"""
+    
+    def __init__(self, priority: str, job: str):
+        self.priority = priority
+        self.job = job
+        self.queued_at = time.time()
+        self.granted = False
+
+class LLMScheduler:
+    """Điều phối request tới LM Studio: giới hạn số request đồng thời theo số slot
+    của server, ưu tiên theo loại request và chia lượt công bằng giữa các job
+
+    Slot trống được cấp cho loại ưu tiên cao nhất đang chờ; trong cùng một loại,
+    các job lần lượt được cấp một slot (round-robin) nên một file SRT dài không
+    chặn các file khác. reserved_interactive slot chỉ dành cho request interactive
+    để chỉnh sửa trực tiếp không phải chờ các batch dịch hàng loạt.
+    """
+    
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 reserved_interactive: int = DEFAULT_RESERVED_INTERACTIVE):
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrency = max(1, max_concurrency)
+        # Luôn để lại ít nhất một slot cho request không phải interactive
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_concurrency - 1)
+        
+        self._cond = threading.Condition()
+        self._queues: Dict[str, 'OrderedDict[str, deque]'] = {p: OrderedDict() for p in PRIORITY_CLASSES}
+        self._active: Dict[str, int] = {p: 0 for p in PRIORITY_CLASSES}
+        self._completed: Dict[str, int] = {p: 0 for p in PRIORITY_CLASSES}
+        self._total_wait: Dict[str, float] = {p: 0.0 for p in PRIORITY_CLASSES}
+        self._max_wait: Dict[str, float] = {p: 0.0 for p in PRIORITY_CLASSES}
+        self._max_queued = 0
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional['LLMScheduler']:
+        """Tạo scheduler từ mục "llm_scheduler" trong config.json, None nếu tắt"""
+        scheduler_config = config.get('llm_scheduler', {})
+        if not scheduler_config.get('enabled', True):
+            return None
+        
+        return cls(
+            max_concurrency=scheduler_config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY),
+            reserved_interactive=scheduler_config.get('reserved_interactive', DEFAULT_RESERVED_INTERACTIVE)
+        )
+    
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, job: Optional[str] = None) -> Iterator[None]:
+        """Giữ một slot trong khi gửi request (chờ tới lượt nếu server đang bận)"""
+        ticket = self.acquire(priority, job)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+    
+    def acquire(self, priority: Optional[str] = None, job: Optional[str] = None) -> _Ticket:
+        """Chờ tới khi được cấp slot"""
+        if priority not in PRIORITY_CLASSES:
+            priority = PRIORITY_INTERACTIVE
+        ticket = _Ticket(priority, job or DEFAULT_JOB)
+        
+        with self._cond:
+            self._queues[priority].setdefault(ticket.job, deque()).append(ticket)
+            self._max_queued = max(self._max_queued, self._queued_count())
+            self._dispatch()
+            
+            while not ticket.granted:
+                self._cond.wait()
+        
+        waited = time.time() - ticket.queued_at
+        if waited > 1:
+            self.logger.debug(f"{priority} request for {ticket.job} waited {waited:.1f}s")
+        return ticket
+    
+    def release(self, ticket: _Ticket):
+        """Trả slot và cấp cho request tiếp theo"""
+        with self._cond:
+            self._active[ticket.priority] -= 1
+            self._completed[ticket.priority] += 1
+            self._dispatch()
+    
+    def _dispatch(self):
+        """Cấp các slot trống theo thứ tự ưu tiên, round-robin giữa các job (gọi khi đang giữ lock)"""
+        granted = False
+        
+        while sum(self._active.values()) < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            
+            ticket.granted = True
+            granted = True
+            self._active[ticket.priority] += 1
+            
+            waited = time.time() - ticket.queued_at
+            self._total_wait[ticket.priority] += waited
+            self._max_wait[ticket.priority] = max(self._max_wait[ticket.priority], waited)
+        
+        if granted:
+            self._cond.notify_all()
+    
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Request được cấp slot tiếp theo, None nếu không có request nào được chạy"""
+        background_limit = self.max_concurrency - self.reserved_interactive
+        background_active = sum(n for p, n in self._active.items() if p != PRIORITY_INTERACTIVE)
+        
+        for priority in PRIORITY_CLASSES:
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            if priority != PRIORITY_INTERACTIVE and background_active >= background_limit:
+                return None
+            
+            # Lấy request của job đầu hàng rồi đưa job xuống cuối hàng
+            job, waiting = next(iter(queues.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                queues.move_to_end(job)
+            else:
+                del queues[job]
+            return ticket
+        
+        return None
+    
+    def _queued_count(self) -> int:
+        """Tổng số request đang chờ (gọi khi đang giữ lock)"""
+        return sum(len(waiting) for queues in self._queues.values() for waiting in queues.values())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Số request đang chờ/đang chạy, số job đang chờ và thời gian chờ theo từng loại"""
+        with self._cond:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                completed = self._completed[priority] + self._active[priority]
+                classes[priority] = {
+                    'queued': sum(len(waiting) for waiting in self._queues[priority].values()),
+                    'queued_jobs': len(self._queues[priority]),
+                    'active': self._active[priority],
+                    'completed': self._completed[priority],
+                    'avg_wait': self._total_wait[priority] / completed if completed else 0.0,
+                    'max_wait': self._max_wait[priority]
+                }
+            
+            return {
+                'max_concurrency': self.max_concurrency,
+                'reserved_interactive': self.reserved_interactive,
+                'active': sum(self._active.values()),
+                'queued': self._queued_count(),
+                'max_queued': self._max_queued,
+                'classes': classes
+            }
+    
+    def describe(self) -> str:
+        """Thống kê dạng text để hiển thị"""
+        stats = self.stats()
+        lines = [f"LM Studio: {stats['active']}/{stats['max_concurrency']} slot đang chạy, "
+                 f"{stats['queued']} request đang chờ (nhiều nhất {stats['max_queued']})"]
+        
+        for priority, values in stats['classes'].items():
+            lines.append(f"  {priority}: chờ {values['queued']} ({values['queued_jobs']} job), "
+                         f"chạy {values['active']}, xong {values['completed']}, "
+                         f"chờ TB {values['avg_wait']:.1f}s, lâu nhất {values['max_wait']:.1f}s")
+        
+        return "\n".join(lines)
@@ -59,6 +59,44 @@ def create_default_config(config_path):
         "version": "1.0.0",
         "lm_studio_url": "http://localhost:1234/v1",
         "sd_api_url": "http://localhost:7860",
+        "translation_workers": 4,
+        "translation_token_budget": 0,
+        "job_workers": 2,
+        "download_workers": 3,
+        "download_host_limit": 2,
+        "max_transcodes": 1,
+        "download_profile": "balanced",
+        "download_platform_profiles": {},
+        "download_global_rate_limit": None,
+        "download_archive": {
+            "enabled": True,
+            "dedup": True
+        },
+        "video_info_cache": {
+            "ttl_minutes": 30,
+            "persist": True
+        },
+        "image_cache": {
+            "enabled": True,
+            "max_size_mb": 1000
+        },
+        "llm_cache": {
+            "enabled": True,
+            "max_size_mb": 500,
+            "ttl_hours": 168
+        },
+        "llm_scheduler": {
+            "enabled": True,
+            "max_concurrency": 4,
+            "reserved_interactive": 1
+        },
+        "subtitle_pipeline": {
+            "enabled": False,
+            "target_lang": "vi",
+            "source_langs": ["zh", "en"],
+            "style": "hiện đại",
+            "file_workers": 2
+        },
         "themes": {
             "light": "#FFFFFF",
             "dark": "#1E1E1E",
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
+import logging
+
+# Codec mà mỗi container chứa được mà không cần encode lại
+CONTAINER_CODECS = {
+    'mp4': {
+        'video': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+        'audio': {'aac', 'mp3', 'opus', 'alac', 'ac3', 'eac3', 'flac'},
+    },
+    'webm': {
+        'video': {'vp8', 'vp9', 'av1'},
+        'audio': {'opus', 'vorbis'},
+    },
+    'flv': {
+        'video': {'h264', 'flv1'},
+        'audio': {'aac', 'mp3'},
+    },
+    # mkv chứa được gần như mọi codec
+    'mkv': None,
+}
+
+# Encoder dùng khi buộc phải encode lại một loại stream
+TRANSCODE_ENCODERS = {
+    'mp4': {'video': ['libx264', '-preset', 'veryfast', '-crf', '20'], 'audio': ['aac', '-b:a', '192k']},
+    'webm': {'video': ['libvpx-vp9', '-b:v', '0', '-crf', '32'], 'audio': ['libopus', '-b:a', '128k']},
+    'flv': {'video': ['libx264', '-preset', 'veryfast', '-crf', '20'], 'audio': ['aac', '-b:a', '192k']},
+}
+
+class MediaPostProcessor:
+    """Đổi container video sau khi tải: remux (copy stream) khi codec tương thích,
+    chỉ encode lại những stream không tương thích
+
+    Việc encode chạy trên pool giới hạn số tiến trình ffmpeg cùng lúc, để nhiều
+    video tải song song không làm nghẽn CPU.
+    """
+    
+    def __init__(self, max_transcodes: int = 1, ffmpeg_path: Optional[str] = None,
+                 ffprobe_path: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.ffmpeg = ffmpeg_path or shutil.which('ffmpeg')
+        self.ffprobe = ffprobe_path or shutil.which('ffprobe')
+        self._transcode_pool = ThreadPoolExecutor(max_workers=max(1, max_transcodes))
+    
+    def probe_codecs(self, file_path: str) -> Dict[str, List[str]]:
+        """Danh sách codec theo loại stream: {'video': [...], 'audio': [...]}"""
+        result = subprocess.run(
+            [self.ffprobe, '-v', 'error', '-show_entries', 'stream=codec_type,codec_name',
+             '-of', 'json', file_path],
+            capture_output=True, text=True, check=True
+        )
+        
+        codecs = {'video': [], 'audio': []}
+        for stream in json.loads(result.stdout).get('streams', []):
+            if stream.get('codec_type') in codecs:
+                codecs[stream['codec_type']].append(stream.get('codec_name', ''))
+        return codecs
+    
+    def plan(self, codecs: Dict[str, List[str]], output_format: str) -> Tuple[str, List[str]]:
+        """Chọn cách xử lý ("remux" hoặc "transcode") và tham số codec cho ffmpeg"""
+        allowed = CONTAINER_CODECS.get(output_format)
+        args = []
+        action = "remux"
+        
+        for stream_type, flag in (('video', '-c:v'), ('audio', '-c:a')):
+            if not codecs[stream_type]:
+                continue
+            
+            if allowed is None or all(c in allowed[stream_type] for c in codecs[stream_type]):
+                args += [flag, 'copy']
+            else:
+                args += [flag] + TRANSCODE_ENCODERS[output_format][stream_type]
+                action = "transcode"
+        
+        return action, args
+    
+    def process(self, file_path: str, output_format: str) -> Tuple[str, str]:
+        """Đưa file về container output_format, trả về (file kết quả, cách xử lý)
+
+        Cách xử lý là "none" (đã đúng định dạng), "remux" hoặc "transcode".
+        """
+        path = Path(file_path)
+        output_format = output_format.lower()
+        
+        if path.suffix.lower().lstrip('.') == output_format:
+            return file_path, "none"
+        
+        if output_format not in CONTAINER_CODECS:
+            self.logger.warning(f"Unsupported output format {output_format}, keeping {path.name}")
+            return file_path, "none"
+        
+        if not self.ffmpeg or not self.ffprobe:
+            self.logger.warning(f"ffmpeg/ffprobe not found, keeping {path.name}")
+            return file_path, "none"
+        
+        action, codec_args = self.plan(self.probe_codecs(file_path), output_format)
+        
+        if action == "transcode":
+            output_file = self._transcode_pool.submit(self._run_ffmpeg, path, output_format, codec_args).result()
+        else:
+            output_file = self._run_ffmpeg(path, output_format, codec_args)
+        
+        self.logger.info(f"{action.capitalize()} {path.name} -> {Path(output_file).name}")
+        return output_file, action
+    
+    def _run_ffmpeg(self, path: Path, output_format: str, codec_args: List[str]) -> str:
+        """Chạy ffmpeg ra file tạm rồi thay file gốc"""
+        output_path = path.with_suffix(f".{output_format}")
+        tmp_path = path.with_name(f"{path.stem}.temp.{output_format}")
+        
+        command = [self.ffmpeg, '-y', '-v', 'error', '-i', str(path),
+                   '-map', '0:v?', '-map', '0:a?'] + codec_args
+        if output_format == 'mp4':
+            command += ['-movflags', '+faststart']
+        command.append(str(tmp_path))
+        
+        try:
+            subprocess.run(command, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise RuntimeError(f"ffmpeg failed for {path.name}: {e.stderr.strip()[-500:]}")
+        
+        os.replace(tmp_path, output_path)
+        path.unlink()
+        return str(output_path)
+    
+    def shutdown(self):
+        """Dừng pool encode"""
+        self._transcode_pool.shutdown(wait=False)
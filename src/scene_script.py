@@ -0,0 +1,181 @@
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+# Nhãn của từng trường trong kịch bản ảnh (viết thường, nhãn dài đặt trước)
+SCENE_FIELD_LABELS = [
+    ('name', ['tên cảnh', 'scene name', 'tên', 'name', 'title']),
+    ('description', ['mô tả cảnh', 'mô tả', 'description']),
+    ('characters', ['các nhân vật', 'nhân vật', 'characters']),
+    ('setting', ['bối cảnh', 'setting', 'background']),
+    ('prompt', ['prompt cho ai tạo ảnh', 'prompt cho ai', 'prompt tạo ảnh', 'image prompt', 'prompt']),
+]
+
+# Dòng tiêu đề cảnh: "Cảnh 1", "**Cảnh 2: Gặp gỡ**", "### Scene 3 - ..."
+SCENE_HEADER_PATTERN = re.compile(r'^[\s#*\-]*(?:cảnh|scene)\s*(\d+)\s*[:.\-–]?\s*(.*)$', re.IGNORECASE)
+
+# Dòng bắt đầu một trường: "1. Tên cảnh: ...", "- **Bối cảnh**: ...", "Prompt: ..."
+SCENE_FIELD_PATTERN = re.compile(
+    r'^[\s\-*•]*(?:\d+[.)]\s*)?\**\s*(?P<label>[^:*]+?)\s*\**\s*:\s*\**\s*(?P<value>.*)$'
+)
+
+class Scene:
+    """Một cảnh trong kịch bản ảnh"""
+    
+    def __init__(self, index: int, name: str = "", description: str = "",
+                 characters: Optional[List[str]] = None, setting: str = "", prompt: str = ""):
+        self.index = index
+        self.name = name
+        self.description = description
+        self.characters = characters or []
+        self.setting = setting
+        self.prompt = prompt
+    
+    def image_prompt(self) -> str:
+        """Prompt gửi cho Stable Diffusion (dùng mô tả + bối cảnh nếu cảnh không có prompt)"""
+        if self.prompt:
+            return self.prompt
+        return ", ".join(part for part in (self.description, self.setting) if part)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dạng dict để lưu JSON"""
+        return {
+            'index': self.index,
+            'name': self.name,
+            'description': self.description,
+            'characters': self.characters,
+            'setting': self.setting,
+            'prompt': self.prompt
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], index: int = 0) -> 'Scene':
+        """Tạo từ dict đã lưu hoặc JSON do model viết (trường sai kiểu được bỏ qua)"""
+        characters = data.get('characters') or []
+        if isinstance(characters, str):
+            characters = split_characters(characters)
+        elif not isinstance(characters, (list, tuple)):
+            characters = []
+        # Nhân vật có thể là object {"name": ...} thay vì tên
+        characters = [str(c.get('name') or "") if isinstance(c, dict) else str(c) for c in characters]
+        
+        # "index" có thể là "1a", "Cảnh 1"... thì dùng vị trí của cảnh
+        try:
+            scene_index = int(data.get('index') or index)
+        except (TypeError, ValueError):
+            scene_index = index
+        
+        return cls(
+            index=scene_index,
+            name=str(data.get('name') or ""),
+            description=str(data.get('description') or ""),
+            characters=[c for c in characters if c.strip()],
+            setting=str(data.get('setting') or ""),
+            prompt=str(data.get('prompt') or "")
+        )
+
+def split_characters(text: str) -> List[str]:
+    """Tách danh sách nhân vật cách nhau bởi dấu phẩy/chấm phẩy"""
+    return [name.strip() for name in re.split(r'[,;、，]', text) if name.strip()]
+
+def _field_for_label(label: str) -> Optional[str]:
+    """Tên trường ứng với nhãn, None nếu không phải nhãn của kịch bản"""
+    label = label.strip().lower()
+    for field, labels in SCENE_FIELD_LABELS:
+        if label in labels:
+            return field
+    return None
+
+def _clean_value(value: str) -> str:
+    """Bỏ ký tự định dạng markdown và dấu ngoặc kép bao quanh"""
+    return value.strip().strip('*').strip().strip('"“”').strip()
+
+def _parse_json(text: str) -> Optional[List[Scene]]:
+    """Đọc kịch bản dạng JSON ({"scenes": [...]}, [...] hoặc khối ```json)"""
+    fenced = re.search(r'```(?:json)?\s*(.+?)```', text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    
+    text = text.strip()
+    if not text.startswith(('{', '[')):
+        return None
+    
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    
+    if isinstance(data, dict):
+        data = data.get('scenes')
+    if not isinstance(data, list):
+        return None
+    
+    return [Scene.from_dict(item, i + 1) for i, item in enumerate(data) if isinstance(item, dict)]
+
+def parse_scene_script(text: str) -> List[Scene]:
+    """Đọc kịch bản ảnh (JSON hoặc văn bản có nhãn từng trường) thành danh sách cảnh
+
+    Cảnh mới bắt đầu ở dòng tiêu đề "Cảnh N" hoặc khi gặp lại nhãn tên cảnh.
+    Dòng không có nhãn được nối vào trường đang đọc.
+    """
+    scenes = _parse_json(text)
+    if scenes is not None:
+        return scenes
+    
+    scenes = []
+    fields: Dict[str, List[str]] = {}
+    current_field = None
+    
+    def finish():
+        if any(fields.values()):
+            values = {field: _clean_value(" ".join(lines)) for field, lines in fields.items()}
+            values['characters'] = split_characters(values.get('characters', ""))
+            scenes.append(Scene.from_dict(values, len(scenes) + 1))
+    
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        
+        header = SCENE_HEADER_PATTERN.match(line)
+        if header:
+            finish()
+            fields = {}
+            current_field = None
+            name = _clean_value(header.group(2))
+            if name:
+                fields['name'] = [name]
+            continue
+        
+        match = SCENE_FIELD_PATTERN.match(line)
+        field = _field_for_label(match.group('label')) if match else None
+        
+        if field is not None:
+            # Gặp lại tên cảnh khi kịch bản không có dòng tiêu đề
+            if field == 'name' and fields.get('name') and len(fields) > 1:
+                finish()
+                fields = {}
+            fields[field] = [match.group('value')]
+            current_field = field
+        elif current_field is not None:
+            fields[current_field].append(line.strip())
+    
+    finish()
+    return scenes
+
+def format_scene_script(scenes: List[Scene]) -> str:
+    """Kịch bản dạng văn bản có nhãn (đọc lại được bằng parse_scene_script)"""
+    blocks = []
+    for scene in scenes:
+        blocks.append("\n".join([
+            f"Cảnh {scene.index}",
+            f"Tên cảnh: {scene.name}",
+            f"Mô tả: {scene.description}",
+            f"Nhân vật: {', '.join(scene.characters)}",
+            f"Bối cảnh: {scene.setting}",
+            f"Prompt: {scene.prompt}"
+        ]))
+    return "\n\n".join(blocks)
+
+def scenes_to_json(scenes: List[Scene]) -> str:
+    """Kịch bản dạng JSON"""
+    return json.dumps({'scenes': [scene.to_dict() for scene in scenes]}, ensure_ascii=False, indent=2)
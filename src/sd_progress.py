@@ -0,0 +1,174 @@
+import base64
+import threading
+import time
+from io import BytesIO
+from typing import Dict, Any, Optional, Callable
+
+import requests
+from PIL import Image
+import logging
+
+# Khoảng thời gian (giây) giữa hai lần hỏi /sdapi/v1/progress
+DEFAULT_POLL_INTERVAL = 0.5
+# Timeout của mỗi request hỏi tiến trình
+POLL_TIMEOUT = 5
+
+class GenerationProgress:
+    """Tiến trình tạo ảnh lấy từ /sdapi/v1/progress của Stable Diffusion WebUI
+
+    preview là ảnh xem trước độ phân giải thấp (PIL Image) của bước hiện tại,
+    None nếu server không gửi hoặc không đổi so với lần trước.
+    """
+    
+    def __init__(self, fraction: float = 0.0, eta: Optional[float] = None, step: int = 0,
+                 steps: int = 0, job_count: int = 0, preview: Optional[Image.Image] = None,
+                 elapsed: float = 0.0):
+        # Tỉ lệ hoàn thành của cả request (0-1)
+        self.fraction = fraction
+        self.eta = eta
+        self.step = step
+        self.steps = steps
+        self.job_count = job_count
+        self.preview = preview
+        self.elapsed = elapsed
+    
+    @property
+    def active(self) -> bool:
+        """Server đang tạo ảnh"""
+        return self.job_count > 0 or self.fraction > 0
+    
+    @classmethod
+    def from_response(cls, data: Dict[str, Any], preview: Optional[Image.Image] = None,
+                      elapsed: float = 0.0) -> 'GenerationProgress':
+        """Tạo từ JSON của /sdapi/v1/progress"""
+        state = data.get('state') or {}
+        
+        return cls(
+            fraction=data.get('progress') or 0.0,
+            eta=data.get('eta_relative'),
+            step=state.get('sampling_step') or 0,
+            steps=state.get('sampling_steps') or 0,
+            job_count=state.get('job_count') or 0,
+            preview=preview,
+            elapsed=elapsed
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dạng dict để gửi qua API/ghi log (không gồm ảnh xem trước)"""
+        return {
+            'fraction': self.fraction,
+            'eta': self.eta,
+            'step': self.step,
+            'steps': self.steps,
+            'job_count': self.job_count,
+            'has_preview': self.preview is not None,
+            'elapsed': self.elapsed
+        }
+    
+    def describe(self) -> str:
+        """Mô tả ngắn để hiển thị"""
+        text = f"{self.fraction * 100:.0f}%"
+        if self.steps:
+            text += f" - bước {self.step}/{self.steps}"
+        if self.eta:
+            text += f" - còn {int(self.eta)}s"
+        return text
+
+def decode_preview(data: str) -> Image.Image:
+    """Decode ảnh xem trước base64 (có thể kèm tiền tố data URI)"""
+    if data.startswith('data:'):
+        data = data.split(',', 1)[1]
+    
+    image = Image.open(BytesIO(base64.b64decode(data)))
+    image.load()
+    return image
+
+def interrupt(session: requests.Session, api_url: str) -> bool:
+    """Yêu cầu Stable Diffusion dừng request đang chạy"""
+    try:
+        response = session.post(f"{api_url}/sdapi/v1/interrupt", timeout=POLL_TIMEOUT)
+        return response.status_code == 200
+    except requests.RequestException as e:
+        logging.getLogger(__name__).error(f"Interrupt failed: {str(e)}")
+        return False
+
+class ProgressPoller:
+    """Thread hỏi tiến trình của Stable Diffusion trong khi request txt2img đang chạy
+
+    callback(GenerationProgress) được gọi từ thread của poller mỗi khi server
+    đang tạo ảnh. Nếu có cancel_event, poller gọi /sdapi/v1/interrupt ngay khi
+    event được đặt để server dừng sớm và trả về những ảnh đã xong.
+    """
+    
+    def __init__(self, api_url: str, callback: Optional[Callable[[GenerationProgress], None]] = None,
+                 interval: float = DEFAULT_POLL_INTERVAL, previews: bool = True,
+                 cancel_event: Optional[threading.Event] = None):
+        self.api_url = api_url
+        self.callback = callback
+        self.interval = interval
+        self.previews = previews
+        self.cancel_event = cancel_event
+        self.logger = logging.getLogger(__name__)
+        
+        # Session riêng, không dùng chung với request txt2img đang chờ
+        self.session = requests.Session()
+        self.interrupted = False
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_preview: Optional[str] = None
+        self._started_at = 0.0
+    
+    def start(self) -> 'ProgressPoller':
+        """Bắt đầu hỏi tiến trình"""
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Dừng poller (gọi khi request txt2img đã trả về)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.session.close()
+    
+    def _run(self):
+        """Vòng lặp của thread poller"""
+        while not self._stop.wait(self.interval):
+            if self.cancel_event is not None and self.cancel_event.is_set() and not self.interrupted:
+                self.interrupted = interrupt(self.session, self.api_url)
+            
+            if self.callback is None:
+                continue
+            
+            try:
+                progress = self.poll()
+            except Exception as e:
+                self.logger.debug(f"Progress poll failed: {str(e)}")
+                continue
+            
+            if progress.active and not self._stop.is_set():
+                self.callback(progress)
+    
+    def poll(self) -> GenerationProgress:
+        """Hỏi tiến trình một lần"""
+        response = self.session.get(
+            f"{self.api_url}/sdapi/v1/progress",
+            params={'skip_current_image': 'false' if self.previews else 'true'},
+            timeout=POLL_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        # Chỉ decode ảnh xem trước khi server gửi ảnh mới
+        preview = None
+        current_image = data.get('current_image')
+        if current_image and current_image != self._last_preview:
+            self._last_preview = current_image
+            try:
+                preview = decode_preview(current_image)
+            except Exception as e:
+                self.logger.debug(f"Invalid preview image: {str(e)}")
+        
+        return GenerationProgress.from_response(data, preview, time.time() - self._started_at)
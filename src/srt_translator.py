@@ -1,10 +1,32 @@
 import pysrt
-from typing import List, Tuple, Optional, Callable
-import os
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Optional, Callable, Dict, Set
 import re
 from datetime import timedelta
 import logging
 
+from api_client import is_error_response
+from translation_journal import TranslationJournal
+from llm_scheduler import PRIORITY_BULK, request_context, bind_context
+from utils.tokens import estimate_tokens
+
+# Giới hạn số câu mỗi batch khi chia theo token
+MAX_BATCH_CUES = 60
+
+# Token phụ cho mỗi dòng ("12. " + xuống dòng)
+LINE_TOKEN_OVERHEAD = 4
+
+# max_tokens cho bản dịch = token đầu vào * hệ số + phần dư, không thấp hơn mức tối thiểu
+OUTPUT_TOKEN_RATIO = 2.0
+OUTPUT_TOKEN_MARGIN = 64
+MIN_OUTPUT_TOKENS = 256
+
+# Số lần dịch lại tối đa khi bản dịch bị lệch dòng
+MAX_ALIGN_RETRIES = 2
+
+# Dòng dịch dạng "12. text", "12) text", "[12] text"
+NUMBERED_LINE_PATTERN = re.compile(r'^\[?(\d+)\s*[\.\):\]]\s*(.*)$')
+
 class SRTTranslator:
     """Dịch file SRT sử dụng AI"""
     
@@ -14,8 +36,22 @@ class SRTTranslator:
     
     def translate_file(self, file_path: str, src_lang: str, tgt_lang: str, 
                        style: str = "modern", batch_size: int = 10,
-                       progress_callback: Optional[Callable] = None) -> str:
-        """Dịch toàn bộ file SRT"""
+                       progress_callback: Optional[Callable] = None,
+                       max_workers: int = 1, token_budget: Optional[int] = None,
+                       scene_gap: Optional[float] = None, resume: bool = True,
+                       executor: Optional[Executor] = None,
+                       untranslated_callback: Optional[Callable[[List[int]], None]] = None) -> str:
+        """Dịch toàn bộ file SRT
+        
+        max_workers: số batch gửi song song tới LM Studio (1 = tuần tự)
+        token_budget: chia batch theo số token ước lượng thay vì batch_size
+        scene_gap: tách batch khi khoảng lặng giữa 2 câu >= scene_gap giây
+        resume: ghi nhật ký từng batch và bỏ qua các batch đã dịch ở lần chạy trước
+        executor: worker pool dùng chung giữa nhiều file (khi đó max_workers bị bỏ qua)
+        untranslated_callback: nhận số thứ tự (từ 1) các câu không dịch được và được giữ nguyên câu gốc
+        
+        LM Studio trả lỗi thì raise RuntimeError, các batch đã dịch xong vẫn được ghi nhật ký.
+        """
         
         # Đọc file SRT
         subs = pysrt.open(file_path, encoding='utf-8')
@@ -24,92 +60,261 @@ class SRTTranslator:
             raise ValueError("File SRT trống hoặc không đọc được")
         
         # Chia thành các batch
-        batches = self._create_batches(subs, batch_size)
-        
-        translated_subs = []
+        batches = self._create_batches(subs, batch_size, token_budget, scene_gap)
         
-        # Dịch từng batch
         total_batches = len(batches)
-        for i, batch in enumerate(batches, 1):
-            if progress_callback:
-                progress_callback(i, total_batches)
+        results: List[Optional[List[str]]] = [None] * total_batches
+        # Vị trí (trong batch) các câu giữ nguyên câu gốc vì không dịch được
+        untranslated: Dict[int, Set[int]] = {}
+        
+        # Nạp các batch đã dịch xong từ nhật ký
+        journal = None
+        if resume:
+            journal = TranslationJournal(file_path, {
+                'src_lang': src_lang,
+                'tgt_lang': tgt_lang,
+                'style': style,
+                'batch_size': batch_size,
+                'token_budget': token_budget,
+                'scene_gap': scene_gap
+            })
             
-            # Tạo text batch
-            batch_text = self._batch_to_text(batch)
+            for index, texts in journal.load().items():
+                if 0 <= index < total_batches and len(texts) == len(batches[index]):
+                    results[index] = texts
+        
+        pending = [index for index in range(total_batches) if results[index] is None]
+        completed = total_batches - len(pending)
+        
+        if completed:
+            self.logger.info(f"Resumed {completed}/{total_batches} batches from {journal.path.name}")
+            if progress_callback:
+                progress_callback(completed, total_batches)
+        
+        # Dịch các batch bằng worker pool, số request đồng thời bị giới hạn bởi max_workers
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        
+        # Batch dịch là request hàng loạt; mỗi file là một job để scheduler chia lượt giữa các file
+        with request_context(PRIORITY_BULK, job=f"srt:{file_path}"):
+            translate_batch = bind_context(self._translate_batch)
+        
+        try:
+            futures = {
+                executor.submit(translate_batch, batches[index], src_lang, tgt_lang, style): index
+                for index in pending
+            }
             
-            # Dịch batch
-            translated_text = self.ai_client.translate_text(
-                text=batch_text,
-                source_lang=src_lang,
-                target_lang=tgt_lang,
-                style=style
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    results[index], untranslated[index] = future.result()
+                    
+                    # Batch còn câu giữ nguyên câu gốc không được ghi, lần chạy sau sẽ dịch lại
+                    if journal and not untranslated[index]:
+                        journal.record(index, results[index])
+                    
+                    # Tiến trình tính theo số batch đã xong nên luôn tăng dần
+                    completed += 1
+                    if progress_callback:
+                        progress_callback(completed, total_batches)
+                    
+                    self.logger.info(f"Translated batch {index + 1}/{total_batches} "
+                                     f"({completed}/{total_batches} done)")
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+        
+        # Ghép lại theo đúng thứ tự cue, giữ nguyên timing (SubRipTime -> timedelta)
+        translated_subs = []
+        for texts, batch in zip(results, batches):
+            translated_subs.extend(
+                (text, timedelta(milliseconds=sub.start.ordinal), timedelta(milliseconds=sub.end.ordinal))
+                for text, sub in zip(texts, batch)
             )
-            
-            # Chuyển về các subtitle
-            translated_batch = self._text_to_subtitles(translated_text, batch)
-            
-            # Thêm vào kết quả
-            translated_subs.extend(translated_batch)
-            
-            self.logger.info(f"Translated batch {i}/{total_batches}")
         
         # Tạo file SRT mới
         output_srt = self._create_srt_content(translated_subs)
         
+        # Báo các câu giữ nguyên câu gốc thay vì coi như đã dịch
+        cue_numbers = []
+        offset = 0
+        for index, batch in enumerate(batches):
+            cue_numbers.extend(offset + i + 1 for i in sorted(untranslated.get(index, ())))
+            offset += len(batch)
+        
+        if cue_numbers:
+            self.logger.warning(f"{len(cue_numbers)}/{len(subs)} cues kept untranslated: {cue_numbers[:20]}")
+            if untranslated_callback:
+                untranslated_callback(cue_numbers)
+        
+        # Giữ nhật ký khi còn câu chưa dịch được để chạy lại chỉ dịch các batch đó
+        if journal and not cue_numbers:
+            journal.remove()
+        
         return output_srt
     
-    def _create_batches(self, subs: pysrt.SubRipFile, batch_size: int) -> List[List[pysrt.SubRipItem]]:
-        """Chia subtitles thành các batch"""
+    def _translate_batch(self, batch: List[pysrt.SubRipItem], src_lang: str, tgt_lang: str,
+                         style: str) -> Tuple[List[str], Set[int]]:
+        """Dịch một batch subtitles, trả về (bản dịch theo đúng thứ tự câu, vị trí các câu không dịch được)"""
+        return self._translate_cues(batch, src_lang, tgt_lang, style, MAX_ALIGN_RETRIES)
+    
+    def _translate_cues(self, cues: List[pysrt.SubRipItem], src_lang: str, tgt_lang: str,
+                        style: str, retries: int, use_cache: bool = True) -> Tuple[List[str], Set[int]]:
+        """Dịch danh sách câu, ghép kết quả theo số thứ tự và dịch lại các câu bị lệch
+        
+        Câu nào bị thiếu trong bản dịch (model gộp/tách dòng) sẽ được gửi lại riêng
+        cùng câu liền trước.
+        Nếu cả batch không ghép được thì chia đôi batch rồi dịch lại từng nửa.
+        Hết lượt thử thì giữ nguyên câu gốc, vị trí các câu này được trả về kèm bản dịch.
+        Client trả về thông báo lỗi thì raise RuntimeError.
+        """
+        batch_text = self._batch_to_text(cues)
+        
+        # Giới hạn output theo độ dài đầu vào để batch dài không bị cắt cụt
+        max_tokens = max(
+            MIN_OUTPUT_TOKENS,
+            int(estimate_tokens(batch_text) * OUTPUT_TOKEN_RATIO) + OUTPUT_TOKEN_MARGIN
+        )
+        
+        # Dịch batch
+        translated_text = self.ai_client.translate_text(
+            text=batch_text,
+            source_lang=src_lang,
+            target_lang=tgt_lang,
+            style=style,
+            max_tokens=max_tokens,
+            numbered=True,
+            use_cache=use_cache
+        )
+        
+        # Lỗi kết nối/HTTP không được coi là bản dịch (batch 1 câu chấp nhận dòng không đánh số)
+        if is_error_response(translated_text):
+            raise RuntimeError(f"LM Studio lỗi khi dịch: {translated_text.strip()}")
+        
+        translations = self._parse_translation(translated_text, len(cues))
+        missing = [i for i in range(len(cues)) if i not in translations]
+        untranslated: Set[int] = set()
+        
+        if not missing:
+            return [translations[i] for i in range(len(cues))], untranslated
+        
+        self.logger.warning(f"Misaligned translation: {len(missing)}/{len(cues)} cues missing")
+        
+        if retries <= 0:
+            # Hết lượt thử: giữ nguyên câu gốc
+            for i in missing:
+                translations[i] = self._clean_text(cues[i].text)
+            untranslated.update(missing)
+        elif len(missing) == len(cues) and len(cues) > 1:
+            # Không ghép được câu nào: chia đôi batch
+            half = len(cues) // 2
+            first, first_untranslated = self._translate_cues(cues[:half], src_lang, tgt_lang, style, retries - 1)
+            second, second_untranslated = self._translate_cues(cues[half:], src_lang, tgt_lang, style, retries - 1)
+            return first + second, first_untranslated | {half + i for i in second_untranslated}
+        else:
+            # Chỉ dịch lại các câu bị thiếu cùng câu liền trước (thường là câu đã bị gộp vào)
+            retry_indexes = sorted(set(missing) | {i - 1 for i in missing if i > 0})
+            retry_cues = [cues[i] for i in retry_indexes]
+            
+            # Bỏ qua cache nếu prompt giống hệt lần trước
+            retried, retried_untranslated = self._translate_cues(
+                retry_cues, src_lang, tgt_lang, style, retries - 1,
+                use_cache=len(retry_cues) != len(cues)
+            )
+            for i, text in zip(retry_indexes, retried):
+                translations[i] = text
+            untranslated.update(retry_indexes[i] for i in retried_untranslated)
+        
+        return [translations[i] for i in range(len(cues))], untranslated
+    
+    def _create_batches(self, subs: pysrt.SubRipFile, batch_size: int,
+                        token_budget: Optional[int] = None,
+                        scene_gap: Optional[float] = None) -> List[List[pysrt.SubRipItem]]:
+        """Chia subtitles thành các batch
+        
+        Mặc định mỗi batch có batch_size câu. Với token_budget, các câu được gom
+        tới khi đủ số token ước lượng (tối đa MAX_BATCH_CUES câu).
+        """
         batches = []
         current_batch = []
+        current_tokens = 0
+        max_cues = MAX_BATCH_CUES if token_budget else batch_size
         
         for sub in subs:
-            current_batch.append(sub)
+            sub_tokens = estimate_tokens(self._clean_text(sub.text)) + LINE_TOKEN_OVERHEAD
+            
+            if current_batch:
+                # Khoảng lặng giữa câu trước và câu này (giây)
+                gap = (sub.start.ordinal - current_batch[-1].end.ordinal) / 1000
+                
+                if (len(current_batch) >= max_cues
+                        or (token_budget and current_tokens + sub_tokens > token_budget)
+                        or (scene_gap and gap >= scene_gap)):
+                    batches.append(current_batch)
+                    current_batch = []
+                    current_tokens = 0
             
-            if len(current_batch) >= batch_size:
-                batches.append(current_batch)
-                current_batch = []
+            current_batch.append(sub)
+            current_tokens += sub_tokens
         
         if current_batch:
             batches.append(current_batch)
         
         return batches
     
+    def _clean_text(self, text: str) -> str:
+        """Làm sạch text (loại bỏ tags HTML, gộp thành một dòng)"""
+        clean_text = re.sub(r'<[^>]+>', '', text)
+        return clean_text.replace('\n', ' ')
+    
     def _batch_to_text(self, batch: List[pysrt.SubRipItem]) -> str:
         """Chuyển batch subtitles thành text"""
         texts = []
         
         for i, sub in enumerate(batch, 1):
-            # Làm sạch text (loại bỏ tags HTML)
-            clean_text = re.sub(r'<[^>]+>', '', sub.text)
-            clean_text = clean_text.replace('\n', ' ')
-            
-            texts.append(f"{i}. {clean_text}")
+            texts.append(f"{i}. {self._clean_text(sub.text)}")
         
         return "\n".join(texts)
     
-    def _text_to_subtitles(self, translated_text: str, 
-                          original_batch: List[pysrt.SubRipItem]) -> List[Tuple[str, timedelta, timedelta]]:
-        """Chuyển text đã dịch về subtitles"""
+    def _parse_translation(self, translated_text: str, count: int) -> Dict[int, str]:
+        """Ghép bản dịch về câu theo số thứ tự "n." ở đầu dòng (index bắt đầu từ 0)
         
-        lines = translated_text.strip().split('\n')
-        translated_items = []
+        Dòng không có số được nối vào câu phía trước (model tách dòng).
+        Số ngoài phạm vi hoặc lặp lại bị bỏ qua.
+        """
+        translations = {}
+        current = None
         
-        for i, line in enumerate(lines):
-            if i < len(original_batch):
-                original = original_batch[i]
+        for line in translated_text.strip().split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            
+            match = NUMBERED_LINE_PATTERN.match(line)
+            if match:
+                index = int(match.group(1)) - 1
                 
-                # Lấy số thứ tự và text từ dòng đã dịch
-                match = re.match(r'^\d+\.\s*(.+)', line)
-                if match:
-                    translated_text = match.group(1)
+                if 0 <= index < count and index not in translations:
+                    translations[index] = match.group(2).strip()
+                    current = index
                 else:
-                    translated_text = line
-                
-                # Giữ nguyên timing
-                translated_items.append((translated_text, original.start, original.end))
+                    self.logger.debug(f"Ignored translated line: {line[:50]}")
+                    current = None
+            elif current is not None:
+                translations[current] = f"{translations[current]} {line}"
+            elif count == 1 and not translations:
+                # Batch 1 câu: model thường bỏ số thứ tự
+                translations[0] = line
+                current = 0
         
-        return translated_items
+        # Câu dịch rỗng coi như bị thiếu
+        return {i: text for i, text in translations.items() if text}
     
     def _create_srt_content(self, subs: List[Tuple[str, timedelta, timedelta]]) -> str:
         """Tạo nội dung SRT từ subtitles đã dịch"""
@@ -129,8 +334,9 @@ class SRTTranslator:
     
     def _timedelta_to_srt(self, td: timedelta) -> str:
         """Chuyển timedelta thành định dạng SRT"""
-        total_seconds = int(td.total_seconds())
-        milliseconds = int((td.total_seconds() - total_seconds) * 1000)
+        # Tính bằng mili giây nguyên, total_seconds() dạng float làm lệch 1ms khi cắt phần lẻ
+        total_ms = td // timedelta(milliseconds=1)
+        total_seconds, milliseconds = divmod(total_ms, 1000)
         
         hours = total_seconds // 3600
         minutes = (total_seconds % 3600) // 60
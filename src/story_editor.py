@@ -1,7 +1,32 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterator, List, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
 import re
 import logging
 
+from utils.tokens import estimate_tokens
+from api_client import is_error_response
+from llm_scheduler import bind_context
+from scene_script import Scene, parse_scene_script
+
+# Số token ước lượng tối đa của mỗi phần khi chỉnh sửa truyện dài
+CHUNK_TOKENS = 1500
+
+# Giới hạn max_tokens cho bản chỉnh sửa của mỗi phần
+MAX_CHUNK_OUTPUT_TOKENS = 4000
+
+# Đoạn đầu phần sau giống đoạn cuối phần trước từ mức này trở lên thì coi là lặp
+SEAM_SIMILARITY = 0.8
+
+# Dòng tiêu đề chương: "Chương 3", "Chapter XII", "Hồi 3:", "Quyển: ...", "第三章"...
+# (từ khóa phải theo sau bởi số, số La Mã hoặc dấu hai chấm để không nhầm "Chương trình", "Hồi ấy")
+CHAPTER_PATTERN = re.compile(
+    r'^\s*((chương|chapter|hồi|quyển)'
+    r'(\s*\d+|\s+m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})(?<=[mdclxvi])\b|\s*:)'
+    r'|第[\d一二三四五六七八九十百千零]+[章回节卷])',
+    re.IGNORECASE
+)
+
 class StoryEditor:
     """Chỉnh sửa truyện với AI"""
     
@@ -9,9 +34,8 @@ class StoryEditor:
         self.ai_client = ai_client
         self.logger = logging.getLogger(__name__)
     
-    def edit_story(self, story: str, edit_type: str = "Chỉnh văn phong", 
-                   length_preference: str = "giữ nguyên", **kwargs) -> str:
-        """Chỉnh sửa truyện theo loại chỉ định"""
+    def _build_instruction(self, edit_type: str, length_preference: str) -> str:
+        """Tạo yêu cầu chỉnh sửa theo loại và độ dài"""
         
         # Map edit type to instructions
         instruction_map = {
@@ -30,13 +54,24 @@ class StoryEditor:
         elif length_preference == "dài hơn":
             instruction += ". Hãy mở rộng truyện dài hơn"
         
+        return instruction
+    
+    def _build_edit_prompt(self, story: str, edit_type: str, length_preference: str) -> str:
+        """Tạo prompt chỉnh sửa truyện"""
+        instruction = self._build_instruction(edit_type, length_preference)
+        
         # Tạo prompt hoàn chỉnh
-        prompt = f"""{instruction}
+        return f"""{instruction}
 
 TRUYỆN GỐC:
 {story}
 
 TRUYỆN ĐÃ CHỈNH SỬA:"""
+    
+    def edit_story(self, story: str, edit_type: str = "Chỉnh văn phong", 
+                   length_preference: str = "giữ nguyên", **kwargs) -> str:
+        """Chỉnh sửa truyện theo loại chỉ định"""
+        prompt = self._build_edit_prompt(story, edit_type, length_preference)
         
         # Gọi AI để chỉnh sửa
         edited_story = self.ai_client.generate_text(
@@ -47,6 +82,170 @@ TRUYỆN ĐÃ CHỈNH SỬA:"""
         
         return edited_story
     
+    def stream_edit_story(self, story: str, edit_type: str = "Chỉnh văn phong",
+                          length_preference: str = "giữ nguyên", **kwargs) -> Iterator[str]:
+        """Chỉnh sửa truyện, trả về từng đoạn kết quả ngay khi AI sinh ra"""
+        prompt = self._build_edit_prompt(story, edit_type, length_preference)
+        
+        return self.ai_client.stream_text(
+            prompt=prompt,
+            max_tokens=4000,
+            temperature=0.7
+        )
+    
+    def edit_story_chunked(self, story: str, edit_type: str = "Chỉnh văn phong",
+                           length_preference: str = "giữ nguyên",
+                           max_chunk_tokens: int = CHUNK_TOKENS, max_workers: int = 1,
+                           progress_callback: Optional[Callable] = None) -> str:
+        """Chỉnh sửa truyện dài theo từng phần rồi ghép lại
+        
+        Truyện được chia theo chương/đoạn văn, mỗi phần kèm đoạn cuối của phần trước
+        làm ngữ cảnh. Các phần được chỉnh sửa song song (max_workers) và
+        progress_callback(done, total) được gọi sau mỗi phần.
+        """
+        chunks = self.split_story(story, max_chunk_tokens)
+        total_chunks = len(chunks)
+        instruction = self._build_instruction(edit_type, length_preference)
+        
+        # Đoạn cuối của phần trước làm ngữ cảnh để giữ mạch truyện
+        contexts = [chunks[index - 1][-1] if index > 0 else "" for index in range(total_chunks)]
+        
+        results: List[Optional[str]] = [None] * total_chunks
+        completed = 0
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(
+                    bind_context(self._edit_chunk), chunk, contexts[index], instruction, index, total_chunks
+                ): index
+                for index, chunk in enumerate(chunks)
+            }
+            
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    results[index] = future.result()
+                    
+                    completed += 1
+                    if progress_callback:
+                        progress_callback(completed, total_chunks)
+                    
+                    self.logger.info(f"Edited chunk {index + 1}/{total_chunks} "
+                                     f"({completed}/{total_chunks} done)")
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        return self._stitch_chunks(results, contexts)
+    
+    def split_story(self, story: str, max_chunk_tokens: int = CHUNK_TOKENS) -> List[List[str]]:
+        """Chia truyện thành các phần (mỗi phần là danh sách đoạn văn)
+        
+        Luôn bắt đầu phần mới ở tiêu đề chương, ngoài ra gom đoạn văn tới khi
+        đủ max_chunk_tokens. Đoạn văn quá dài được tách theo câu.
+        """
+        paragraphs = []
+        for paragraph in re.split(r'\n\s*\n', story.strip()):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            
+            if estimate_tokens(paragraph) <= max_chunk_tokens:
+                paragraphs.append(paragraph)
+            else:
+                paragraphs.extend(self._split_sentences(paragraph, max_chunk_tokens))
+        
+        chunks = []
+        current_chunk = []
+        current_tokens = 0
+        
+        for paragraph in paragraphs:
+            tokens = estimate_tokens(paragraph)
+            
+            if current_chunk and (CHAPTER_PATTERN.match(paragraph)
+                                  or current_tokens + tokens > max_chunk_tokens):
+                chunks.append(current_chunk)
+                current_chunk = []
+                current_tokens = 0
+            
+            current_chunk.append(paragraph)
+            current_tokens += tokens
+        
+        if current_chunk:
+            chunks.append(current_chunk)
+        
+        return chunks
+    
+    def _split_sentences(self, paragraph: str, max_chunk_tokens: int) -> List[str]:
+        """Tách đoạn văn dài thành các khối câu không vượt quá max_chunk_tokens"""
+        pieces = []
+        current = ""
+        
+        for sentence in re.split(r'(?<=[.!?。！？…])\s*', paragraph):
+            if not sentence:
+                continue
+            
+            if current and estimate_tokens(current + sentence) > max_chunk_tokens:
+                pieces.append(current.strip())
+                current = ""
+            current += sentence + " "
+        
+        if current.strip():
+            pieces.append(current.strip())
+        
+        return pieces
+    
+    def _edit_chunk(self, chunk: List[str], context: str, instruction: str,
+                    index: int, total: int) -> str:
+        """Chỉnh sửa một phần truyện"""
+        chunk_text = "\n\n".join(chunk)
+        
+        context_block = ""
+        if context:
+            context_block = f"""ĐOẠN TRƯỚC (chỉ để giữ mạch truyện, không chỉnh sửa, không lặp lại):
+{context}
+
+"""
+        
+        prompt = f"""{instruction}
+
+{context_block}PHẦN {index + 1}/{total} CỦA TRUYỆN GỐC:
+{chunk_text}
+
+PHẦN {index + 1}/{total} ĐÃ CHỈNH SỬA:"""
+        
+        edited = self.ai_client.generate_text(
+            prompt=prompt,
+            max_tokens=min(MAX_CHUNK_OUTPUT_TOKENS, estimate_tokens(chunk_text) * 2 + 256),
+            temperature=0.7
+        )
+        
+        # Lỗi kết nối/HTTP không được ghép vào truyện như một phần đã chỉnh sửa
+        if is_error_response(edited):
+            raise RuntimeError(f"LM Studio lỗi khi chỉnh sửa phần {index + 1}/{total}: {edited.strip()}")
+        if not edited.strip():
+            raise RuntimeError(f"LM Studio trả về phần {index + 1}/{total} rỗng")
+        return edited
+    
+    def _stitch_chunks(self, edited_chunks: List[str], contexts: List[str]) -> str:
+        """Ghép các phần đã chỉnh sửa, bỏ đoạn bị model lặp lại ở chỗ nối"""
+        stitched: List[str] = []
+        
+        for text, context in zip(edited_chunks, contexts):
+            paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text.strip()) if p.strip()]
+            
+            # Model đôi khi chép lại đoạn ngữ cảnh (bản gốc hoặc bản đã sửa) ở đầu phần mới
+            seams = [context, stitched[-1]] if stitched else []
+            while paragraphs and any(
+                    SequenceMatcher(None, seam, paragraphs[0]).ratio() >= SEAM_SIMILARITY
+                    for seam in seams if seam):
+                paragraphs.pop(0)
+            
+            stitched.extend(paragraphs)
+        
+        return "\n\n".join(stitched)
+    
     def generate_image_script(self, story: str, num_scenes: int = 5, 
                             style: str = "anime", detail_level: str = "chi tiết",
                             include_prompts: bool = True) -> str:
@@ -60,6 +259,24 @@ TRUYỆN ĐÃ CHỈNH SỬA:"""
             detail_level=detail_level
         )
     
+    def generate_scene_script(self, story: str, num_scenes: int = 5,
+                              style: str = "anime", detail_level: str = "chi tiết") -> List[Scene]:
+        """Tạo kịch bản ảnh và đọc thành danh sách cảnh"""
+        script = self.generate_image_script(story, num_scenes=num_scenes, style=style,
+                                            detail_level=detail_level)
+        return parse_scene_script(script)
+    
+    def stream_image_script(self, story: str, num_scenes: int = 5,
+                            style: str = "anime", detail_level: str = "chi tiết",
+                            include_prompts: bool = True) -> Iterator[str]:
+        """Tạo kịch bản ảnh dạng stream"""
+        return self.ai_client.stream_image_script(
+            story=story,
+            num_scenes=num_scenes,
+            style=style,
+            detail_level=detail_level
+        )
+    
     def analyze_story(self, story: str) -> Dict[str, Any]:
         """Phân tích truyện"""
         prompt = f"""Hãy phân tích truyện sau:
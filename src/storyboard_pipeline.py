@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+import logging
+
+from api_client import is_error_response
+from scene_script import Scene, parse_scene_script
+
+# Tiền tố tên ảnh placeholder của ImageGenerator (khi Stable Diffusion lỗi)
+PLACEHOLDER_PREFIX = "placeholder_"
+
+class StoryboardState:
+    """Trạng thái pipeline truyện → storyboard, lưu ra file để chạy tiếp khi bị gián đoạn
+
+    Tên file gồm hash của truyện và các thiết lập, nên đổi truyện hoặc thiết lập
+    sẽ bắt đầu lại từ đầu.
+    """
+    
+    def __init__(self, story: str, settings: Dict[str, Any], state_dir: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        
+        if state_dir is None:
+            state_dir = str(Path(__file__).parent.parent / 'temp' / 'storyboard')
+        Path(state_dir).mkdir(parents=True, exist_ok=True)
+        
+        digest = hashlib.sha256(story.encode('utf-8'))
+        digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        self.id = digest.hexdigest()[:16]
+        self.path = Path(state_dir) / f"{self.id}.json"
+        
+        self.settings = settings
+        self.edited_story: Optional[str] = None
+        self.script: Optional[str] = None
+        self.scenes: List[Scene] = []
+        # Ảnh của từng cảnh: {số thứ tự cảnh: [đường dẫn ảnh]}
+        self.images: Dict[int, List[str]] = {}
+        # Thời gian từng bước: {bước: {'start', 'end', 'seconds'}} và từng cảnh
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.scene_timings: Dict[int, float] = {}
+        
+        self._lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        """Đọc trạng thái đã lưu (nếu có)"""
+        if not self.path.exists():
+            return
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Ignored invalid storyboard state {self.path.name}: {str(e)}")
+            return
+        
+        self.edited_story = data.get('edited_story')
+        self.script = data.get('script')
+        self.scenes = [Scene.from_dict(item) for item in data.get('scenes', [])]
+        self.images = {int(k): v for k, v in data.get('images', {}).items()
+                       if all(Path(path).is_file() for path in v)}
+        self.timings = data.get('timings', {})
+        self.scene_timings = {int(k): v for k, v in data.get('scene_timings', {}).items()}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dạng dict để lưu/trả về"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'settings': self.settings,
+                'edited_story': self.edited_story,
+                'script': self.script,
+                'scenes': [scene.to_dict() for scene in self.scenes],
+                'images': {str(k): v for k, v in self.images.items()},
+                'timings': self.timings,
+                'scene_timings': {str(k): v for k, v in self.scene_timings.items()}
+            }
+    
+    def save(self):
+        """Ghi trạng thái (ghi file tạm rồi đổi tên)"""
+        data = self.to_dict()
+        tmp_path = self.path.with_suffix('.tmp')
+        
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+    
+    def start_stage(self, stage: str):
+        """Ghi nhận bắt đầu một bước"""
+        with self._lock:
+            self.timings[stage] = {'start': time.time()}
+    
+    def end_stage(self, stage: str):
+        """Ghi nhận kết thúc một bước"""
+        with self._lock:
+            timing = self.timings.setdefault(stage, {'start': time.time()})
+            timing['end'] = time.time()
+            timing['seconds'] = round(timing['end'] - timing['start'], 3)
+    
+    def add_images(self, scene: Scene, paths: List[str], seconds: float):
+        """Lưu ảnh của một cảnh"""
+        with self._lock:
+            self.images[scene.index] = paths
+            self.scene_timings[scene.index] = round(seconds, 3)
+    
+    def remove(self):
+        """Xóa file trạng thái"""
+        if self.path.exists():
+            self.path.unlink()
+
+class StoryboardPipeline:
+    """Chạy liền các bước chỉnh sửa truyện → viết kịch bản → tạo ảnh theo cảnh
+
+    Kịch bản được stream từ LLM; mỗi cảnh được đưa sang thread tạo ảnh ngay khi
+    model bắt đầu viết cảnh kế tiếp, nên LM Studio và Stable Diffusion chạy song
+    song. Trạng thái được lưu sau mỗi bước/cảnh để chạy lại chỉ làm phần còn thiếu.
+    """
+    
+    def __init__(self, editor, image_gen, state_dir: Optional[str] = None):
+        self.editor = editor
+        self.image_gen = image_gen
+        self.state_dir = state_dir
+        self.logger = logging.getLogger(__name__)
+    
+    def run(self, story: str, num_scenes: int = 5, style: str = "anime",
+            detail_level: str = "chi tiết", edit_type: Optional[str] = None,
+            length_preference: str = "giữ nguyên",
+            image_options: Optional[Dict[str, Any]] = None,
+            script_callback: Optional[Callable[[str], None]] = None,
+            scene_callback: Optional[Callable[[Scene, List[str]], None]] = None,
+            status_callback: Optional[Callable[[str, str], None]] = None,
+            cancel_event: Optional[threading.Event] = None) -> StoryboardState:
+        """Chạy pipeline, trả về trạng thái cuối (cảnh, ảnh, thời gian từng bước)
+
+        edit_type=None bỏ qua bước chỉnh sửa truyện. script_callback(đoạn text) nhận
+        kịch bản đang stream, scene_callback(cảnh, ảnh) được gọi khi xong ảnh của một
+        cảnh, status_callback(bước, thông báo) báo tiến trình.
+        """
+        image_options = dict(image_options or {})
+        settings = {
+            'num_scenes': num_scenes, 'style': style, 'detail_level': detail_level,
+            'edit_type': edit_type, 'length_preference': length_preference,
+            'image_options': image_options
+        }
+        state = StoryboardState(story, settings, self.state_dir)
+        
+        def status(stage: str, message: str):
+            self.logger.info(f"[storyboard {state.id}] {stage}: {message}")
+            if status_callback:
+                status_callback(stage, message)
+        
+        def cancelled() -> bool:
+            return cancel_event is not None and cancel_event.is_set()
+        
+        # Bước 1: chỉnh sửa truyện
+        if edit_type is None:
+            state.edited_story = story
+        elif state.edited_story is None:
+            status("edit", "Đang chỉnh sửa truyện...")
+            state.start_stage("edit")
+            edited_story = self.editor.edit_story_chunked(story, edit_type, length_preference)
+            # Không lưu lỗi vào trạng thái, nếu không lần chạy sau sẽ dùng lại nó như truyện đã sửa
+            if not edited_story.strip() or is_error_response(edited_story):
+                raise RuntimeError(f"Chỉnh sửa truyện thất bại: {edited_story.strip()[:200]}")
+            state.edited_story = edited_story
+            state.end_stage("edit")
+            state.save()
+        else:
+            status("edit", "Dùng lại truyện đã chỉnh sửa")
+        
+        # Bước 3 chạy trên thread riêng, nhận cảnh qua hàng đợi
+        scene_queue: 'queue.Queue[Optional[Scene]]' = queue.Queue()
+        image_errors: List[Exception] = []
+        image_thread = threading.Thread(
+            target=self._image_worker,
+            args=(state, scene_queue, image_options, scene_callback, status, cancel_event, image_errors),
+            daemon=True
+        )
+        image_thread.start()
+        
+        try:
+            # Bước 2: viết kịch bản, đưa từng cảnh sang tạo ảnh ngay khi viết xong
+            if state.script is not None:
+                status("script", f"Dùng lại kịch bản đã viết ({len(state.scenes)} cảnh)")
+                if script_callback:
+                    script_callback(state.script)
+                for scene in state.scenes:
+                    scene_queue.put(scene)
+            else:
+                self._stream_script(state, scene_queue, num_scenes, style, detail_level,
+                                    script_callback, status, cancelled)
+        finally:
+            scene_queue.put(None)
+            image_thread.join()
+        
+        if image_errors:
+            raise image_errors[0]
+        
+        state.save()
+        status("done", f"Xong {len(state.images)}/{len(state.scenes)} cảnh")
+        return state
+    
+    def _stream_script(self, state: StoryboardState, scene_queue: 'queue.Queue[Optional[Scene]]',
+                       num_scenes: int, style: str, detail_level: str,
+                       script_callback: Optional[Callable[[str], None]],
+                       status: Callable[[str, str], None], cancelled: Callable[[], bool]):
+        """Stream kịch bản; cảnh trước được coi là xong khi cảnh sau bắt đầu"""
+        status("script", "Đang viết kịch bản ảnh...")
+        state.start_stage("script")
+        
+        # Kịch bản mới có thể khác lần trước; cảnh trùng prompt vẫn dùng lại cache ảnh
+        state.images.clear()
+        
+        parts = []
+        emitted = 0
+        
+        for delta in self.editor.stream_image_script(state.edited_story, num_scenes=num_scenes,
+                                                     style=style, detail_level=detail_level):
+            if cancelled():
+                return
+            
+            parts.append(delta)
+            if script_callback:
+                script_callback(delta)
+            
+            # Chỉ đọc lại kịch bản khi có dòng mới
+            if '\n' not in delta:
+                continue
+            
+            scenes = parse_scene_script("".join(parts))
+            for scene in scenes[emitted:-1]:
+                status("script", f"Đã viết xong cảnh {scene.index}")
+                scene_queue.put(scene)
+            emitted = max(emitted, len(scenes) - 1)
+        
+        script = "".join(parts).strip()
+        scenes = parse_scene_script(script)
+        if not scenes:
+            raise RuntimeError(f"Không đọc được cảnh nào từ kịch bản: {script[:200]}")
+        
+        for scene in scenes[emitted:]:
+            scene_queue.put(scene)
+        
+        state.script = script
+        state.scenes = scenes
+        state.end_stage("script")
+        state.save()
+        status("script", f"Đã viết kịch bản {len(scenes)} cảnh")
+    
+    def _image_worker(self, state: StoryboardState, scene_queue: 'queue.Queue[Optional[Scene]]',
+                      image_options: Dict[str, Any],
+                      scene_callback: Optional[Callable[[Scene, List[str]], None]],
+                      status: Callable[[str, str], None], cancel_event: Optional[threading.Event],
+                      errors: List[Exception]):
+        """Tạo ảnh cho từng cảnh nhận được (chạy trên thread riêng)"""
+        started = False
+        
+        while True:
+            scene = scene_queue.get()
+            if scene is None:
+                break
+            if (cancel_event is not None and cancel_event.is_set()) or errors:
+                continue
+            
+            if not started:
+                state.start_stage("images")
+                started = True
+            
+            paths = state.images.get(scene.index)
+            if paths is None:
+                prompt = scene.image_prompt()
+                if not prompt:
+                    self.logger.warning(f"Scene {scene.index} has no prompt, skipped")
+                    continue
+                
+                status("images", f"Đang tạo ảnh cảnh {scene.index}: {scene.name}")
+                start = time.time()
+                try:
+                    paths = self.image_gen.generate(prompt=prompt, cancel_event=cancel_event, **image_options)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                
+                # Cảnh bị hủy giữa chừng chỉ có ảnh chưa khử nhiễu xong
+                if cancel_event is not None and cancel_event.is_set():
+                    continue
+                
+                # Ảnh placeholder không được lưu để lần chạy sau tạo lại
+                if not all(Path(path).name.startswith(PLACEHOLDER_PREFIX) for path in paths):
+                    state.add_images(scene, paths, time.time() - start)
+                    state.save()
+            
+            if scene_callback:
+                scene_callback(scene, paths)
+        
+        if started:
+            state.end_stage("images")
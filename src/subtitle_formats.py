@@ -0,0 +1,156 @@
+import html
+import re
+from typing import List, Tuple
+
+import pysrt
+
+# Một câu phụ đề: (bắt đầu ms, kết thúc ms, nội dung)
+Cue = Tuple[int, int, str]
+
+# Định dạng phụ đề đọc được, theo thứ tự ưu tiên khi cùng một ngôn ngữ có nhiều file
+SUBTITLE_EXTENSIONS = ['.srt', '.vtt', '.ass', '.ssa']
+
+# Mốc thời gian WebVTT: "01:02:03.456" hoặc "02:03.456"
+VTT_TIME_PATTERN = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})')
+
+# Mốc thời gian ASS: "1:02:03.45" (phần trăm giây)
+ASS_TIME_PATTERN = re.compile(r'(\d+):(\d{2}):(\d{2})[.:](\d{2})')
+
+# Thẻ định dạng trong VTT (<c>, <i>, <00:00:01.000>) và ASS ({\an8}, {\i1})
+VTT_TAG_PATTERN = re.compile(r'<[^>]*>')
+ASS_TAG_PATTERN = re.compile(r'\{[^}]*\}')
+
+# Thẻ chỉ có trong phụ đề tự động của YouTube: <c> và mốc thời gian từng chữ <00:00:01.000>
+VTT_AUTO_CAPTION_PATTERN = re.compile(r'<c[.>]|<\d{2}:\d{2}(?::\d{2})?\.\d{3}>')
+
+def _vtt_time(text: str) -> int:
+    """Mốc thời gian WebVTT sang mili giây"""
+    match = VTT_TIME_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Mốc thời gian VTT không hợp lệ: {text}")
+    hours, minutes, seconds, millis = match.groups()
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+def _ass_time(text: str) -> int:
+    """Mốc thời gian ASS sang mili giây"""
+    match = ASS_TIME_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Mốc thời gian ASS không hợp lệ: {text}")
+    hours, minutes, seconds, centis = match.groups()
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(centis) * 10
+
+def parse_vtt(content: str) -> List[Cue]:
+    """Đọc phụ đề WebVTT
+
+    Phụ đề tự động của YouTube (có thẻ <c>) lặp lại dòng của câu trước ở đầu
+    câu sau (chữ chạy), các dòng lặp này bị bỏ để không dịch hai lần. Phụ đề
+    thường giữ nguyên các câu lặp lại.
+    """
+    cues: List[Cue] = []
+    previous_lines: List[str] = []
+    auto_caption = bool(VTT_AUTO_CAPTION_PATTERN.search(content))
+    
+    for block in re.split(r'\n\s*\n', content.replace('\r\n', '\n').replace('\r', '\n')):
+        lines = [line for line in block.split('\n') if line.strip()]
+        timing_index = next((i for i, line in enumerate(lines) if '-->' in line), None)
+        # Header WEBVTT, NOTE, STYLE, REGION không có dòng thời gian
+        if timing_index is None:
+            continue
+        
+        start_text, end_text = lines[timing_index].split('-->', 1)
+        try:
+            start = _vtt_time(start_text)
+            end = _vtt_time(end_text.strip().split()[0])
+        except (ValueError, IndexError):
+            continue
+        
+        text_lines = [html.unescape(VTT_TAG_PATTERN.sub('', line)).strip()
+                      for line in lines[timing_index + 1:]]
+        text_lines = [line for line in text_lines if line]
+        
+        if auto_caption:
+            current_lines = list(text_lines)
+            while text_lines and text_lines[0] in previous_lines:
+                text_lines.pop(0)
+            previous_lines = current_lines
+        
+        if text_lines:
+            cues.append((start, end, "\n".join(text_lines)))
+    
+    return cues
+
+def parse_ass(content: str) -> List[Cue]:
+    """Đọc phụ đề ASS/SSA (các dòng Dialogue trong mục [Events])"""
+    cues: List[Cue] = []
+    fields: List[str] = []
+    in_events = False
+    
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_events = line.lower() == '[events]'
+            continue
+        if not in_events or ':' not in line:
+            continue
+        
+        kind, value = line.split(':', 1)
+        kind = kind.strip().lower()
+        
+        if kind == 'format':
+            fields = [field.strip().lower() for field in value.split(',')]
+            continue
+        if kind != 'dialogue' or not fields:
+            continue
+        
+        # Text là trường cuối và có thể chứa dấu phẩy
+        values = [part.strip() for part in value.split(',', len(fields) - 1)]
+        if len(values) != len(fields):
+            continue
+        
+        row = dict(zip(fields, values))
+        try:
+            start = _ass_time(row.get('start', ''))
+            end = _ass_time(row.get('end', ''))
+        except ValueError:
+            continue
+        
+        text = ASS_TAG_PATTERN.sub('', row.get('text', ''))
+        text = text.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ')
+        text = "\n".join(part.strip() for part in text.split('\n') if part.strip())
+        
+        if text:
+            cues.append((start, end, text))
+    
+    # Dialogue trong ASS không bắt buộc theo thứ tự thời gian
+    cues.sort(key=lambda cue: (cue[0], cue[1]))
+    return cues
+
+def read_cues(file_path: str) -> List[Cue]:
+    """Đọc file phụ đề (SRT, VTT, ASS/SSA) thành danh sách câu"""
+    lower = file_path.lower()
+    
+    if lower.endswith('.srt'):
+        subs = pysrt.open(file_path, encoding='utf-8')
+        return [(sub.start.ordinal, sub.end.ordinal, sub.text) for sub in subs]
+    
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        content = f.read()
+    
+    if lower.endswith('.vtt'):
+        return parse_vtt(content)
+    if lower.endswith(('.ass', '.ssa')):
+        return parse_ass(content)
+    
+    raise ValueError(f"Không hỗ trợ định dạng phụ đề: {file_path}")
+
+def write_srt(cues: List[Cue], file_path: str):
+    """Ghi danh sách câu ra file SRT"""
+    subs = pysrt.SubRipFile()
+    for index, (start, end, text) in enumerate(cues, 1):
+        subs.append(pysrt.SubRipItem(
+            index=index,
+            start=pysrt.SubRipTime.from_ordinal(start),
+            end=pysrt.SubRipTime.from_ordinal(end),
+            text=text
+        ))
+    subs.save(file_path, encoding='utf-8')
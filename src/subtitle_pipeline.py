@@ -0,0 +1,268 @@
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Callable
+
+import logging
+
+from subtitle_formats import SUBTITLE_EXTENSIONS, read_cues, write_srt
+
+# Ngôn ngữ phụ đề dùng làm bản gốc để dịch, theo thứ tự ưu tiên
+DEFAULT_SOURCE_LANGS = ['zh', 'en']
+
+# Số file phụ đề dịch cùng lúc (số request tới LM Studio do translation_workers giới hạn)
+DEFAULT_FILE_WORKERS = 2
+
+def primary_lang(lang: str) -> str:
+    """Mã ngôn ngữ chính (zh-Hans -> zh, en-US -> en)"""
+    return lang.split('-')[0].split('_')[0].lower()
+
+def find_subtitle_files(video_file: str) -> Dict[str, str]:
+    """Phụ đề yt-dlp ghi cạnh video ("<tên>.<ngôn ngữ>.<đuôi>"): {ngôn ngữ: đường dẫn}
+
+    Khi cùng một ngôn ngữ có nhiều định dạng, SRT được chọn trước.
+    """
+    base = os.path.splitext(video_file)[0]
+    found: Dict[str, str] = {}
+    
+    for path in glob.glob(glob.escape(base) + '.*.*'):
+        stem, ext = os.path.splitext(path)
+        ext = ext.lower()
+        lang = stem[len(base) + 1:]
+        if ext not in SUBTITLE_EXTENSIONS or not lang or '.' in lang:
+            continue
+        
+        current = found.get(lang)
+        current_ext = os.path.splitext(current)[1].lower() if current else None
+        if current is None or SUBTITLE_EXTENSIONS.index(ext) < SUBTITLE_EXTENSIONS.index(current_ext):
+            found[lang] = path
+    
+    return found
+
+class SubtitleTask:
+    """Dịch phụ đề của một video đã tải"""
+    
+    def __init__(self, video_file: str):
+        self.video_file = video_file
+        self.status = "queued"
+        self.source_lang: Optional[str] = None
+        self.source_file: Optional[str] = None
+        self.output_file: Optional[str] = None
+        # Số thứ tự các câu không dịch được (giữ nguyên câu gốc)
+        self.untranslated: List[int] = []
+        self.progress = 0.0
+        self.message = ""
+        self.error: Optional[str] = None
+        self.queued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Thông tin task dạng dict"""
+        return {
+            'video_file': self.video_file,
+            'status': self.status,
+            'source_lang': self.source_lang,
+            'source_file': self.source_file,
+            'output_file': self.output_file,
+            'untranslated': self.untranslated,
+            'progress': round(self.progress, 4),
+            'message': self.message,
+            'error': self.error
+        }
+
+class SubtitlePipeline:
+    """Dịch phụ đề ngay khi từng video tải xong, song song với các video còn đang tải
+
+    Mỗi video chọn một phụ đề gốc theo source_langs (VTT/ASS được đổi sang SRT
+    cạnh video), bản dịch được ghi thành "<tên video>.<tgt_lang>.srt". Video đã có
+    phụ đề ngôn ngữ đích được bỏ qua. Mọi file dùng chung một worker pool gửi
+    batch tới LM Studio như translate_cli.
+    """
+    
+    def __init__(self, translator, tgt_lang: str = "vi", source_langs: Optional[List[str]] = None,
+                 style: str = "hiện đại", batch_size: int = 10, token_budget: Optional[int] = None,
+                 translation_workers: int = 1, file_workers: int = DEFAULT_FILE_WORKERS,
+                 task_callback: Optional[Callable[[SubtitleTask], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.translator = translator
+        self.tgt_lang = tgt_lang
+        self.source_langs = source_langs or DEFAULT_SOURCE_LANGS
+        self.style = style
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.task_callback = task_callback
+        
+        self.tasks: List[SubtitleTask] = []
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        # file_pool chỉ điều phối các file, batch_pool giới hạn request tới LM Studio
+        self._file_pool = ThreadPoolExecutor(max_workers=max(1, file_workers))
+        self._batch_pool = ThreadPoolExecutor(max_workers=max(1, translation_workers))
+    
+    @classmethod
+    def from_config(cls, translator, config: Dict[str, Any], **kwargs) -> 'SubtitlePipeline':
+        """Tạo pipeline từ mục "subtitle_pipeline" và các mục "translation_*" trong config.json"""
+        pipeline_config = config.get('subtitle_pipeline', {})
+        options = {
+            'tgt_lang': pipeline_config.get('target_lang', "vi"),
+            'source_langs': pipeline_config.get('source_langs'),
+            'style': pipeline_config.get('style', "hiện đại"),
+            'token_budget': config.get('translation_token_budget') or None,
+            'translation_workers': config.get('translation_workers', 1),
+            'file_workers': pipeline_config.get('file_workers', DEFAULT_FILE_WORKERS)
+        }
+        options.update(kwargs)
+        return cls(translator, **options)
+    
+    def submit(self, video_file: str) -> SubtitleTask:
+        """Đưa phụ đề của một video vừa tải vào hàng đợi dịch"""
+        task = SubtitleTask(video_file)
+        
+        with self._lock:
+            self.tasks.append(task)
+            self._futures.append(self._file_pool.submit(self._process, task))
+        
+        self._notify(task)
+        return task
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Chờ dịch xong các phụ đề đã đưa vào, trả về False nếu hết thời gian chờ"""
+        deadline = None if timeout is None else time.time() + timeout
+        
+        with self._lock:
+            futures = list(self._futures)
+        
+        for future in futures:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            try:
+                future.exception(timeout=remaining)
+            except FutureTimeoutError:
+                return False
+        
+        return True
+    
+    def is_idle(self) -> bool:
+        """Không còn phụ đề nào chờ hoặc đang dịch"""
+        with self._lock:
+            return all(future.done() for future in self._futures)
+    
+    def summary(self) -> Dict[str, int]:
+        """Số phụ đề theo từng trạng thái"""
+        counts = {'queued': 0, 'translating': 0, 'done': 0, 'skipped': 0, 'failed': 0}
+        
+        with self._lock:
+            for task in self.tasks:
+                counts[task.status] = counts.get(task.status, 0) + 1
+        
+        return counts
+    
+    def clear_finished(self):
+        """Xóa các task đã xong khỏi danh sách"""
+        with self._lock:
+            self.tasks = [task for task in self.tasks if task.status in ("queued", "translating")]
+            self._futures = [future for future in self._futures if not future.done()]
+    
+    def shutdown(self, wait: bool = False):
+        """Dừng các worker"""
+        self._file_pool.shutdown(wait=wait)
+        self._batch_pool.shutdown(wait=wait)
+    
+    def choose_source(self, subtitles: Dict[str, str]) -> Optional[str]:
+        """Ngôn ngữ phụ đề dùng làm bản gốc, None nếu không có phụ đề phù hợp"""
+        for wanted in self.source_langs:
+            for lang in sorted(subtitles):
+                if primary_lang(lang) == primary_lang(wanted):
+                    return lang
+        
+        # Không có ngôn ngữ ưu tiên thì dùng bất kỳ phụ đề nào khác ngôn ngữ đích
+        others = sorted(lang for lang in subtitles if primary_lang(lang) != primary_lang(self.tgt_lang))
+        return others[0] if others else None
+    
+    def _process(self, task: SubtitleTask):
+        """Tìm, chuyển đổi và dịch phụ đề của một video (chạy trên file worker)"""
+        task.started_at = time.time()
+        
+        try:
+            subtitles = find_subtitle_files(task.video_file)
+            
+            if any(primary_lang(lang) == primary_lang(self.tgt_lang) for lang in subtitles):
+                self._finish(task, "skipped", f"Đã có phụ đề {self.tgt_lang}")
+                return
+            
+            lang = self.choose_source(subtitles)
+            if lang is None:
+                self._finish(task, "skipped", "Video không có phụ đề")
+                return
+            
+            task.source_lang = lang
+            task.source_file = self._as_srt(subtitles[lang])
+            task.status = "translating"
+            task.message = f"Đang dịch phụ đề {lang} → {self.tgt_lang}"
+            self._notify(task)
+            
+            def on_progress(current, total):
+                task.progress = current / total if total else 0.0
+                task.message = f"Đang dịch phụ đề {lang}: {current}/{total} batch"
+                self._notify(task)
+            
+            result = self.translator.translate_file(
+                file_path=task.source_file,
+                src_lang=primary_lang(lang),
+                tgt_lang=self.tgt_lang,
+                style=self.style,
+                batch_size=self.batch_size,
+                progress_callback=on_progress,
+                token_budget=self.token_budget,
+                executor=self._batch_pool,
+                untranslated_callback=task.untranslated.extend
+            )
+            
+            output_file = f"{os.path.splitext(task.video_file)[0]}.{self.tgt_lang}.srt"
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(result)
+            
+            task.output_file = output_file
+            task.progress = 1.0
+            message = f"Đã dịch phụ đề: {os.path.basename(output_file)}"
+            if task.untranslated:
+                message += f" ({len(task.untranslated)} câu không dịch được, giữ nguyên câu gốc)"
+            self._finish(task, "done", message)
+        
+        except Exception as e:
+            self.logger.error(f"Subtitle translation failed for {task.video_file}: {str(e)}")
+            task.error = str(e)
+            self._finish(task, "failed", f"Lỗi dịch phụ đề: {str(e)}")
+    
+    def _as_srt(self, subtitle_file: str) -> str:
+        """Đổi phụ đề VTT/ASS sang SRT cạnh file gốc (SRTTranslator chỉ đọc SRT)"""
+        if subtitle_file.lower().endswith('.srt'):
+            return subtitle_file
+        
+        cues = read_cues(subtitle_file)
+        if not cues:
+            raise ValueError(f"Không đọc được câu nào từ {os.path.basename(subtitle_file)}")
+        
+        srt_file = os.path.splitext(subtitle_file)[0] + '.srt'
+        write_srt(cues, srt_file)
+        self.logger.info(f"Converted {os.path.basename(subtitle_file)} to SRT ({len(cues)} cues)")
+        return srt_file
+    
+    def _finish(self, task: SubtitleTask, status: str, message: str):
+        """Kết thúc task và báo trạng thái"""
+        task.status = status
+        task.message = message
+        task.finished_at = time.time()
+        self.logger.info(f"{os.path.basename(task.video_file)}: {message} "
+                         f"({task.finished_at - (task.started_at or task.queued_at):.1f}s)")
+        self._notify(task)
+    
+    def _notify(self, task: SubtitleTask):
+        """Báo task đổi trạng thái/tiến trình"""
+        if self.task_callback:
+            try:
+                self.task_callback(task)
+            except Exception as e:
+                self.logger.error(f"Subtitle task callback failed: {str(e)}")
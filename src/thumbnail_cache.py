@@ -0,0 +1,267 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Tuple
+
+from PIL import Image
+import logging
+
+# Kích thước thumbnail mặc định cho thư viện ảnh
+DEFAULT_THUMBNAIL_SIZE = (160, 160)
+# Số thumbnail giữ trong bộ nhớ
+DEFAULT_MEMORY_ITEMS = 256
+# Số thread tạo thumbnail
+THUMBNAIL_WORKERS = 2
+# Dung lượng tối đa của thumbnail trên đĩa (MB)
+DEFAULT_MAX_DISK_MB = 200
+# Khi vượt giới hạn, xóa thumbnail ít dùng nhất tới khi còn tỉ lệ này
+DISK_EVICT_RATIO = 0.9
+
+class ThumbnailCache:
+    """Thumbnail của ảnh trong bộ nhớ (LRU) và trên đĩa, key là đường dẫn + mtime
+
+    Thumbnail được tạo trên worker thread, yêu cầu mới nhất được làm trước (LIFO)
+    để ô vừa cuộn tới hiện ra trước; yêu cầu đã hủy (ô cuộn khỏi tầm nhìn) bị bỏ.
+    Ảnh gốc bị sửa (đổi mtime/dung lượng) sẽ có key mới nên không bao giờ hiển thị
+    thumbnail cũ. Thumbnail trên đĩa được giới hạn max_disk_mb, xóa file ít dùng nhất.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, size: Tuple[int, int] = DEFAULT_THUMBNAIL_SIZE,
+                 memory_items: int = DEFAULT_MEMORY_ITEMS, workers: int = THUMBNAIL_WORKERS,
+                 max_disk_mb: float = DEFAULT_MAX_DISK_MB):
+        self.logger = logging.getLogger(__name__)
+        
+        if cache_dir is None:
+            cache_dir = str(Path(__file__).parent.parent / 'cache' / 'thumbnails')
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        self.size = size
+        self.memory_items = memory_items
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        
+        self._memory: 'OrderedDict[str, Image.Image]' = OrderedDict()
+        self._pending: Dict[str, List[Callable[[str, Optional[Image.Image]], None]]] = {}
+        # Key chờ tạo (mới nhất ở cuối) và đường dẫn ảnh gốc của từng key
+        self._queue: List[str] = []
+        self._queue_paths: Dict[str, str] = {}
+        # Key hiện tại của từng ảnh, để xóa thumbnail cũ khi ảnh bị sửa
+        self._keys_by_path: Dict[str, str] = {}
+        self._disk_size = sum(f.stat().st_size for f in self.cache_dir.glob('*.png'))
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._stopped = False
+        
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
+    
+    def _key(self, path: str) -> Optional[str]:
+        """Key từ đường dẫn, mtime, dung lượng và kích thước thumbnail; None nếu file không còn"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        
+        abs_path = os.path.abspath(path)
+        raw = f"{abs_path}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        key = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        
+        with self._lock:
+            old_key = self._keys_by_path.get(abs_path)
+            self._keys_by_path[abs_path] = key
+            if old_key is not None and old_key != key:
+                self._memory.pop(old_key, None)
+        
+        # Ảnh gốc đã bị sửa, thumbnail cũ không bao giờ được dùng lại
+        if old_key is not None and old_key != key:
+            self._remove_disk_file(self.cache_dir / f"{old_key}.png")
+        return key
+    
+    def get(self, path: str) -> Optional[Image.Image]:
+        """Thumbnail đã có trong bộ nhớ, None nếu chưa (không đọc đĩa)"""
+        key = self._key(path)
+        if key is None:
+            return None
+        
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+            return image
+    
+    def request(self, path: str, callback: Callable[[str, Optional[Image.Image]], None]):
+        """Lấy thumbnail: gọi callback(path, ảnh) ngay nếu có trong bộ nhớ, ngược lại
+        gọi từ worker thread sau khi đọc cache đĩa hoặc tạo mới (ảnh None nếu lỗi)
+        """
+        key = self._key(path)
+        if key is None:
+            callback(path, None)
+            return
+        
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+            elif key in self._pending:
+                # Đang chờ/đang tạo, chỉ cần chờ kết quả; còn chờ thì đưa lên đầu hàng
+                self._pending[key].append(callback)
+                if key in self._queue_paths:
+                    self._queue.remove(key)
+                    self._queue.append(key)
+                return
+            else:
+                self._pending[key] = [callback]
+                self._queue.append(key)
+                self._queue_paths[key] = path
+                self._cond.notify()
+        
+        if image is not None:
+            callback(path, image)
+    
+    def cancel(self, path: str, callback: Callable[[str, Optional[Image.Image]], None]):
+        """Bỏ yêu cầu chưa xử lý (ví dụ ô đã cuộn khỏi tầm nhìn); callback sẽ không được gọi"""
+        with self._lock:
+            key = self._keys_by_path.get(os.path.abspath(path))
+            callbacks = self._pending.get(key)
+            if not callbacks or callback not in callbacks:
+                return
+            
+            callbacks.remove(callback)
+            # Không còn ai chờ và chưa bắt đầu tạo thì bỏ khỏi hàng đợi
+            if not callbacks and key in self._queue_paths:
+                del self._pending[key]
+                del self._queue_paths[key]
+                self._queue.remove(key)
+    
+    def prefetch(self, paths: List[str]):
+        """Tạo trước thumbnail cho các ảnh (không cần kết quả)"""
+        for path in paths:
+            self.request(path, lambda _path, _image: None)
+    
+    def _worker(self):
+        """Lấy yêu cầu mới nhất trong hàng đợi và tạo thumbnail"""
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key = self._queue.pop()
+                path = self._queue_paths.pop(key)
+            
+            self._load(path, key)
+    
+    def _load(self, path: str, key: str):
+        """Đọc thumbnail từ đĩa hoặc tạo mới (chạy trên worker thread)"""
+        image = None
+        cached_file = self.cache_dir / f"{key}.png"
+        
+        try:
+            image = self._read_disk_file(cached_file)
+            if image is None:
+                image = self._render(path)
+                self._write_disk_file(image, cached_file)
+        except Exception as e:
+            self.logger.warning(f"Could not create thumbnail for {path}: {str(e)}")
+        
+        with self._lock:
+            if image is not None:
+                self._memory[key] = image
+                while len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+            callbacks = self._pending.pop(key, [])
+        
+        for callback in callbacks:
+            try:
+                callback(path, image)
+            except Exception as e:
+                self.logger.error(f"Thumbnail callback failed: {str(e)}")
+    
+    def _read_disk_file(self, cached_file: Path) -> Optional[Image.Image]:
+        """Thumbnail đã lưu trên đĩa, None nếu chưa có (hoặc vừa bị xóa)"""
+        try:
+            image = Image.open(cached_file)
+            image.load()
+        except (OSError, ValueError):
+            return None
+        
+        # mtime đánh dấu lần dùng gần nhất để xóa file ít dùng trước
+        try:
+            os.utime(cached_file)
+        except OSError:
+            pass
+        return image
+    
+    def _write_disk_file(self, image: Image.Image, cached_file: Path):
+        """Lưu thumbnail ra đĩa rồi xóa bớt nếu vượt giới hạn dung lượng"""
+        tmp_file = cached_file.with_suffix(f'.{threading.get_ident()}.tmp')
+        image.save(tmp_file, format='PNG')
+        os.replace(tmp_file, cached_file)
+        
+        with self._lock:
+            self._disk_size += cached_file.stat().st_size
+            over_limit = self._disk_size > self.max_disk_bytes
+        
+        if over_limit:
+            self._evict_disk()
+    
+    def _evict_disk(self):
+        """Xóa thumbnail ít dùng nhất tới khi còn DISK_EVICT_RATIO giới hạn dung lượng"""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * DISK_EVICT_RATIO
+        removed = 0
+        
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        
+        with self._lock:
+            self._disk_size = total
+        self.logger.info(f"Evicted {removed} thumbnails, {total / 1024 / 1024:.1f}MB left")
+    
+    def _remove_disk_file(self, cached_file: Path):
+        """Xóa một thumbnail trên đĩa"""
+        try:
+            size = cached_file.stat().st_size
+            cached_file.unlink()
+        except OSError:
+            return
+        
+        with self._lock:
+            self._disk_size -= size
+    
+    def _render(self, path: str) -> Image.Image:
+        """Tạo thumbnail từ ảnh gốc"""
+        with Image.open(path) as source:
+            # JPEG có thể decode thẳng ở độ phân giải thấp
+            source.draft('RGB', self.size)
+            image = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        
+        image.thumbnail(self.size)
+        return image
+    
+    def shutdown(self):
+        """Dừng worker, bỏ các yêu cầu còn chờ"""
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._queue_paths.clear()
+            self._cond.notify_all()
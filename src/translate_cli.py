@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dịch hàng loạt file SRT không cần giao diện
+
+Ví dụ:
+    python src/translate_cli.py "season1/*.srt" --tgt-lang vi --workers 4
+    python src/translate_cli.py subs/ --token-budget 1500 --scene-gap 3
+"""
+
+import sys
+import json
+import glob
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any
+
+# Thêm thư mục hiện tại vào PATH
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import pysrt
+
+from api_client import LMStudioClient
+from llm_cache import CompletionCache
+from srt_translator import SRTTranslator
+from utils.tokens import estimate_tokens
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(description="Dịch hàng loạt file SRT bằng LM Studio")
+    parser.add_argument('inputs', nargs='+', help="File .srt, thư mục hoặc glob")
+    parser.add_argument('--src-lang', default='auto', help="Ngôn ngữ gốc (mặc định: auto)")
+    parser.add_argument('--tgt-lang', default='vi', help="Ngôn ngữ đích (mặc định: vi)")
+    parser.add_argument('--style', default='hiện đại', help="Văn phong dịch")
+    parser.add_argument('--batch-size', type=int, default=10, help="Số câu mỗi batch")
+    parser.add_argument('--token-budget', type=int, default=None, help="Chia batch theo số token")
+    parser.add_argument('--scene-gap', type=float, default=None, help="Tách batch khi khoảng lặng >= N giây")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Số request đồng thời tới LM Studio cho tất cả file")
+    parser.add_argument('--suffix', default='_translated', help="Hậu tố tên file kết quả")
+    parser.add_argument('--overwrite', action='store_true', help="Dịch lại cả file đã có kết quả")
+    parser.add_argument('--no-cache', action='store_true', help="Không dùng cache kết quả LLM")
+    parser.add_argument('--no-resume', action='store_true', help="Không dùng nhật ký để dịch tiếp")
+    parser.add_argument('--lm-url', default=None, help="URL LM Studio (mặc định lấy từ config.json)")
+    parser.add_argument('--config', default=str(current_dir.parent / 'config.json'), help="File cấu hình")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Hiện log chi tiết")
+    return parser.parse_args(argv)
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """Đọc config.json, trả về dict rỗng nếu không có"""
+    path = Path(config_path)
+    if not path.exists():
+        return {}
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def collect_srt_files(inputs: List[str], suffix: str) -> List[Path]:
+    """Gom danh sách file SRT từ file, thư mục và glob (bỏ qua file kết quả)"""
+    files = []
+    
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = sorted(path.rglob('*.srt'))
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = sorted(Path(p) for p in glob.glob(item, recursive=True))
+        
+        for candidate in candidates:
+            if candidate.suffix.lower() == '.srt' and not candidate.stem.endswith(suffix):
+                if candidate not in files:
+                    files.append(candidate)
+    
+    return files
+
+def output_path_for(file_path: Path, suffix: str) -> Path:
+    """File kết quả nằm cạnh file gốc"""
+    return file_path.with_name(f"{file_path.stem}{suffix}{file_path.suffix}")
+
+def main(argv=None) -> int:
+    """Hàm chính của CLI"""
+    args = parse_args(argv)
+    
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    
+    config = load_config(args.config)
+    workers = args.workers or config.get('translation_workers', 1)
+    token_budget = args.token_budget or config.get('translation_token_budget') or None
+    
+    files = collect_srt_files(args.inputs, args.suffix)
+    if not args.overwrite:
+        files = [f for f in files if not output_path_for(f, args.suffix).exists()]
+    
+    if not files:
+        print("Không có file SRT nào cần dịch")
+        return 0
+    
+    # Một client và một worker pool dùng chung cho mọi file
+    cache = None if args.no_cache else CompletionCache.from_config(config)
+    client = LMStudioClient(
+        args.lm_url or config.get('lm_studio_url', "http://localhost:1234/v1"),
+        pool_size=max(10, workers),
+        cache=cache
+    )
+    
+    if not client.check_connection():
+        print(f"❌ Không kết nối được LM Studio tại {client.base_url}")
+        return 1
+    
+    translator = SRTTranslator(client)
+    
+    print(f"Dịch {len(files)} file, {workers} request đồng thời...")
+    
+    print_lock = threading.Lock()
+    totals = {'cues': 0, 'tokens': 0, 'failed': 0}
+    
+    def translate_one(file_path: Path, executor) -> None:
+        start = time.time()
+        subs = pysrt.open(str(file_path), encoding='utf-8')
+        untranslated = []
+        
+        result = translator.translate_file(
+            file_path=str(file_path),
+            src_lang=args.src_lang,
+            tgt_lang=args.tgt_lang,
+            style=args.style,
+            batch_size=args.batch_size,
+            token_budget=token_budget,
+            scene_gap=args.scene_gap,
+            resume=not args.no_resume,
+            executor=executor,
+            untranslated_callback=untranslated.extend
+        )
+        
+        output_path = output_path_for(file_path, args.suffix)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(result)
+        
+        elapsed = max(time.time() - start, 1e-6)
+        # Token tính bằng ước lượng cục bộ cho cả đầu vào và bản dịch
+        tokens = estimate_tokens(subs.text) + estimate_tokens(result)
+        
+        with print_lock:
+            totals['cues'] += len(subs)
+            totals['tokens'] += tokens
+            print(f"✅ {file_path.name}: {len(subs)} câu trong {elapsed:.1f}s "
+                  f"({len(subs) / elapsed:.1f} câu/s, ~{tokens / elapsed:.0f} token/s) -> {output_path.name}")
+            if untranslated:
+                print(f"⚠️ {file_path.name}: {len(untranslated)} câu không dịch được, "
+                      f"giữ nguyên câu gốc: {untranslated[:20]}")
+    
+    started = time.time()
+    
+    # batch_pool giới hạn request tới LM Studio, file_pool chỉ điều phối các file
+    with ThreadPoolExecutor(max_workers=workers) as batch_pool, \
+            ThreadPoolExecutor(max_workers=workers) as file_pool:
+        futures = {file_pool.submit(translate_one, f, batch_pool): f for f in files}
+        
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                with print_lock:
+                    totals['failed'] += 1
+                    print(f"❌ {futures[future].name}: {str(e)}")
+    
+    elapsed = max(time.time() - started, 1e-6)
+    
+    print("=" * 60)
+    print(f"Hoàn thành {len(files) - totals['failed']}/{len(files)} file trong {elapsed:.1f}s")
+    print(f"Tốc độ: {totals['cues'] / elapsed:.1f} câu/s, ~{totals['tokens'] / elapsed:.0f} token/s")
+    
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate'] * 100:.0f}%)")
+    
+    return 1 if totals['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
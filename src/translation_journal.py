@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import logging
+
+class TranslationJournal:
+    """Nhật ký dịch SRT: lưu kết quả từng batch để dịch tiếp khi bị gián đoạn
+
+    Tên file nhật ký gồm hash nội dung file SRT và các thiết lập ảnh hưởng tới
+    cách chia batch/bản dịch, nên đổi file hoặc thiết lập sẽ tạo nhật ký mới.
+    """
+    
+    def __init__(self, file_path: str, settings: Dict[str, Any], journal_dir: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        
+        if journal_dir is None:
+            journal_dir = str(Path(__file__).parent.parent / 'temp' / 'srt_journal')
+        Path(journal_dir).mkdir(parents=True, exist_ok=True)
+        
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        
+        self.path = Path(journal_dir) / f"{Path(file_path).stem}_{digest.hexdigest()[:16]}.jsonl"
+        self._lock = threading.Lock()
+    
+    def load(self) -> Dict[int, List[str]]:
+        """Đọc các batch đã dịch xong: {batch index: danh sách câu đã dịch}"""
+        completed = {}
+        
+        if not self.path.exists():
+            return completed
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    completed[int(record['batch'])] = list(record['texts'])
+                except (ValueError, KeyError, TypeError):
+                    # Dòng cuối có thể bị ghi dở khi ứng dụng bị tắt đột ngột
+                    self.logger.warning(f"Skipped invalid journal line in {self.path.name}")
+        
+        return completed
+    
+    def record(self, batch_index: int, texts: List[str]):
+        """Ghi kết quả một batch vào nhật ký"""
+        line = json.dumps({'batch': batch_index, 'texts': texts}, ensure_ascii=False)
+        
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def remove(self):
+        """Xóa nhật ký sau khi dịch xong toàn bộ file"""
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
@@ -0,0 +1,8 @@
+import re
+
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng nhanh số token: ~1 token/ký tự CJK, ~4 ký tự/token với phần còn lại"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
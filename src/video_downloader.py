@@ -1,18 +1,79 @@
 import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
 import os
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 
+from download_progress import ProgressAdapter, DEFAULT_PROGRESS_INTERVAL
+from video_info_cache import VideoInfoCache
+from download_archive import DownloadArchive, link_into
+from media_postprocessor import MediaPostProcessor
+
+# Số URL lấy thông tin song song khi quét playlist/danh sách
+PROBE_WORKERS = 4
+
+# Hồ sơ tải: số đoạn HLS/DASH tải song song, giới hạn băng thông mỗi video (byte/s hoặc "2M"),
+# số lần thử lại và thời gian chờ giữa các lần thử (backoff ** lần thử, tối đa max_retry_sleep giây)
+DOWNLOAD_PROFILES = {
+    "balanced": {
+        'concurrent_fragments': 4,
+        'rate_limit': None,
+        'retries': 10,
+        'retry_backoff': 2.0,
+        'max_retry_sleep': 30,
+    },
+    "fast": {
+        'concurrent_fragments': 16,
+        'rate_limit': None,
+        'retries': 20,
+        'retry_backoff': 1.5,
+        'max_retry_sleep': 10,
+    },
+    "polite": {
+        'concurrent_fragments': 1,
+        'rate_limit': '1M',
+        'retries': 5,
+        'retry_backoff': 3.0,
+        'max_retry_sleep': 60,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+
+def parse_rate(rate) -> Optional[int]:
+    """Đổi giới hạn băng thông ("2M", "500K" hoặc số byte/s) sang byte/s, None nếu không giới hạn"""
+    if not rate:
+        return None
+    if isinstance(rate, (int, float)):
+        return int(rate)
+    return yt_dlp.utils.parse_bytes(str(rate))
+
 class VideoDownloader:
     """Download video từ các nền tảng Trung Quốc"""
     
-    def __init__(self):
+    def __init__(self, info_cache: Optional[VideoInfoCache] = None,
+                 archive: Optional[DownloadArchive] = None,
+                 postprocessor: Optional[MediaPostProcessor] = None,
+                 profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default_profile: str = DEFAULT_PROFILE,
+                 platform_profiles: Optional[Dict[str, str]] = None):
         self.logger = logging.getLogger(__name__)
+        self.info_cache = info_cache
+        self.archive = archive
+        self.postprocessor = postprocessor or MediaPostProcessor()
+        
+        self.profiles = {name: dict(settings) for name, settings in DOWNLOAD_PROFILES.items()}
+        for name, settings in (profiles or {}).items():
+            self.profiles[name] = {**self.profiles.get(name, DOWNLOAD_PROFILES[DEFAULT_PROFILE]), **settings}
+        self.default_profile = default_profile if default_profile in self.profiles else DEFAULT_PROFILE
         
         # Custom extractors cho các nền tảng Trung Quốc
         self.platforms = {
             "bilibili.com": {
+                "profile": "fast",
                 "extractor": "BiliBili",
                 "options": {
                     'format': 'bestvideo+bestaudio/best',
@@ -20,67 +81,206 @@ class VideoDownloader:
                 }
             },
             "v.qq.com": {
+                "profile": "balanced",
                 "extractor": "Tencent",
                 "options": {
                     'format': 'best',
                 }
             },
             "youku.com": {
+                "profile": "balanced",
                 "extractor": "Youku",
                 "options": {
                     'format': 'best',
                 }
             },
             "iqiyi.com": {
+                "profile": "polite",
                 "extractor": "Iqiyi",
                 "options": {
                     'format': 'best',
                 }
             },
             "douyin.com": {
+                "profile": "balanced",
                 "extractor": "TikTok",
                 "options": {
                     'format': 'best',
                 }
             }
         }
+        
+        for platform, profile in (platform_profiles or {}).items():
+            if platform in self.platforms:
+                self.platforms[platform]['profile'] = profile
     
-    def get_video_info(self, url: str) -> Dict[str, Any]:
-        """Lấy thông tin video"""
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'VideoDownloader':
+        """Tạo downloader với cache, archive, xử lý sau tải và hồ sơ tải từ config.json"""
+        return cls(
+            info_cache=VideoInfoCache.from_config(config),
+            archive=DownloadArchive.from_config(config),
+            postprocessor=MediaPostProcessor(max_transcodes=config.get('max_transcodes', 1)),
+            profiles=config.get('download_profiles'),
+            default_profile=config.get('download_profile', DEFAULT_PROFILE),
+            platform_profiles=config.get('download_platform_profiles')
+        )
+    
+    def platform_for(self, url: str) -> Optional[str]:
+        """Khóa trong self.platforms ứng với URL, None nếu không thuộc nền tảng nào"""
+        netloc = urlparse(url).netloc.lower().split(':')[0]
+        
+        for platform in self.platforms:
+            if netloc == platform or netloc.endswith('.' + platform):
+                return platform
+        
+        return None
+    
+    def get_profile_options(self, url: str, profile: Optional[str] = None,
+                            rate_limit=None) -> Dict[str, Any]:
+        """Tùy chọn yt-dlp theo hồ sơ tải (chỉ định, theo nền tảng hoặc mặc định)
+        
+        rate_limit là giới hạn thêm cho video này từ bên ngoài, giới hạn nhỏ hơn sẽ được dùng.
+        """
+        if profile is None:
+            platform = self.platform_for(url)
+            profile = self.platforms[platform].get('profile') if platform else None
+        
+        if profile not in self.profiles:
+            if profile is not None:
+                self.logger.warning(f"Unknown download profile {profile}, using {self.default_profile}")
+            profile = self.default_profile
+        
+        settings = self.profiles[profile]
+        backoff = settings.get('retry_backoff', 2.0)
+        max_sleep = settings.get('max_retry_sleep', 30)
+        
+        def retry_sleep(attempt):
+            return min(backoff ** attempt, max_sleep)
+        
+        options = {
+            'concurrent_fragment_downloads': settings.get('concurrent_fragments', 1),
+            'retries': settings.get('retries', 10),
+            'fragment_retries': settings.get('retries', 10),
+            'retry_sleep_functions': {'http': retry_sleep, 'fragment': retry_sleep},
+            # Tải tiếp file .part còn dở thay vì tải lại từ đầu
+            'continuedl': True,
+        }
+        
+        limits = [limit for limit in (parse_rate(settings.get('rate_limit')), parse_rate(rate_limit)) if limit]
+        if limits:
+            options['ratelimit'] = min(limits)
+        
+        return options
+    
+    def extract_info(self, url: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Lấy thông tin đầy đủ của URL (dùng cache nếu có)
+        
+        Playlist/trang cá nhân chỉ được lấy dạng flat: mỗi entry chỉ có url/id/title.
+        """
+        if use_cache and self.info_cache:
+            cached = self.info_cache.get(url)
+            if cached is not None:
+                return cached
+        
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': False,
+            'extract_flat': 'in_playlist',
         }
         
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        
+        if self.info_cache:
+            self.info_cache.set(url, info)
+        
+        return info
+    
+    def get_video_info(self, url: str) -> Dict[str, Any]:
+        """Lấy thông tin video"""
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                return {
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration', 0),
-                    'formats': [f['format'] for f in info.get('formats', [])[:5]],
-                    'ext': info.get('ext', 'Unknown'),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'description': info.get('description', '')[:200]
-                }
+            return self._summarize_info(self.extract_info(url))
         except Exception as e:
             self.logger.error(f"Error getting video info: {str(e)}")
             raise
     
+    def probe_urls(self, urls: List[str], max_workers: int = PROBE_WORKERS) -> List[Dict[str, Any]]:
+        """Lấy thông tin nhiều URL song song
+        
+        Playlist/trang cá nhân được quét flat trước rồi lấy chi tiết từng video.
+        URL lỗi trả về dict có khóa 'error'.
+        """
+        video_urls = []
+        
+        for url in urls:
+            try:
+                info = self.extract_info(url)
+            except Exception as e:
+                self.logger.error(f"Error probing {url}: {str(e)}")
+                video_urls.append((url, e))
+                continue
+            
+            if info.get('_type') == 'playlist':
+                video_urls.extend((self._entry_url(entry), None) for entry in info.get('entries') or [])
+            else:
+                video_urls.append((url, None))
+        
+        def probe(item):
+            url, error = item
+            if error is None:
+                try:
+                    return {'url': url, **self._summarize_info(self.extract_info(url))}
+                except Exception as e:
+                    self.logger.error(f"Error probing {url}: {str(e)}")
+                    error = e
+            return {'url': url, 'error': str(error)}
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(probe, [item for item in video_urls if item[0]]))
+    
+    def _entry_url(self, entry: Dict[str, Any]) -> Optional[str]:
+        """URL của một entry trong playlist đã quét flat"""
+        return entry.get('webpage_url') or entry.get('url')
+    
+    def _summarize_info(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Rút gọn thông tin video để hiển thị"""
+        summary = {
+            'title': info.get('title', 'Unknown'),
+            'duration': info.get('duration') or 0,
+            'formats': [f['format'] for f in (info.get('formats') or [])[:5] if f.get('format')],
+            'ext': info.get('ext', 'Unknown'),
+            'thumbnail': info.get('thumbnail', ''),
+            'description': (info.get('description') or '')[:200]
+        }
+        
+        if info.get('_type') == 'playlist':
+            summary['entries'] = [
+                {'url': self._entry_url(entry), 'title': entry.get('title')}
+                for entry in info.get('entries') or []
+            ]
+        
+        return summary
+    
     def download(self, url: str, quality: str = 'best', output_format: str = 'mp4', 
                  output_path: str = None, subtitles: bool = True, 
                  audio_only: bool = False, **kwargs) -> str:
-        """Tải video"""
+        """Tải video
+        
+        progress_callback nhận ProgressEvent (tối đa một lần mỗi progress_interval giây
+        khi đang tải), status_callback nhận thông báo dạng text từ yt-dlp.
+        Video đã có trong archive không được tải lại trừ khi force=True.
+        profile chọn hồ sơ tải (mặc định theo nền tảng), rate_limit giới hạn thêm băng thông,
+        bandwidth_limiter (BandwidthLimiter) là giới hạn dùng chung với các video khác.
+        timing_callback nhận thời gian (giây) của từng bước: extract, download, postprocess.
+        """
         
         if output_path is None:
             output_path = str(Path.home() / "Downloads")
         
         # YDL options
         ydl_opts = {
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'progress_hooks': [kwargs.get('progress_callback', None)],
+            'outtmpl': os.path.join(output_path, '%(title)s [%(id)s].%(ext)s'),
             'quiet': False,
             'no_warnings': True,
             'format': self._get_format_selector(quality, audio_only),
@@ -88,12 +288,8 @@ class VideoDownloader:
             'writesubtitles': subtitles,
             'writeautomaticsub': subtitles,
             'subtitleslangs': ['zh', 'en', 'vi'] if subtitles else [],
-            'postprocessors': [
-                {
-                    'key': 'FFmpegVideoConvertor',
-                    'preferedformat': output_format,
-                }
-            ] if not audio_only else [
+            # Đổi container video do MediaPostProcessor xử lý sau khi tải (remux nếu được)
+            'postprocessors': [] if not audio_only else [
                 {
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': 'mp3',
@@ -102,18 +298,93 @@ class VideoDownloader:
             ],
             'logger': self._get_logger(kwargs.get('status_callback')),
         }
+        ydl_opts.update(self.get_profile_options(url, kwargs.get('profile'), kwargs.get('rate_limit')))
+        
+        progress_callback = kwargs.get('progress_callback')
+        if progress_callback:
+            adapter = ProgressAdapter(
+                progress_callback,
+                min_interval=kwargs.get('progress_interval', DEFAULT_PROGRESS_INTERVAL)
+            )
+            ydl_opts['progress_hooks'] = [adapter.progress_hook]
+            ydl_opts['postprocessor_hooks'] = [adapter.postprocessor_hook]
+        
+        bandwidth_limiter = kwargs.get('bandwidth_limiter')
+        if bandwidth_limiter is not None:
+            ydl_opts.setdefault('progress_hooks', []).append(bandwidth_limiter.hook())
+        
+        status_callback = kwargs.get('status_callback')
+        force = kwargs.get('force', False)
+        timings = {'extract': 0.0, 'download': 0.0, 'postprocess': 0.0}
+        stage_start = time.time()
+        
+        # Kiểm tra archive theo ID lấy từ URL, chưa cần gọi mạng
+        url_archive_id = self._archive_id_from_url(url)
+        variant = self._archive_variant(quality, output_format, audio_only)
+        if self.archive and not force and url_archive_id:
+            record = self.archive.find(*url_archive_id, variant)
+            if record is not None:
+                return self._skip_archived(record, output_path, status_callback)
+        
+        # Dùng lại thông tin đã lấy khi kiểm tra URL, tránh extract lần hai
+        cached = self.info_cache.get(url) if self.info_cache else None
+        if cached is not None and cached.get('_type', 'video') != 'video':
+            cached = None
         
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                filename = ydl.prepare_filename(info)
+                info = cached
+                if info is None:
+                    info = ydl.extract_info(url, download=False)
+                    if self.info_cache:
+                        self.info_cache.set(url, ydl.sanitize_info(info))
+                
+                timings['extract'] = time.time() - stage_start
+                stage_start = time.time()
                 
-                # Get actual output file path
-                if audio_only:
-                    base, _ = os.path.splitext(filename)
-                    output_file = f"{base}.mp3"
-                else:
-                    output_file = filename
+                # ID thật sau khi extract có thể khác ID lấy từ URL
+                if self.archive and not force and info.get('id'):
+                    record = self.archive.find(self._extractor_key(info), info['id'], variant)
+                    if record is not None:
+                        return self._skip_archived(record, output_path, status_callback)
+                
+                try:
+                    info = ydl.process_ie_result(info, download=True)
+                except yt_dlp.utils.DownloadError as e:
+                    if cached is None:
+                        raise
+                    # Link tải trong cache có thể đã hết hạn
+                    self.logger.warning(f"Cached info failed for {url}, extracting again: {str(e)}")
+                    self.info_cache.invalidate(url)
+                    info = ydl.extract_info(url, download=True)
+                
+                output_file = self._output_file(ydl, info, audio_only)
+                timings['download'] = time.time() - stage_start
+                stage_start = time.time()
+                
+                if not audio_only:
+                    output_file, action = self.postprocessor.process(output_file, output_format)
+                    timings['postprocess_action'] = action
+                timings['postprocess'] = time.time() - stage_start
+                
+                if self.archive and info.get('id'):
+                    record = self.archive.add(
+                        self._extractor_key(info),
+                        info['id'],
+                        variant,
+                        url,
+                        output_file,
+                        force=force
+                    )
+                    # File trùng nội dung có thể nằm ở thư mục khác
+                    output_file = link_into(record['file_path'], output_path)
+                
+                self.logger.info(
+                    f"Downloaded {os.path.basename(output_file)}: extract {timings['extract']:.1f}s, "
+                    f"download {timings['download']:.1f}s, postprocess {timings['postprocess']:.1f}s"
+                )
+                if kwargs.get('timing_callback'):
+                    kwargs['timing_callback'](timings)
                 
                 return output_file
                 
@@ -121,6 +392,62 @@ class VideoDownloader:
             self.logger.error(f"Download error: {str(e)}")
             raise
     
+    def _output_file(self, ydl: yt_dlp.YoutubeDL, info: Dict[str, Any], audio_only: bool) -> str:
+        """Đường dẫn file kết quả sau khi tải và xử lý xong"""
+        downloads = info.get('requested_downloads') or []
+        if downloads and downloads[0].get('filepath'):
+            return downloads[0]['filepath']
+        
+        filename = ydl.prepare_filename(info)
+        if audio_only:
+            base, _ = os.path.splitext(filename)
+            return f"{base}.mp3"
+        return filename
+    
+    def _extractor_key(self, info: Dict[str, Any]) -> str:
+        """Tên extractor dùng làm khóa archive"""
+        return info.get('extractor_key') or info.get('extractor') or 'generic'
+    
+    def _archive_variant(self, quality: str, output_format: str, audio_only: bool) -> str:
+        """Kiểu tải dùng làm khóa archive: cùng video tải audio/chất lượng/định dạng khác là bản khác"""
+        if audio_only:
+            return "audio:mp3"
+        return f"{quality}:{output_format}"
+    
+    def _archive_id_from_url(self, url: str) -> Optional[Tuple[str, str]]:
+        """(extractor, ID) suy ra từ URL như --download-archive của yt-dlp, None nếu không rõ
+
+        Chỉ dùng để tìm trong archive (bản ghi luôn lưu theo ID yt-dlp extract được).
+        Các phần của video nhiều phần (bilibili "?p=2") có chung ID trong URL nên
+        số phần được thêm vào ID giống yt-dlp ("<ID>_p2").
+        """
+        for ie in gen_extractor_classes():
+            if ie.ie_key() == 'Generic' or not ie.suitable(url):
+                continue
+            
+            try:
+                video_id = ie.get_temp_id(url)
+            except Exception:
+                video_id = None
+            if not video_id:
+                return None
+            
+            page = parse_qs(urlparse(url).query).get('p')
+            if page and not str(video_id).endswith(f"_p{page[0]}"):
+                video_id = f"{video_id}_p{page[0]}"
+            return ie.ie_key(), video_id
+        
+        return None
+    
+    def _skip_archived(self, record: Dict[str, Any], output_path: str, status_callback) -> str:
+        """Bỏ qua video đã có trong archive, đặt file đã tải vào output_path"""
+        output_file = link_into(record['file_path'], output_path)
+        message = f"Đã tải trước đó, bỏ qua: {record['file_path']}"
+        self.logger.info(message)
+        if status_callback:
+            status_callback(message)
+        return output_file
+    
     def _get_format_selector(self, quality: str, audio_only: bool) -> str:
         """Get format selector based on quality"""
         if audio_only:
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from typing import Dict, Any, Optional
+import logging
+
+# Tham số theo dõi/chia sẻ không ảnh hưởng tới nội dung video
+TRACKING_PARAMS = {
+    'spm_id_from', 'vd_source', 'from_spmid', 'share_source', 'share_medium',
+    'share_plat', 'share_session_id', 'share_tag', 'share_from', 'unique_k',
+    'bbid', 'ts', 'timestamp', 'from', 'utm_source', 'utm_medium', 'utm_campaign',
+    'ptag', 'previewer', 'is_from_webapp', 'sender_device'
+}
+
+def normalize_url(url: str) -> str:
+    """Chuẩn hóa URL để các link chia sẻ khác nhau của cùng video dùng chung cache"""
+    parsed = urlparse(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_')]
+    
+    return urlunparse((
+        (parsed.scheme or 'https').lower(),
+        parsed.netloc.lower(),
+        parsed.path.rstrip('/') or '/',
+        '',
+        urlencode(sorted(query)),
+        ''
+    ))
+
+class VideoInfoCache:
+    """Cache kết quả extract_info của yt-dlp trong bộ nhớ và (tùy chọn) trên đĩa
+
+    Link tải trong thông tin video thường có hạn dùng, nên TTL mặc định ngắn.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, ttl_seconds: float = 30 * 60,
+                 persist: bool = True):
+        self.logger = logging.getLogger(__name__)
+        
+        if cache_dir is None:
+            cache_dir = str(Path(__file__).parent.parent / 'cache' / 'video_info')
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        
+        if persist:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'VideoInfoCache':
+        """Tạo cache từ mục "video_info_cache" trong config.json"""
+        cache_config = config.get('video_info_cache', {})
+        
+        return cls(
+            cache_dir=cache_config.get('path'),
+            ttl_seconds=cache_config.get('ttl_minutes', 30) * 60,
+            persist=cache_config.get('persist', True)
+        )
+    
+    def _key(self, url: str) -> str:
+        """Key cache từ URL đã chuẩn hóa"""
+        return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+    
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        """Mục cache đã quá TTL"""
+        return time.time() - entry['cached_at'] > self.ttl_seconds
+    
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Lấy thông tin video đã cache, None nếu không có hoặc đã hết hạn"""
+        key = self._key(url)
+        
+        with self._lock:
+            entry = self._memory.get(key)
+        
+        if entry is None and self.persist:
+            path = self.cache_dir / f"{key}.json"
+            if path.exists():
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                except (ValueError, OSError) as e:
+                    self.logger.warning(f"Ignored invalid video info cache {path.name}: {str(e)}")
+                    entry = None
+                
+                if entry is not None:
+                    with self._lock:
+                        self._memory[key] = entry
+        
+        if entry is None:
+            return None
+        
+        if self._expired(entry):
+            self.invalidate(url)
+            return None
+        
+        return entry['info']
+    
+    def set(self, url: str, info: Dict[str, Any]):
+        """Lưu thông tin video (info phải là dict đã qua YoutubeDL.sanitize_info)"""
+        key = self._key(url)
+        entry = {'url': url, 'cached_at': time.time(), 'info': info}
+        
+        with self._lock:
+            self._memory[key] = entry
+        
+        if self.persist:
+            path = self.cache_dir / f"{key}.json"
+            tmp_path = path.with_suffix('.tmp')
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except (TypeError, ValueError, OSError) as e:
+                self.logger.warning(f"Could not persist video info for {url}: {str(e)}")
+    
+    def invalidate(self, url: str):
+        """Xóa thông tin của một URL"""
+        key = self._key(url)
+        
+        with self._lock:
+            self._memory.pop(key, None)
+        
+        if self.persist:
+            path = self.cache_dir / f"{key}.json"
+            if path.exists():
+                path.unlink()
+    
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._memory.clear()
+        
+        if self.persist:
+            for path in self.cache_dir.glob('*.json'):
+                path.unlink()